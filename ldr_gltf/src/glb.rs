@@ -0,0 +1,486 @@
+use std::collections::{BTreeMap, HashMap};
+
+use ldr_tools::{
+    glam::{Quat, Vec3, Vec4},
+    ColorCode, LDrawColor, LDrawGeometry, LDrawModelInstances,
+};
+use serde_json::{json, Value};
+
+// Special color code that "inherits" the existing color.
+const CURRENT_COLOR: ColorCode = 16;
+
+// The size of an LDraw unit in meters.
+const LDU_IN_METERS: f32 = 0.0004;
+
+const FLOAT: u32 = 5126;
+const UNSIGNED_INT: u32 = 5125;
+const ARRAY_BUFFER: u32 = 34962;
+const ELEMENT_ARRAY_BUFFER: u32 = 34963;
+
+const GLB_MAGIC: u32 = 0x46546C67;
+const CHUNK_JSON: u32 = 0x4E4F534A;
+const CHUNK_BIN: u32 = 0x004E4942;
+
+/// Convert the instances for a model to a binary glTF file.
+///
+/// Each geometry used by the model is written once and shared by a mesh for each color.
+/// Instances use the `EXT_mesh_gpu_instancing` extension with one node per part and color.
+pub fn write_glb(
+    model: &LDrawModelInstances,
+    geometry_cache: &HashMap<String, LDrawGeometry>,
+    color_table: &HashMap<ColorCode, LDrawColor>,
+) -> Vec<u8> {
+    let mut builder = GltfBuilder::default();
+
+    // Sort for a deterministic output.
+    let mut geometry_names: Vec<_> = model
+        .geometry_world_transforms
+        .keys()
+        .map(|(name, _)| name)
+        .collect();
+    geometry_names.sort();
+    geometry_names.dedup();
+    let geometry: HashMap<_, _> = geometry_names
+        .into_iter()
+        .filter_map(|name| Some((name, builder.add_geometry(&geometry_cache[name])?)))
+        .collect();
+
+    let mut groups: Vec<_> = model.geometry_world_transforms.iter().collect();
+    groups.sort_by(|(a, _), (b, _)| a.cmp(b));
+
+    let mut children = Vec::new();
+    for ((name, color), transforms) in groups {
+        // Skip geometry without any triangles and nodes without any instances.
+        let Some(primitives) = geometry.get(name) else {
+            continue;
+        };
+        if transforms.is_empty() {
+            continue;
+        }
+        let mesh = builder.add_mesh(primitives, *color, color_table);
+
+        let mut translations = Vec::new();
+        let mut rotations = Vec::new();
+        let mut scales = Vec::new();
+        for transform in transforms {
+            let (s, r, t) = transform.to_scale_rotation_translation();
+            translations.push(t);
+            rotations.push(Vec4::from(r));
+            scales.push(s);
+        }
+
+        let translation = builder.add_vec3s(&translations, None);
+        let rotation = builder.add_vec4s(&rotations);
+        let scale = builder.add_vec3s(&scales, None);
+
+        builder.nodes.push(json!({
+            "name": name,
+            "mesh": mesh,
+            "extensions": {
+                "EXT_mesh_gpu_instancing": {
+                    "attributes": {
+                        "TRANSLATION": translation,
+                        "ROTATION": rotation,
+                        "SCALE": scale,
+                    }
+                }
+            }
+        }));
+        children.push(builder.nodes.len() - 1);
+    }
+
+    // LDraw uses -Y up and LDraw units, and glTF uses +Y up and meters.
+    let rotation = Quat::from_rotation_x(std::f32::consts::PI).to_array();
+    let scale = [LDU_IN_METERS; 3];
+    builder.nodes.push(json!({
+        "name": model.main_model_name,
+        "rotation": rotation,
+        "scale": scale,
+        "children": children,
+    }));
+
+    let root = builder.nodes.len() - 1;
+    builder.into_glb(root)
+}
+
+/// Accessors for a geometry with faces grouped by face color.
+///
+/// Colors without any triangles are omitted since accessors can't be empty.
+struct GeometryPrimitives {
+    positions: usize,
+    normals: Option<usize>,
+    indices_by_color: Vec<(ColorCode, usize)>,
+}
+
+#[derive(Default)]
+struct GltfBuilder {
+    buffer: Vec<u8>,
+    buffer_views: Vec<Value>,
+    accessors: Vec<Value>,
+    meshes: Vec<Value>,
+    materials: Vec<Value>,
+    nodes: Vec<Value>,
+    material_indices: HashMap<ColorCode, usize>,
+}
+
+impl GltfBuilder {
+    fn add_geometry(&mut self, geometry: &LDrawGeometry) -> Option<GeometryPrimitives> {
+        // glTF only supports vertex normals, so split vertices with different corner normals.
+        let mut positions = Vec::new();
+        let mut normals = Vec::new();
+        let mut corner_vertices = HashMap::new();
+        let mut corner_vertex = |corner: usize| -> u32 {
+            let vertex_index = geometry.vertex_indices[corner];
+            let normal = geometry.corner_normals.get(corner).copied();
+            let key = (vertex_index, normal.map(|n| n.to_array().map(f32::to_bits)));
+            *corner_vertices.entry(key).or_insert_with(|| {
+                positions.push(geometry.vertices[vertex_index as usize]);
+                normals.extend(normal);
+                positions.len() as u32 - 1
+            })
+        };
+
+        let mut indices_by_color: BTreeMap<ColorCode, Vec<u32>> = BTreeMap::new();
+        for (i, (start, size)) in geometry
+            .face_start_indices
+            .iter()
+            .zip(&geometry.face_sizes)
+            .enumerate()
+        {
+            // Faces with fewer than 3 vertices don't have any triangles.
+            if *size < 3 {
+                continue;
+            }
+
+            // A single face color applies to all faces.
+            let color = geometry
+                .face_colors
+                .get(i)
+                .or(geometry.face_colors.first())
+                .copied()
+                .unwrap_or(CURRENT_COLOR);
+
+            // Triangulate any remaining quads or polygons as a fan.
+            let indices = indices_by_color.entry(color).or_default();
+            let start = *start as usize;
+            for k in 1..*size as usize - 1 {
+                indices.push(corner_vertex(start));
+                indices.push(corner_vertex(start + k));
+                indices.push(corner_vertex(start + k + 1));
+            }
+        }
+
+        if indices_by_color.is_empty() {
+            return None;
+        }
+
+        let positions = self.add_vec3s(&positions, Some(ARRAY_BUFFER));
+        let normals = (!normals.is_empty()).then(|| self.add_vec3s(&normals, Some(ARRAY_BUFFER)));
+        let indices_by_color = indices_by_color
+            .into_iter()
+            .map(|(color, indices)| (color, self.add_indices(&indices)))
+            .collect();
+
+        Some(GeometryPrimitives {
+            positions,
+            normals,
+            indices_by_color,
+        })
+    }
+
+    fn add_mesh(
+        &mut self,
+        geometry: &GeometryPrimitives,
+        current_color: ColorCode,
+        color_table: &HashMap<ColorCode, LDrawColor>,
+    ) -> usize {
+        let primitives: Vec<_> = geometry
+            .indices_by_color
+            .iter()
+            .map(|(color, indices)| {
+                let color = if *color == CURRENT_COLOR {
+                    current_color
+                } else {
+                    *color
+                };
+
+                let mut attributes = json!({ "POSITION": geometry.positions });
+                if let Some(normals) = geometry.normals {
+                    attributes["NORMAL"] = json!(normals);
+                }
+
+                json!({
+                    "attributes": attributes,
+                    "indices": indices,
+                    "material": self.material(color, color_table),
+                })
+            })
+            .collect();
+
+        self.meshes.push(json!({ "primitives": primitives }));
+        self.meshes.len() - 1
+    }
+
+    fn material(
+        &mut self,
+        color: ColorCode,
+        color_table: &HashMap<ColorCode, LDrawColor>,
+    ) -> usize {
+        if let Some(index) = self.material_indices.get(&color) {
+            return *index;
+        }
+
+        let (name, rgba, finish_name) = match color_table.get(&color) {
+            Some(c) => (c.name.clone(), c.rgba_linear, c.finish_name.as_str()),
+            None => (color.to_string(), [0.5, 0.5, 0.5, 1.0], ""),
+        };
+
+        let (metallic, roughness) = match finish_name {
+            "MatteMetallic" | "Speckle" => (1.0, 0.2),
+            "Chrome" => (1.0, 0.1),
+            "Metal" => (1.0, 0.3),
+            "Pearlescent" => (0.35, 0.5),
+            _ => (0.0, 0.2),
+        };
+
+        // Faces may have either winding for parts without BFC.
+        let mut material = json!({
+            "name": name,
+            "pbrMetallicRoughness": {
+                "baseColorFactor": rgba,
+                "metallicFactor": metallic,
+                "roughnessFactor": roughness,
+            },
+            "doubleSided": true,
+        });
+        if rgba[3] < 1.0 {
+            material["alphaMode"] = json!("BLEND");
+        }
+
+        self.materials.push(material);
+        let index = self.materials.len() - 1;
+        self.material_indices.insert(color, index);
+        index
+    }
+
+    fn add_vec3s(&mut self, values: &[Vec3], target: Option<u32>) -> usize {
+        let min = values.iter().copied().reduce(Vec3::min).unwrap_or_default();
+        let max = values.iter().copied().reduce(Vec3::max).unwrap_or_default();
+        let bytes: Vec<_> = values
+            .iter()
+            .flat_map(|v| v.to_array())
+            .flat_map(f32::to_le_bytes)
+            .collect();
+
+        let accessor = self.add_accessor(&bytes, target, FLOAT, values.len(), "VEC3");
+        // Bounds are required for positions.
+        self.accessors[accessor]["min"] = json!(min.to_array());
+        self.accessors[accessor]["max"] = json!(max.to_array());
+        accessor
+    }
+
+    fn add_vec4s(&mut self, values: &[Vec4]) -> usize {
+        let bytes: Vec<_> = values
+            .iter()
+            .flat_map(|v| v.to_array())
+            .flat_map(f32::to_le_bytes)
+            .collect();
+        self.add_accessor(&bytes, None, FLOAT, values.len(), "VEC4")
+    }
+
+    fn add_indices(&mut self, indices: &[u32]) -> usize {
+        let bytes: Vec<_> = indices.iter().flat_map(|i| i.to_le_bytes()).collect();
+        self.add_accessor(
+            &bytes,
+            Some(ELEMENT_ARRAY_BUFFER),
+            UNSIGNED_INT,
+            indices.len(),
+            "SCALAR",
+        )
+    }
+
+    fn add_accessor(
+        &mut self,
+        bytes: &[u8],
+        target: Option<u32>,
+        component_type: u32,
+        count: usize,
+        accessor_type: &str,
+    ) -> usize {
+        let mut view = json!({
+            "buffer": 0,
+            "byteOffset": self.buffer.len(),
+            "byteLength": bytes.len(),
+        });
+        if let Some(target) = target {
+            view["target"] = json!(target);
+        }
+
+        // All components are 4 bytes, so views are always aligned.
+        self.buffer.extend_from_slice(bytes);
+        self.buffer_views.push(view);
+
+        self.accessors.push(json!({
+            "bufferView": self.buffer_views.len() - 1,
+            "componentType": component_type,
+            "count": count,
+            "type": accessor_type,
+        }));
+        self.accessors.len() - 1
+    }
+
+    fn into_glb(self, root: usize) -> Vec<u8> {
+        let mut gltf = json!({
+            "asset": { "version": "2.0", "generator": "ldr_gltf" },
+            "extensionsUsed": ["EXT_mesh_gpu_instancing"],
+            "scene": 0,
+            "scenes": [{ "nodes": [root] }],
+            "nodes": self.nodes,
+            "meshes": self.meshes,
+            "materials": self.materials,
+            "accessors": self.accessors,
+            "bufferViews": self.buffer_views,
+        });
+        // Buffers can't be empty.
+        if !self.buffer.is_empty() {
+            gltf["buffers"] = json!([{ "byteLength": self.buffer.len() }]);
+        }
+
+        let mut json = serde_json::to_vec(&gltf).unwrap();
+        pad(&mut json, b' ');
+        let mut bin = self.buffer;
+        pad(&mut bin, 0);
+
+        let mut chunks = vec![(CHUNK_JSON, json)];
+        if !bin.is_empty() {
+            chunks.push((CHUNK_BIN, bin));
+        }
+
+        let length = 12 + chunks.iter().map(|(_, c)| 8 + c.len()).sum::<usize>();
+        let mut glb = Vec::with_capacity(length);
+        glb.extend_from_slice(&GLB_MAGIC.to_le_bytes());
+        glb.extend_from_slice(&2u32.to_le_bytes());
+        glb.extend_from_slice(&(length as u32).to_le_bytes());
+        for (chunk_type, data) in chunks {
+            glb.extend_from_slice(&(data.len() as u32).to_le_bytes());
+            glb.extend_from_slice(&chunk_type.to_le_bytes());
+            glb.extend_from_slice(&data);
+        }
+        glb
+    }
+}
+
+fn pad(bytes: &mut Vec<u8>, value: u8) {
+    // GLB chunks must be aligned to 4 bytes.
+    bytes.resize(bytes.len().div_ceil(4) * 4, value);
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use ldr_tools::glam::{vec3, Mat4};
+
+    fn geometry() -> LDrawGeometry {
+        LDrawGeometry {
+            vertices: vec![Vec3::ZERO, Vec3::X, Vec3::Y, Vec3::ONE],
+            vertex_indices: vec![0, 1, 3, 2],
+            face_start_indices: vec![0],
+            face_sizes: vec![4],
+            face_colors: vec![16],
+            is_face_stud: vec![false],
+            corner_normals: vec![Vec3::Z; 4],
+            ..Default::default()
+        }
+    }
+
+    fn read_json(glb: &[u8]) -> Value {
+        let length = u32::from_le_bytes(glb[12..16].try_into().unwrap()) as usize;
+        serde_json::from_slice(&glb[20..20 + length]).unwrap()
+    }
+
+    #[test]
+    fn write_glb_instancing() {
+        let model = LDrawModelInstances {
+            main_model_name: "main.ldr".to_string(),
+            geometry_world_transforms: [
+                (
+                    ("a.dat".to_string(), 4),
+                    vec![Mat4::IDENTITY, Mat4::from_translation(vec3(1.0, 2.0, 3.0))],
+                ),
+                (("a.dat".to_string(), 1), vec![Mat4::IDENTITY]),
+            ]
+            .into(),
+        };
+        let geometry_cache = [
+            ("a.dat".to_string(), geometry()),
+            ("unused.dat".to_string(), geometry()),
+        ]
+        .into();
+
+        let glb = write_glb(&model, &geometry_cache, &HashMap::new());
+        assert_eq!(GLB_MAGIC.to_le_bytes(), glb[0..4]);
+        assert_eq!(
+            glb.len() as u32,
+            u32::from_le_bytes(glb[8..12].try_into().unwrap())
+        );
+        assert_eq!(0, glb.len() % 4);
+
+        let gltf = read_json(&glb);
+        // Only geometry used by the model is written.
+        // Each node also has accessors for translation, rotation, and scale.
+        assert_eq!(3 + 2 * 3, gltf["accessors"].as_array().unwrap().len());
+
+        // Both colors share the same vertex data.
+        assert_eq!(2, gltf["meshes"].as_array().unwrap().len());
+        assert_eq!(
+            gltf["meshes"][0]["primitives"][0]["attributes"],
+            gltf["meshes"][1]["primitives"][0]["attributes"]
+        );
+        assert_eq!(2, gltf["materials"].as_array().unwrap().len());
+        assert_eq!(3, gltf["nodes"].as_array().unwrap().len());
+        assert_eq!(json!([0, 1]), gltf["nodes"][2]["children"]);
+
+        // The quad is split into two triangles.
+        let indices = gltf["meshes"][0]["primitives"][0]["indices"]
+            .as_u64()
+            .unwrap();
+        assert_eq!(json!(6), gltf["accessors"][indices as usize]["count"]);
+
+        let translation = gltf["nodes"][1]["extensions"]["EXT_mesh_gpu_instancing"]["attributes"]
+            ["TRANSLATION"]
+            .as_u64()
+            .unwrap();
+        assert_eq!(json!(2), gltf["accessors"][translation as usize]["count"]);
+    }
+
+    #[test]
+    fn write_glb_skip_empty() {
+        let model = LDrawModelInstances {
+            main_model_name: "main.ldr".to_string(),
+            geometry_world_transforms: [
+                (("a.dat".to_string(), 4), Vec::new()),
+                (("empty.dat".to_string(), 4), vec![Mat4::IDENTITY]),
+            ]
+            .into(),
+        };
+        let empty = LDrawGeometry {
+            face_sizes: vec![2],
+            ..geometry()
+        };
+        let geometry_cache = [
+            ("a.dat".to_string(), geometry()),
+            ("empty.dat".to_string(), empty),
+        ]
+        .into();
+
+        let gltf = read_json(&write_glb(&model, &geometry_cache, &HashMap::new()));
+
+        // Only accessors for the used geometry are written, and none are empty.
+        let accessors = gltf["accessors"].as_array().unwrap();
+        assert_eq!(3, accessors.len());
+        assert!(accessors.iter().all(|a| a["count"].as_u64().unwrap() > 0));
+        assert!(gltf["meshes"].as_array().unwrap().is_empty());
+        assert_eq!(1, gltf["nodes"].as_array().unwrap().len());
+    }
+}
@@ -0,0 +1,201 @@
+use std::{
+    collections::HashMap,
+    panic::AssertUnwindSafe,
+    path::{Component, Path, PathBuf},
+};
+
+use ldr_tools::{ColorCode, GeometrySettings, LDrawBatchInstanced, LDrawColor};
+use rayon::prelude::*;
+
+mod glb;
+
+// Limit the number of models loaded at once to limit memory usage.
+const BATCH_SIZE: usize = 32;
+
+fn main() {
+    let args: Vec<_> = std::env::args().collect();
+    if args.len() < 4 {
+        eprintln!("Usage: ldr_gltf <ldraw library> <output folder> <input files>...");
+        std::process::exit(1);
+    }
+    let ldraw_path = &args[1];
+    let output_folder = Path::new(&args[2]);
+    let inputs: Vec<_> = args[3..].iter().map(|s| s.as_str()).collect();
+    let outputs = output_paths(&inputs, output_folder);
+
+    std::fs::create_dir_all(output_folder).unwrap();
+
+    let start = std::time::Instant::now();
+
+    let color_table = ldr_tools::load_color_table(ldraw_path);
+
+    let settings = GeometrySettings {
+        triangulate: true,
+        weld_vertices: true,
+        corner_normals: true,
+        remove_degenerate_faces: true,
+        deduplicate_geometry: true,
+        ..Default::default()
+    };
+
+    let mut failed_count = 0;
+    for (batch_inputs, batch_outputs) in inputs.chunks(BATCH_SIZE).zip(outputs.chunks(BATCH_SIZE)) {
+        // Models in a batch share parsed files and part geometry.
+        match load_batch(batch_inputs, ldraw_path, &settings) {
+            Some(batch) => {
+                failed_count += write_batch(batch_inputs, batch_outputs, &batch, &color_table);
+            }
+            None => {
+                // Find the files that failed by loading each file separately.
+                for (input, output) in batch_inputs.iter().zip(batch_outputs) {
+                    match load_batch(&[*input], ldraw_path, &settings) {
+                        Some(batch) => {
+                            failed_count += write_batch(
+                                &[*input],
+                                std::slice::from_ref(output),
+                                &batch,
+                                &color_table,
+                            );
+                        }
+                        None => {
+                            eprintln!("Error converting {input:?}");
+                            failed_count += 1;
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    println!(
+        "Converted {} of {} files in {:?}",
+        inputs.len() - failed_count,
+        inputs.len(),
+        start.elapsed()
+    );
+
+    if failed_count > 0 {
+        std::process::exit(1);
+    }
+}
+
+fn load_batch(
+    inputs: &[&str],
+    ldraw_path: &str,
+    settings: &GeometrySettings,
+) -> Option<LDrawBatchInstanced> {
+    // Loading panics on invalid files, so catch panics to convert the remaining files.
+    std::panic::catch_unwind(AssertUnwindSafe(|| {
+        ldr_tools::load_files_instanced(inputs, ldraw_path, &[], settings)
+    }))
+    .ok()
+}
+
+/// Write each model in parallel and return the number of failed files.
+fn write_batch(
+    inputs: &[&str],
+    outputs: &[PathBuf],
+    batch: &LDrawBatchInstanced,
+    color_table: &HashMap<ColorCode, LDrawColor>,
+) -> usize {
+    inputs
+        .par_iter()
+        .zip(outputs)
+        .zip(&batch.models)
+        .filter(|((input, output), model)| {
+            let glb = glb::write_glb(model, &batch.geometry_cache, color_table);
+            let result = output
+                .parent()
+                .map_or(Ok(()), std::fs::create_dir_all)
+                .and_then(|_| std::fs::write(output, glb));
+            match result {
+                Ok(()) => {
+                    println!("Converted {input:?} to {output:?}");
+                    false
+                }
+                Err(e) => {
+                    eprintln!("Error writing {output:?}: {e}");
+                    true
+                }
+            }
+        })
+        .count()
+}
+
+/// Find the output file for each input.
+///
+/// Folders after the common parent folder of the inputs are kept
+/// to avoid overwriting outputs for inputs with the same name.
+fn output_paths(inputs: &[&str], output_folder: &Path) -> Vec<PathBuf> {
+    let folders: Vec<Vec<_>> = inputs
+        .iter()
+        .map(|input| {
+            Path::new(input)
+                .parent()
+                .map(|p| p.components().collect())
+                .unwrap_or_default()
+        })
+        .collect();
+
+    let min_len = folders.iter().map(Vec::len).min().unwrap_or_default();
+    let common_len = (0..min_len)
+        .take_while(|i| folders.iter().all(|f| f[*i] == folders[0][*i]))
+        .count();
+
+    inputs
+        .iter()
+        .zip(&folders)
+        .map(|(input, folder)| {
+            // Ignore roots and parent folders to stay in the output folder.
+            let mut output = output_folder.to_path_buf();
+            output.extend(
+                folder[common_len..]
+                    .iter()
+                    .filter(|c| matches!(c, Component::Normal(_))),
+            );
+
+            // Keep the extension to not overwrite models like "a.ldr" and "a.mpd".
+            let name = Path::new(input).file_name().unwrap_or_default();
+            output.join(format!("{}.glb", name.to_string_lossy()))
+        })
+        .collect()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn output_paths_same_folder() {
+        assert_eq!(
+            vec![
+                PathBuf::from("out/a.ldr.glb"),
+                PathBuf::from("out/b.mpd.glb")
+            ],
+            output_paths(&["models/a.ldr", "models/b.mpd"], Path::new("out"))
+        );
+    }
+
+    #[test]
+    fn output_paths_same_name() {
+        assert_eq!(
+            vec![
+                PathBuf::from("out/a/model.ldr.glb"),
+                PathBuf::from("out/b/c/model.io.glb"),
+                PathBuf::from("out/model.mpd.glb"),
+                PathBuf::from("out/model.ldr.glb"),
+                PathBuf::from("out/model.io.glb")
+            ],
+            output_paths(
+                &[
+                    "/models/a/model.ldr",
+                    "/models/b/c/model.io",
+                    "/models/model.mpd",
+                    "/models/model.ldr",
+                    "/models/model.io"
+                ],
+                Path::new("out")
+            )
+        );
+    }
+}
@@ -0,0 +1,118 @@
+use std::collections::HashMap;
+
+use glam::{Mat4, Vec3};
+use weldr::Command;
+
+/// An axis aligned bounding box.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub struct Bounds {
+    pub min: Vec3,
+    pub max: Vec3,
+}
+
+impl Bounds {
+    pub fn new(min: Vec3, max: Vec3) -> Self {
+        Self { min, max }
+    }
+
+    pub fn from_points(points: impl IntoIterator<Item = Vec3>) -> Option<Self> {
+        let mut points = points.into_iter();
+        let first = points.next()?;
+        Some(points.fold(Self::new(first, first), |b, p| {
+            Self::new(b.min.min(p), b.max.max(p))
+        }))
+    }
+
+    pub fn union(&self, other: &Self) -> Self {
+        Self::new(self.min.min(other.min), self.max.max(other.max))
+    }
+
+    pub fn corners(&self) -> [Vec3; 8] {
+        let Self { min, max } = *self;
+        [
+            Vec3::new(min.x, min.y, min.z),
+            Vec3::new(max.x, min.y, min.z),
+            Vec3::new(min.x, max.y, min.z),
+            Vec3::new(max.x, max.y, min.z),
+            Vec3::new(min.x, min.y, max.z),
+            Vec3::new(max.x, min.y, max.z),
+            Vec3::new(min.x, max.y, max.z),
+            Vec3::new(max.x, max.y, max.z),
+        ]
+    }
+
+    /// The bounds containing the transformed corners of these bounds.
+    pub fn transform(&self, transform: &Mat4) -> Self {
+        // There are always 8 corners.
+        Self::from_points(self.corners().map(|c| transform.transform_point3(c))).unwrap()
+    }
+
+    pub fn intersects(&self, other: &Self) -> bool {
+        self.min.cmple(other.max).all() && other.min.cmple(self.max).all()
+    }
+}
+
+/// Calculate the bounds of the faces in a file and its subfiles in the file's coordinate space.
+/// This is much cheaper than creating the geometry since vertices don't need to be welded.
+///
+/// The cache stores the bounds for each lowercase file name.
+pub fn file_bounds(
+    source_file: &weldr::SourceFile,
+    name: &str,
+    source_map: &weldr::SourceMap,
+    cache: &mut HashMap<String, Option<Bounds>>,
+) -> Option<Bounds> {
+    if let Some(bounds) = cache.get(name) {
+        return *bounds;
+    }
+
+    let mut bounds: Option<Bounds> = None;
+    let mut add_bounds = |b: Bounds| {
+        bounds = Some(bounds.map_or(b, |bounds| bounds.union(&b)));
+    };
+
+    for cmd in &source_file.cmds {
+        match cmd {
+            Command::Triangle(t) => add_bounds(Bounds::from_points(t.vertices).unwrap()),
+            Command::Quad(q) => add_bounds(Bounds::from_points(q.vertices).unwrap()),
+            Command::SubFileRef(sfr_cmd) => {
+                if let Some(subfile) = source_map.get(&sfr_cmd.file) {
+                    let child_name = sfr_cmd.file.to_lowercase();
+                    if let Some(b) = file_bounds(subfile, &child_name, source_map, cache) {
+                        add_bounds(b.transform(&sfr_cmd.matrix()));
+                    }
+                }
+            }
+            _ => (),
+        }
+    }
+
+    cache.insert(name.to_string(), bounds);
+    bounds
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use glam::vec3;
+
+    #[test]
+    fn bounds_transform() {
+        let bounds = Bounds::new(vec3(-1.0, 0.0, 0.0), vec3(1.0, 2.0, 3.0));
+        let transform = Mat4::from_translation(vec3(10.0, 0.0, 0.0))
+            * Mat4::from_rotation_z(std::f32::consts::FRAC_PI_2);
+
+        let transformed = bounds.transform(&transform);
+        assert!(transformed.min.abs_diff_eq(vec3(8.0, -1.0, 0.0), 0.0001));
+        assert!(transformed.max.abs_diff_eq(vec3(10.0, 1.0, 3.0), 0.0001));
+    }
+
+    #[test]
+    fn bounds_intersects() {
+        let a = Bounds::new(Vec3::ZERO, Vec3::ONE);
+        assert!(a.intersects(&Bounds::new(Vec3::splat(0.5), Vec3::splat(2.0))));
+        assert!(a.intersects(&Bounds::new(Vec3::ONE, Vec3::splat(2.0))));
+        assert!(!a.intersects(&Bounds::new(Vec3::splat(1.5), Vec3::splat(2.0))));
+    }
+}
@@ -0,0 +1,225 @@
+use glam::{Mat4, Vec3, Vec4};
+use rstar::{
+    primitives::{GeomWithData, Rectangle},
+    RTree, RTreeObject, SelectionFunction, AABB,
+};
+
+use crate::{bounds::Bounds, LDrawScenePacked};
+
+type InstanceBounds = GeomWithData<Rectangle<[f32; 3]>, u32>;
+
+/// A bounding volume hierarchy of the world space bounds for each instance.
+///
+/// Query results are indices into [transforms](struct.LDrawScenePacked.html#structfield.transforms).
+pub struct InstanceBvh {
+    rtree: RTree<InstanceBounds>,
+}
+
+impl InstanceBvh {
+    /// Build the hierarchy from the transformed geometry bounds of each instance.
+    #[tracing::instrument(skip_all)]
+    pub fn new(scene: &LDrawScenePacked) -> Self {
+        let mut instances = Vec::with_capacity(scene.transforms.len());
+        for (id, [start, count]) in scene
+            .group_geometry_ids
+            .iter()
+            .zip(&scene.group_transform_ranges)
+        {
+            let local = Bounds::new(
+                scene.geometry_min[*id as usize],
+                scene.geometry_max[*id as usize],
+            );
+            for i in *start..*start + *count {
+                let world = local.transform(&scene.transforms[i as usize]);
+                instances.push(GeomWithData::new(
+                    Rectangle::from_corners(world.min.to_array(), world.max.to_array()),
+                    i,
+                ));
+            }
+        }
+
+        // Bulk loading creates a better tree than inserting one instance at a time.
+        Self {
+            rtree: RTree::bulk_load(instances),
+        }
+    }
+
+    /// The instances with bounds intersecting the box from `min` to `max`.
+    pub fn query_box(&self, min: Vec3, max: Vec3) -> Vec<u32> {
+        let envelope = AABB::from_corners(min.to_array(), max.to_array());
+        let mut indices: Vec<_> = self
+            .rtree
+            .locate_in_envelope_intersecting(&envelope)
+            .map(|i| i.data)
+            .collect();
+        indices.sort_unstable();
+        indices
+    }
+
+    /// The instances with bounds intersecting the view frustum of the combined
+    /// projection and view matrix `view_projection` with OpenGL clip space conventions.
+    /// Some instances near the corners of the frustum may be included conservatively.
+    pub fn query_frustum(&self, view_projection: Mat4) -> Vec<u32> {
+        let mut indices: Vec<_> = self
+            .rtree
+            .locate_with_selection_function(SelectFrustum {
+                planes: frustum_planes(view_projection),
+            })
+            .map(|i| i.data)
+            .collect();
+        indices.sort_unstable();
+        indices
+    }
+
+    /// The first instance hit by each ray and the distance along the ray to its bounds
+    /// or `None` if the ray misses all instances.
+    pub fn query_rays(&self, origins: &[Vec3], directions: &[Vec3]) -> Vec<Option<(u32, f32)>> {
+        origins
+            .iter()
+            .zip(directions)
+            .map(|(origin, direction)| {
+                let inv_direction = direction.recip();
+                self.rtree
+                    .locate_with_selection_function(SelectRay {
+                        origin: *origin,
+                        inv_direction,
+                    })
+                    .filter_map(|i| {
+                        let t = ray_aabb_distance(*origin, inv_direction, &i.geom().envelope())?;
+                        Some((i.data, t))
+                    })
+                    .min_by(|(_, a), (_, b)| a.total_cmp(b))
+            })
+            .collect()
+    }
+
+    /// The instance with bounds closest to each point or `None` if there are no instances.
+    pub fn query_nearest(&self, points: &[Vec3]) -> Vec<Option<u32>> {
+        points
+            .iter()
+            .map(|p| self.rtree.nearest_neighbor(&p.to_array()).map(|i| i.data))
+            .collect()
+    }
+}
+
+struct SelectFrustum {
+    planes: [Vec4; 6],
+}
+
+impl SelectionFunction<InstanceBounds> for SelectFrustum {
+    fn should_unpack_parent(&self, envelope: &AABB<[f32; 3]>) -> bool {
+        aabb_in_frustum(&self.planes, envelope)
+    }
+
+    fn should_unpack_leaf(&self, leaf: &InstanceBounds) -> bool {
+        aabb_in_frustum(&self.planes, &leaf.geom().envelope())
+    }
+}
+
+struct SelectRay {
+    origin: Vec3,
+    inv_direction: Vec3,
+}
+
+impl SelectionFunction<InstanceBounds> for SelectRay {
+    fn should_unpack_parent(&self, envelope: &AABB<[f32; 3]>) -> bool {
+        ray_aabb_distance(self.origin, self.inv_direction, envelope).is_some()
+    }
+}
+
+/// Planes as `(normal, distance)` facing inward for the clip space of `view_projection`.
+fn frustum_planes(view_projection: Mat4) -> [Vec4; 6] {
+    let [r0, r1, r2, r3] = [0, 1, 2, 3].map(|i| view_projection.row(i));
+    [r3 + r0, r3 - r0, r3 + r1, r3 - r1, r3 + r2, r3 - r2]
+}
+
+fn aabb_in_frustum(planes: &[Vec4; 6], aabb: &AABB<[f32; 3]>) -> bool {
+    let min = Vec3::from(aabb.lower());
+    let max = Vec3::from(aabb.upper());
+    planes.iter().all(|plane| {
+        // The box is outside if the corner furthest along the normal is outside.
+        let normal = plane.truncate();
+        let corner = Vec3::select(normal.cmpge(Vec3::ZERO), max, min);
+        normal.dot(corner) + plane.w >= 0.0
+    })
+}
+
+/// The distance along the ray to the box using the slab method
+/// or `None` if the ray does not intersect the box.
+fn ray_aabb_distance(origin: Vec3, inv_direction: Vec3, aabb: &AABB<[f32; 3]>) -> Option<f32> {
+    let t1 = (Vec3::from(aabb.lower()) - origin) * inv_direction;
+    let t2 = (Vec3::from(aabb.upper()) - origin) * inv_direction;
+    let t_min = t1.min(t2).max_element().max(0.0);
+    let t_max = t1.max(t2).min_element();
+    (t_min <= t_max).then_some(t_min)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use glam::vec3;
+
+    fn scene(transforms: Vec<Mat4>) -> LDrawScenePacked {
+        LDrawScenePacked {
+            geometry_names: vec!["a.dat".to_string()],
+            has_grainy_slopes: vec![false],
+            geometry_min: vec![Vec3::splat(-1.0)],
+            geometry_max: vec![Vec3::splat(1.0)],
+            group_geometry_ids: vec![0],
+            group_colors: vec![16],
+            group_transform_ranges: vec![[0, transforms.len() as u32]],
+            transforms,
+            ..Default::default()
+        }
+    }
+
+    fn bvh() -> InstanceBvh {
+        InstanceBvh::new(&scene(vec![
+            Mat4::IDENTITY,
+            Mat4::from_translation(vec3(10.0, 0.0, 0.0)),
+            Mat4::from_translation(vec3(20.0, 0.0, 0.0)),
+        ]))
+    }
+
+    #[test]
+    fn query_box_instances() {
+        let bvh = bvh();
+        assert_eq!(
+            vec![0, 1],
+            bvh.query_box(vec3(0.0, 0.0, 0.0), vec3(9.5, 1.0, 1.0))
+        );
+        assert!(bvh
+            .query_box(vec3(2.0, 2.0, 2.0), vec3(3.0, 3.0, 3.0))
+            .is_empty());
+    }
+
+    #[test]
+    fn query_frustum_instances() {
+        // An orthographic camera looking down -Z containing only the first two instances.
+        let view_projection = Mat4::orthographic_rh_gl(-2.0, 12.0, -2.0, 2.0, 0.1, 100.0)
+            * Mat4::from_translation(vec3(0.0, 0.0, -10.0));
+        assert_eq!(vec![0, 1], bvh().query_frustum(view_projection));
+    }
+
+    #[test]
+    fn query_rays_instances() {
+        let hits = bvh().query_rays(
+            &[
+                vec3(-5.0, 0.0, 0.0),
+                vec3(25.0, 0.0, 0.0),
+                vec3(0.0, 5.0, 0.0),
+            ],
+            &[Vec3::X, -Vec3::X, Vec3::X],
+        );
+        assert_eq!(vec![Some((0, 4.0)), Some((2, 4.0)), None], hits);
+    }
+
+    #[test]
+    fn query_nearest_instances() {
+        assert_eq!(
+            vec![Some(1), Some(2)],
+            bvh().query_nearest(&[vec3(12.0, 0.0, 0.0), vec3(100.0, 0.0, 0.0)])
+        );
+    }
+}
@@ -0,0 +1,309 @@
+use std::{
+    collections::{hash_map::DefaultHasher, HashMap},
+    hash::{Hash, Hasher},
+};
+
+use glam::{Mat4, Vec2, Vec3};
+
+use crate::{
+    ColorCode, DeduplicationReport, LDrawGeometry, LDrawNode, LDrawStudLogoInfo, LDrawTextureInfo,
+};
+
+/// Remove geometry with the same data as another geometry in the cache.
+/// Returns the canonical name in the cache for each removed name
+/// and the size of the removed geometry.
+///
+/// Aliases and copies of MPD submodels under different names
+/// often produce identical geometry.
+#[tracing::instrument(skip_all)]
+pub fn deduplicate_geometry(
+    geometry_cache: &mut HashMap<String, LDrawGeometry>,
+) -> DeduplicationReport {
+    // Sort names so the canonical name doesn't depend on the hash map order.
+    let mut names: Vec<_> = geometry_cache.keys().cloned().collect();
+    names.sort();
+
+    let mut names_by_hash: HashMap<u64, Vec<String>> = HashMap::new();
+    let mut canonical_names = HashMap::new();
+    for name in names {
+        let geometry = &geometry_cache[&name];
+        let candidates = names_by_hash.entry(geometry_hash(geometry)).or_default();
+
+        // Compare the full data to handle hash collisions.
+        match candidates.iter().find(|c| geometry_cache[*c] == *geometry) {
+            Some(canonical) => {
+                canonical_names.insert(name, canonical.clone());
+            }
+            None => candidates.push(name),
+        }
+    }
+
+    let saved_geometry_bytes = canonical_names
+        .keys()
+        .filter_map(|name| geometry_cache.remove(name))
+        .map(|geometry| geometry.size_in_bytes())
+        .sum();
+
+    DeduplicationReport {
+        canonical_names,
+        saved_geometry_bytes,
+    }
+}
+
+/// Move the texture images for all geometry to a single list without duplicates.
+/// Returns the unique images referenced by each geometry's
+/// [texture_ids](struct.LDrawTextureInfo.html#structfield.texture_ids)
+/// and adds the removed images to `deduplication`.
+///
+/// Printed parts often share the same image, so this avoids
+/// creating a separate image for each part in applications.
+#[tracing::instrument(skip_all)]
+pub fn deduplicate_textures(
+    geometry_cache: &mut HashMap<String, LDrawGeometry>,
+    deduplication: &mut DeduplicationReport,
+) -> Vec<Vec<u8>> {
+    // Sort names so the texture ids don't depend on the hash map order.
+    let mut names: Vec<_> = geometry_cache.keys().cloned().collect();
+    names.sort();
+
+    // Use the image data as the key to compare the full contents.
+    let mut texture_ids: HashMap<Vec<u8>, u32> = HashMap::new();
+    for name in names {
+        let geometry = geometry_cache.get_mut(&name).unwrap();
+        if let Some(texture_info) = &mut geometry.texture_info {
+            for image in std::mem::take(&mut texture_info.textures) {
+                let id = match texture_ids.get(&image) {
+                    Some(id) => {
+                        deduplication.merged_texture_count += 1;
+                        deduplication.saved_texture_bytes += image.len();
+                        *id
+                    }
+                    None => {
+                        let id = texture_ids.len() as u32;
+                        texture_ids.insert(image, id);
+                        id
+                    }
+                };
+                texture_info.texture_ids.push(id);
+            }
+        }
+    }
+
+    let mut textures = vec![Vec::new(); texture_ids.len()];
+    for (image, id) in texture_ids {
+        textures[id as usize] = image;
+    }
+    textures
+}
+
+/// Update node geometry names to use the names returned by [deduplicate_geometry].
+pub fn rename_node_geometry(node: &mut LDrawNode, canonical_names: &HashMap<String, String>) {
+    if let Some(name) = &mut node.geometry_name {
+        if let Some(canonical) = canonical_names.get(name) {
+            *name = canonical.clone();
+        }
+    }
+
+    for child in &mut node.children {
+        rename_node_geometry(child, canonical_names);
+    }
+}
+
+/// Combine the instances for geometry names returned by [deduplicate_geometry].
+pub fn rename_instance_geometry(
+    geometry_world_transforms: HashMap<(String, ColorCode), Vec<Mat4>>,
+    canonical_names: &HashMap<String, String>,
+) -> HashMap<(String, ColorCode), Vec<Mat4>> {
+    if canonical_names.is_empty() {
+        return geometry_world_transforms;
+    }
+
+    // Sort to combine the transforms in a consistent order.
+    let mut instances: Vec<_> = geometry_world_transforms.into_iter().collect();
+    instances.sort_by(|(a, _), (b, _)| a.cmp(b));
+
+    let mut renamed: HashMap<_, Vec<_>> = HashMap::new();
+    for ((name, color), transforms) in instances {
+        let name = canonical_names.get(&name).cloned().unwrap_or(name);
+        renamed.entry((name, color)).or_default().extend(transforms);
+    }
+    renamed
+}
+
+fn geometry_hash(geometry: &LDrawGeometry) -> u64 {
+    // Destructure to not miss any fields added later.
+    let LDrawGeometry {
+        vertices,
+        vertex_indices,
+        face_start_indices,
+        face_sizes,
+        face_colors,
+        is_face_stud,
+        edge_line_indices,
+        corner_normals,
+        is_corner_edge_sharp,
+        edges,
+        corner_edges,
+        has_grainy_slopes,
+        is_face_grainy,
+        texture_info,
+        stud_logo_info,
+    } = geometry;
+
+    let mut hasher = DefaultHasher::new();
+    hash_vec3s(vertices, &mut hasher);
+    vertex_indices.hash(&mut hasher);
+    face_start_indices.hash(&mut hasher);
+    face_sizes.hash(&mut hasher);
+    face_colors.hash(&mut hasher);
+    is_face_stud.hash(&mut hasher);
+    edge_line_indices.hash(&mut hasher);
+    hash_vec3s(corner_normals, &mut hasher);
+    is_corner_edge_sharp.hash(&mut hasher);
+    edges.hash(&mut hasher);
+    corner_edges.hash(&mut hasher);
+    has_grainy_slopes.hash(&mut hasher);
+    is_face_grainy.hash(&mut hasher);
+    if let Some(LDrawTextureInfo {
+        textures,
+        texture_ids,
+        indices,
+        uvs,
+    }) = texture_info
+    {
+        textures.hash(&mut hasher);
+        texture_ids.hash(&mut hasher);
+        indices.hash(&mut hasher);
+        hash_vec2s(uvs, &mut hasher);
+    }
+    if let Some(LDrawStudLogoInfo {
+        is_face_stud_top,
+        uvs,
+    }) = stud_logo_info
+    {
+        is_face_stud_top.hash(&mut hasher);
+        hash_vec2s(uvs, &mut hasher);
+    }
+    hasher.finish()
+}
+
+fn hash_vec3s(values: &[Vec3], hasher: &mut impl Hasher) {
+    // Floats don't implement Hash, so hash the bits instead.
+    values.len().hash(hasher);
+    for v in values {
+        v.to_array().map(f32::to_bits).hash(hasher);
+    }
+}
+
+fn hash_vec2s(values: &[Vec2], hasher: &mut impl Hasher) {
+    values.len().hash(hasher);
+    for v in values {
+        v.to_array().map(f32::to_bits).hash(hasher);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use glam::vec3;
+
+    fn geometry(vertices: Vec<Vec3>) -> LDrawGeometry {
+        LDrawGeometry {
+            vertices,
+            vertex_indices: vec![0, 1, 2],
+            face_start_indices: vec![0],
+            face_sizes: vec![3],
+            face_colors: vec![16],
+            is_face_stud: vec![false],
+            ..Default::default()
+        }
+    }
+
+    #[test]
+    fn deduplicate_geometry_aliases() {
+        let a = vec![Vec3::ZERO, Vec3::X, Vec3::Y];
+        let b = vec![Vec3::ZERO, Vec3::X, Vec3::Z];
+        let mut geometry_cache = [
+            ("c.ldr".to_string(), geometry(a.clone())),
+            ("a.dat".to_string(), geometry(a.clone())),
+            ("b.dat".to_string(), geometry(b.clone())),
+            ("d.dat".to_string(), geometry(a.clone())),
+        ]
+        .into();
+
+        let deduplication = deduplicate_geometry(&mut geometry_cache);
+
+        assert_eq!(
+            HashMap::from([
+                ("c.ldr".to_string(), "a.dat".to_string()),
+                ("d.dat".to_string(), "a.dat".to_string()),
+            ]),
+            deduplication.canonical_names
+        );
+        assert_eq!(2, deduplication.merged_geometry_count());
+        assert_eq!(
+            2 * geometry(a.clone()).size_in_bytes(),
+            deduplication.saved_geometry_bytes
+        );
+        assert_eq!(
+            HashMap::from([
+                ("a.dat".to_string(), geometry(a)),
+                ("b.dat".to_string(), geometry(b)),
+            ]),
+            geometry_cache
+        );
+    }
+
+    #[test]
+    fn deduplicate_textures_shared_images() {
+        let textured = |textures: Vec<Vec<u8>>| {
+            let mut geometry = geometry(vec![Vec3::ZERO, Vec3::X, Vec3::Y]);
+            geometry.texture_info = Some(LDrawTextureInfo {
+                textures,
+                texture_ids: Vec::new(),
+                indices: vec![0],
+                uvs: vec![Vec2::ZERO; 3],
+            });
+            geometry
+        };
+        let mut geometry_cache: HashMap<_, _> = [
+            ("b.dat".to_string(), textured(vec![vec![2], vec![1]])),
+            ("a.dat".to_string(), textured(vec![vec![1]])),
+            ("c.dat".to_string(), geometry(Vec::new())),
+        ]
+        .into();
+
+        let mut deduplication = DeduplicationReport::default();
+        let textures = deduplicate_textures(&mut geometry_cache, &mut deduplication);
+
+        assert_eq!(vec![vec![1], vec![2]], textures);
+        assert_eq!(1, deduplication.merged_texture_count);
+        assert_eq!(1, deduplication.saved_texture_bytes);
+        let texture_info = |name: &str| geometry_cache[name].texture_info.as_ref().unwrap();
+        assert_eq!(vec![0], texture_info("a.dat").texture_ids);
+        assert_eq!(vec![1, 0], texture_info("b.dat").texture_ids);
+        assert!(texture_info("b.dat").textures.is_empty());
+        assert!(geometry_cache["c.dat"].texture_info.is_none());
+    }
+
+    #[test]
+    fn rename_instance_geometry_merge() {
+        let t = Mat4::from_translation(vec3(1.0, 2.0, 3.0));
+        let instances = [
+            (("a.dat".to_string(), 4), vec![Mat4::IDENTITY]),
+            (("c.dat".to_string(), 4), vec![t]),
+            (("c.dat".to_string(), 1), vec![t]),
+        ]
+        .into();
+        let canonical_names = [("c.dat".to_string(), "a.dat".to_string())].into();
+
+        assert_eq!(
+            HashMap::from([
+                (("a.dat".to_string(), 4), vec![Mat4::IDENTITY, t]),
+                (("a.dat".to_string(), 1), vec![t]),
+            ]),
+            rename_instance_geometry(instances, &canonical_names)
+        );
+    }
+}
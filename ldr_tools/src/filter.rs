@@ -0,0 +1,69 @@
+use weldr::Command;
+
+use crate::LoadFilter;
+
+/// Returns `true` if the file or one of its ancestors is in the filter's submodel names.
+pub fn is_included(filter: &LoadFilter, name: &str, parent_included: bool) -> bool {
+    parent_included
+        || filter.submodel_names.is_empty()
+        || filter
+            .submodel_names
+            .iter()
+            .any(|n| n.eq_ignore_ascii_case(name))
+}
+
+/// The commands in the steps in `step_range` or all commands if `step_range` is `None`.
+/// Steps are separated by `0 STEP` or `0 ROTSTEP` and start from 1.
+pub fn step_commands(cmds: &[Command], step_range: Option<[u32; 2]>) -> Vec<&Command> {
+    let mut step = 1;
+    cmds.iter()
+        .filter(|cmd| {
+            if let Command::Comment(c) = cmd {
+                if matches!(c.text.split_whitespace().next(), Some("STEP" | "ROTSTEP")) {
+                    step += 1;
+                    return false;
+                }
+            }
+            step_range.map_or(true, |[first, last]| (first..=last).contains(&step))
+        })
+        .collect()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn is_included_names() {
+        let filter = LoadFilter {
+            submodel_names: vec!["Module.ldr".to_string()],
+            ..Default::default()
+        };
+        assert!(is_included(&filter, "module.ldr", false));
+        assert!(is_included(&filter, "other.ldr", true));
+        assert!(!is_included(&filter, "other.ldr", false));
+        assert!(is_included(&LoadFilter::default(), "other.ldr", false));
+    }
+
+    #[test]
+    fn step_commands_range() {
+        let cmds = weldr::parse_raw(
+            b"1 16 0 0 0 1 0 0 0 1 0 0 0 1 a.dat\n0 STEP\n1 16 0 0 0 1 0 0 0 1 0 0 0 1 b.dat\n0 ROTSTEP 0 0 0 ABS\n1 16 0 0 0 1 0 0 0 1 0 0 0 1 c.dat\n",
+        )
+        .unwrap();
+
+        let files = |step_range| -> Vec<_> {
+            step_commands(&cmds, step_range)
+                .into_iter()
+                .filter_map(|cmd| match cmd {
+                    Command::SubFileRef(sfr_cmd) => Some(sfr_cmd.file.clone()),
+                    _ => None,
+                })
+                .collect()
+        };
+
+        assert_eq!(vec!["a.dat", "b.dat", "c.dat"], files(None));
+        assert_eq!(vec!["b.dat", "c.dat"], files(Some([2, 3])));
+        assert_eq!(vec!["a.dat"], files(Some([1, 1])));
+    }
+}
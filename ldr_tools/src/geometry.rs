@@ -1,3 +1,5 @@
+use std::{collections::HashSet, mem::size_of_val};
+
 use base64::prelude::*;
 
 use glam::{Mat4, Vec2, Vec3, Vec3Swizzles};
@@ -5,12 +7,27 @@ use rstar::{primitives::GeomWithData, RTree};
 use weldr::Command;
 
 use crate::{
-    edge_split::split_edges, replace_color, slope::is_slope_piece, ColorCode, GeometrySettings,
-    StudType,
+    bounds::Bounds,
+    edge_split::split_edges,
+    memory::box_geometry,
+    normals::corner_normals,
+    replace_color,
+    slope::{grainy_faces, is_slope_piece},
+    topology::{face_area, face_edges, is_valid_face, undirected_face},
+    ColorCode, GeometrySettings, PrimitiveResolution, StudType, CURRENT_COLOR,
 };
 
+/// Primitives with a smaller radius in LDU use low resolution
+/// with [PrimitiveResolution::Adaptive] like thin bars and axle details.
+/// Studs and pin holes have a radius of 6 LDU and stay at normal resolution.
+const LOW_RESOLUTION_MAX_RADIUS: f32 = 4.0;
+
+/// Primitives with at least this radius in LDU use high resolution
+/// with [PrimitiveResolution::Adaptive] like 2x2 round bricks and larger dishes.
+const HIGH_RESOLUTION_MIN_RADIUS: f32 = 20.0;
+
 // TODO: Document the data layout for these fields.
-#[derive(Debug, PartialEq)]
+#[derive(Debug, Default, PartialEq)]
 pub struct LDrawGeometry {
     pub vertices: Vec<Vec3>,
     pub vertex_indices: Vec<u32>,
@@ -21,11 +38,29 @@ pub struct LDrawGeometry {
     pub is_face_stud: Vec<bool>,
     /// Indices for the end points of line type 2 edges.
     pub edge_line_indices: Vec<[u32; 2]>,
+    /// Smooth normals for each face corner that are only split by line type 2 edges.
+    /// This is empty unless [corner_normals](struct.GeometrySettings.html#structfield.corner_normals) is enabled.
+    pub corner_normals: Vec<Vec3>,
+    /// `true` for each face corner if the edge to the next corner in the face is a line type 2 edge.
+    /// This is empty unless [corner_normals](struct.GeometrySettings.html#structfield.corner_normals) is enabled.
+    pub is_corner_edge_sharp: Vec<bool>,
+    /// Unique edges for all faces with the smaller vertex index first.
+    /// This is empty unless [calculate_edges](struct.GeometrySettings.html#structfield.calculate_edges) is enabled.
+    pub edges: Vec<[u32; 2]>,
+    /// The index in `edges` for the edge from each face corner to the next corner in the face.
+    /// This is empty unless [calculate_edges](struct.GeometrySettings.html#structfield.calculate_edges) is enabled.
+    pub corner_edges: Vec<u32>,
     /// `true` if the geometry is part of a slope piece with grainy faces.
     /// Some applications may want to apply a separate texture to faces
     /// based on an angle threshold.
     pub has_grainy_slopes: bool,
+    /// `true` for each face of a grainy slope piece that isn't horizontal, vertical, or a stud.
+    /// This is empty unless `has_grainy_slopes` is `true`.
+    pub is_face_grainy: Vec<bool>,
     pub texture_info: Option<LDrawTextureInfo>,
+    /// Stud top faces for applying a baked logo with [StudType::LogoNormalMap].
+    /// This is `None` if the geometry has no stud tops.
+    pub stud_logo_info: Option<LDrawStudLogoInfo>,
 }
 
 impl LDrawGeometry {
@@ -34,13 +69,117 @@ impl LDrawGeometry {
             LDrawTextureInfo::new(self.face_start_indices.len(), self.vertex_indices.len())
         })
     }
+
+    fn stud_logo_info(&mut self) -> &mut LDrawStudLogoInfo {
+        self.stud_logo_info.get_or_insert_with(|| {
+            LDrawStudLogoInfo::new(self.face_start_indices.len(), self.vertex_indices.len())
+        })
+    }
+
+    /// The total size of all buffers in bytes.
+    pub fn size_in_bytes(&self) -> usize {
+        let texture_size = self.texture_info.as_ref().map_or(0, |t| {
+            t.textures.iter().map(Vec::len).sum::<usize>()
+                + size_of_val(t.texture_ids.as_slice())
+                + size_of_val(t.indices.as_slice())
+                + size_of_val(t.uvs.as_slice())
+        });
+        let stud_logo_size = self.stud_logo_info.as_ref().map_or(0, |s| {
+            size_of_val(s.is_face_stud_top.as_slice()) + size_of_val(s.uvs.as_slice())
+        });
+
+        size_of_val(self.vertices.as_slice())
+            + size_of_val(self.vertex_indices.as_slice())
+            + size_of_val(self.face_start_indices.as_slice())
+            + size_of_val(self.face_sizes.as_slice())
+            + size_of_val(self.face_colors.as_slice())
+            + size_of_val(self.is_face_stud.as_slice())
+            + size_of_val(self.is_face_grainy.as_slice())
+            + size_of_val(self.edge_line_indices.as_slice())
+            + size_of_val(self.corner_normals.as_slice())
+            + size_of_val(self.is_corner_edge_sharp.as_slice())
+            + size_of_val(self.edges.as_slice())
+            + size_of_val(self.corner_edges.as_slice())
+            + texture_size
+            + stud_logo_size
+    }
+
+    /// The vertex indices for each face.
+    fn faces(&self) -> impl Iterator<Item = &[u32]> + '_ {
+        self.face_start_indices
+            .iter()
+            .zip(&self.face_sizes)
+            .map(|(start, size)| &self.vertex_indices[*start as usize..(*start + *size) as usize])
+    }
+
+    /// Remove faces where `should_keep` is `false` and return the number of removed faces.
+    /// This should be called before calculating normals or edges
+    /// and before combining face colors.
+    fn retain_faces(&mut self, should_keep: &[bool]) -> usize {
+        let face_count = self.face_sizes.len();
+        let removed_count = should_keep.iter().filter(|k| !**k).count();
+        if removed_count == 0 {
+            return 0;
+        }
+
+        let mut vertex_indices = Vec::new();
+        let mut face_start_indices = Vec::new();
+        let mut face_sizes = Vec::new();
+        let mut face_colors = Vec::new();
+        let mut is_face_stud = Vec::new();
+        let mut texture_indices = Vec::new();
+        let mut uvs = Vec::new();
+        let mut is_face_stud_top = Vec::new();
+        let mut stud_top_uvs = Vec::new();
+
+        for i in (0..face_count).filter(|i| should_keep[*i]) {
+            let start = self.face_start_indices[i] as usize;
+            let size = self.face_sizes[i] as usize;
+
+            face_start_indices.push(vertex_indices.len() as u32);
+            face_sizes.push(size as u32);
+            vertex_indices.extend_from_slice(&self.vertex_indices[start..start + size]);
+            face_colors.push(self.face_colors[i]);
+            is_face_stud.push(self.is_face_stud[i]);
+
+            if let Some(texture_info) = &self.texture_info {
+                texture_indices.push(texture_info.indices[i]);
+                uvs.extend_from_slice(&texture_info.uvs[start..start + size]);
+            }
+
+            if let Some(stud_logo_info) = &self.stud_logo_info {
+                is_face_stud_top.push(stud_logo_info.is_face_stud_top[i]);
+                stud_top_uvs.extend_from_slice(&stud_logo_info.uvs[start..start + size]);
+            }
+        }
+
+        self.vertex_indices = vertex_indices;
+        self.face_start_indices = face_start_indices;
+        self.face_sizes = face_sizes;
+        self.face_colors = face_colors;
+        self.is_face_stud = is_face_stud;
+        if let Some(texture_info) = &mut self.texture_info {
+            texture_info.indices = texture_indices;
+            texture_info.uvs = uvs;
+        }
+        if let Some(stud_logo_info) = &mut self.stud_logo_info {
+            stud_logo_info.is_face_stud_top = is_face_stud_top;
+            stud_logo_info.uvs = stud_top_uvs;
+        }
+
+        removed_count
+    }
 }
 
 #[derive(Debug, PartialEq)]
 pub struct LDrawTextureInfo {
     /// PNG-encoded images from PE_TEX_INFO commands.
+    /// Loading a scene moves the images to the scene's `textures` and leaves this empty.
     pub textures: Vec<Vec<u8>>,
-    /// Per-face indices into `textures`. 0xFF indicates no texture for the face.
+    /// The index in the scene's `textures` for each image used by this geometry.
+    /// This is empty until the geometry is added to a scene.
+    pub texture_ids: Vec<u32>,
+    /// Per-face indices into `textures` or `texture_ids`. 0xFF indicates no texture for the face.
     /// Eight-bit indices save memory, especially for the untextured majority of parts.
     pub indices: Vec<u8>,
     /// Per-vertex UV coordinates for the entire mesh, even non-textured faces.
@@ -53,12 +192,49 @@ impl LDrawTextureInfo {
         // by filling in the arrays "up to this point" with sentinel/placeholder data.
         Self {
             textures: vec![],
+            texture_ids: vec![],
             indices: vec![u8::MAX; num_faces],
             uvs: vec![Vec2::ZERO; num_vertices],
         }
     }
 }
 
+#[derive(Debug, PartialEq)]
+pub struct LDrawStudLogoInfo {
+    /// `true` for each face on the top of a stud.
+    pub is_face_stud_top: Vec<bool>,
+    /// Per-vertex UV coordinates mapping the top of each stud to the unit square.
+    /// Faces that aren't stud tops have UVs of zero.
+    pub uvs: Vec<Vec2>,
+}
+
+impl LDrawStudLogoInfo {
+    fn new(num_faces: usize, num_vertices: usize) -> Self {
+        // Catch up with the faces added before the first stud top.
+        Self {
+            is_face_stud_top: vec![false; num_faces],
+            uvs: vec![Vec2::ZERO; num_vertices],
+        }
+    }
+}
+
+/// The number of faces removed from a geometry by
+/// [remove_degenerate_faces](struct.GeometrySettings.html#structfield.remove_degenerate_faces).
+#[derive(Debug, Default, Clone, Copy, PartialEq, Eq)]
+pub struct RemovedFaces {
+    /// Faces with repeated or out of range vertex indices, usually from welding.
+    pub invalid_count: usize,
+    pub zero_area_count: usize,
+    /// Faces with the same vertices as a previous face in either winding.
+    pub duplicate_count: usize,
+}
+
+impl RemovedFaces {
+    pub fn total_count(&self) -> usize {
+        self.invalid_count + self.zero_area_count + self.duplicate_count
+    }
+}
+
 /// Settings that inherit or accumulate when recursing into subfiles.
 struct GeometryContext {
     current_color: ColorCode,
@@ -67,6 +243,9 @@ struct GeometryContext {
     is_stud: bool,
     is_slope: bool,
     studio_textures: Vec<PendingStudioTexture>,
+    /// The transform from the current file to the stud that contains it
+    /// for [StudType::LogoNormalMap] or `None` outside of studs.
+    stud_logo_transform: Option<Mat4>,
 }
 
 #[derive(Clone)]
@@ -188,7 +367,6 @@ impl VertexMap {
     }
 }
 
-#[tracing::instrument]
 pub fn create_geometry(
     source_file: &weldr::SourceFile,
     source_map: &weldr::SourceMap,
@@ -197,6 +375,27 @@ pub fn create_geometry(
     recursive: bool,
     settings: &GeometrySettings,
 ) -> LDrawGeometry {
+    create_geometry_removed_faces(
+        source_file,
+        source_map,
+        name,
+        current_color,
+        recursive,
+        settings,
+    )
+    .0
+}
+
+/// Create geometry like [create_geometry] and also return the number of removed faces.
+#[tracing::instrument]
+pub(crate) fn create_geometry_removed_faces(
+    source_file: &weldr::SourceFile,
+    source_map: &weldr::SourceMap,
+    name: &str,
+    current_color: ColorCode,
+    recursive: bool,
+    settings: &GeometrySettings,
+) -> (LDrawGeometry, RemovedFaces) {
     let mut geometry = LDrawGeometry {
         vertices: Vec::new(),
         vertex_indices: Vec::new(),
@@ -205,8 +404,14 @@ pub fn create_geometry(
         face_colors: Vec::new(),
         is_face_stud: Vec::new(),
         edge_line_indices: Vec::new(),
+        corner_normals: Vec::new(),
+        is_corner_edge_sharp: Vec::new(),
+        edges: Vec::new(),
+        corner_edges: Vec::new(),
         has_grainy_slopes: is_slope_piece(name),
+        is_face_grainy: Vec::new(),
         texture_info: None,
+        stud_logo_info: None,
     };
 
     // Start with inverted set to false since parts should never be inverted.
@@ -218,6 +423,7 @@ pub fn create_geometry(
         is_stud: is_stud(name),
         is_slope: is_slope_piece(name),
         studio_textures: vec![],
+        stud_logo_transform: None,
     };
 
     let mut vertex_map = VertexMap::new();
@@ -236,9 +442,41 @@ pub fn create_geometry(
 
     geometry.edge_line_indices = edge_indices(&hard_edges, &vertex_map);
 
-    // TODO: make this optional.
+    let removed_faces = if settings.remove_degenerate_faces {
+        remove_degenerate_faces(&mut geometry)
+    } else if settings.calculate_edges {
+        RemovedFaces {
+            invalid_count: remove_invalid_faces(&mut geometry),
+            ..Default::default()
+        }
+    } else {
+        RemovedFaces::default()
+    };
+
+    // Classify faces once instead of checking normals for each shading sample.
+    if geometry.has_grainy_slopes {
+        geometry.is_face_grainy = grainy_faces(
+            &geometry.vertices,
+            &geometry.vertex_indices,
+            &geometry.face_start_indices,
+            &geometry.face_sizes,
+            &geometry.is_face_stud,
+        );
+    }
+
     // TODO: Should this be disabled when not welding vertices?
-    if !geometry.edge_line_indices.is_empty() {
+    if settings.corner_normals {
+        // Sharp edges only affect normals, so there's no need to split any vertices.
+        let (normals, is_sharp) = corner_normals(
+            &geometry.vertices,
+            &geometry.vertex_indices,
+            &geometry.face_start_indices,
+            &geometry.face_sizes,
+            &geometry.edge_line_indices,
+        );
+        geometry.corner_normals = normals;
+        geometry.is_corner_edge_sharp = is_sharp;
+    } else if !geometry.edge_line_indices.is_empty() {
         let (split_positions, split_indices) = split_edges(
             &geometry.vertices,
             &geometry.vertex_indices,
@@ -251,6 +489,16 @@ pub fn create_geometry(
         geometry.vertex_indices = split_indices;
     }
 
+    if settings.calculate_edges {
+        let (edges, corner_edges) = face_edges(
+            &geometry.vertex_indices,
+            &geometry.face_start_indices,
+            &geometry.face_sizes,
+        );
+        geometry.edges = edges;
+        geometry.corner_edges = corner_edges;
+    }
+
     // Optimize the case where all face colors are the same.
     // This reduces overhead when processing data in Python.
     // A single color can be applied per object rather than per face.
@@ -260,6 +508,25 @@ pub fn create_geometry(
         }
     }
 
+    scale_geometry(&mut geometry, settings);
+    (geometry, removed_faces)
+}
+
+/// A box covering `bounds` from [file_bounds](crate::bounds::file_bounds)
+/// in the same space and scale as [create_geometry].
+/// All faces use the current color to take the color of each instance.
+pub fn create_preview_geometry(
+    bounds: Option<Bounds>,
+    settings: &GeometrySettings,
+) -> LDrawGeometry {
+    // Files without any faces still need geometry for the nodes referencing them.
+    let Bounds { min, max } = bounds.unwrap_or(Bounds::new(Vec3::ZERO, Vec3::ZERO));
+    let mut geometry = box_geometry(min, max, CURRENT_COLOR, settings);
+    scale_geometry(&mut geometry, settings);
+    geometry
+}
+
+fn scale_geometry(geometry: &mut LDrawGeometry, settings: &GeometrySettings) {
     let min = geometry
         .vertices
         .iter()
@@ -285,8 +552,46 @@ pub fn create_geometry(
     for vertex in &mut geometry.vertices {
         *vertex *= scale;
     }
+    // Normals use the inverse scale to stay perpendicular to the scaled faces.
+    for normal in &mut geometry.corner_normals {
+        *normal = (*normal / scale).normalize_or_zero();
+    }
+}
 
-    geometry
+fn remove_invalid_faces(geometry: &mut LDrawGeometry) -> usize {
+    // Welding can collapse faces, which Blender would remove when validating.
+    let vertex_count = geometry.vertices.len();
+    let is_valid: Vec<_> = geometry
+        .faces()
+        .map(|face| is_valid_face(face, vertex_count))
+        .collect();
+    geometry.retain_faces(&is_valid)
+}
+
+fn remove_degenerate_faces(geometry: &mut LDrawGeometry) -> RemovedFaces {
+    let invalid_count = remove_invalid_faces(geometry);
+
+    // Vertices are still in LDUs, so this threshold is very small relative to most parts.
+    let has_area: Vec<_> = geometry
+        .faces()
+        .map(|face| face_area(&geometry.vertices, face) > 0.0001)
+        .collect();
+    let zero_area_count = geometry.retain_faces(&has_area);
+
+    // Overlapping primitives can create the same face more than once.
+    // Keep the first face to preserve the original color and texture.
+    let mut faces = HashSet::new();
+    let is_unique: Vec<_> = geometry
+        .faces()
+        .map(|face| faces.insert(undirected_face(face)))
+        .collect();
+    let duplicate_count = geometry.retain_faces(&is_unique);
+
+    RemovedFaces {
+        invalid_count,
+        zero_area_count,
+        duplicate_count,
+    }
 }
 
 fn is_stud(name: &str) -> bool {
@@ -294,6 +599,21 @@ fn is_stud(name: &str) -> bool {
     name.contains("stu")
 }
 
+/// The stud files with a circular top of radius 6 LDU at `y = -4` in local space.
+fn is_logo_stud(name: &str) -> bool {
+    matches!(name, "stud.dat" | "stud2.dat")
+}
+
+/// UVs for faces on the top of a stud in the stud's local space
+/// or `None` if the face isn't on the stud top.
+fn stud_top_uvs<const N: usize>(stud_transform: Mat4, vertices: [Vec3; N]) -> Option<[Vec2; N]> {
+    let vertices = vertices.map(|v| stud_transform.transform_point3(v));
+    vertices
+        .iter()
+        .all(|v| (v.y + 4.0).abs() < 0.01 && v.xz().length() < 6.01)
+        .then(|| vertices.map(|v| v.xz() / 12.0 + 0.5))
+}
+
 fn gaps_scale(dimensions: Vec3) -> Vec3 {
     // TODO: Avoid applying this on chains, ropes, etc?
     // TODO: Weld ropes into a single piece?
@@ -453,7 +773,7 @@ fn append_geometry(
                 } else {
                     add_face(
                         geometry,
-                        ctx.transform,
+                        &ctx,
                         q.vertices,
                         q.uvs,
                         invert_winding(current_winding, current_inverted),
@@ -476,7 +796,15 @@ fn append_geometry(
                     continue;
                 }
                 let subfilename = replace_studs(subfile_cmd, settings.stud_type);
-                let Some(subfile) = source_map.get(subfilename) else {
+                let transform = ctx.transform * subfile_cmd.matrix();
+
+                let subfile = match settings.primitive_resolution {
+                    PrimitiveResolution::Adaptive => {
+                        adaptive_primitive(subfilename, transform, source_map)
+                    }
+                    _ => None,
+                };
+                let Some(subfile) = subfile.or_else(|| source_map.get(subfilename)) else {
                     continue;
                 };
 
@@ -504,11 +832,19 @@ fn append_geometry(
                     }
                 }
 
+                // Track the stud's space to map its top face to the baked logo.
+                let stud_logo_transform =
+                    if settings.stud_type == StudType::LogoNormalMap && is_logo_stud(subfilename) {
+                        Some(transform.inverse())
+                    } else {
+                        ctx.stud_logo_transform
+                    };
+
                 // The determinant is checked in each file.
                 // It should not be included in the child's context.
                 let child_ctx = GeometryContext {
                     current_color,
-                    transform: ctx.transform * subfile_cmd.matrix(),
+                    transform,
                     inverted: if invert_next {
                         !ctx.inverted
                     } else {
@@ -517,6 +853,7 @@ fn append_geometry(
                     is_stud,
                     is_slope,
                     studio_textures: child_textures,
+                    stud_logo_transform,
                 };
 
                 // Don't invert additional subfile reference commands.
@@ -536,7 +873,31 @@ fn append_geometry(
     }
 }
 
-fn replace_studs(subfile_cmd: &weldr::SubFileRefCmd, stud_type: StudType) -> &str {
+/// The low or high resolution version of the primitive `name`
+/// or `None` to use the normal resolution.
+fn adaptive_primitive<'a>(
+    name: &str,
+    transform: Mat4,
+    source_map: &'a weldr::SourceMap,
+) -> Option<&'a weldr::SourceFile> {
+    // Curved primitives are circles of radius 1 LDU in the XZ plane.
+    let radius = transform
+        .x_axis
+        .truncate()
+        .length()
+        .max(transform.z_axis.truncate().length());
+
+    let folder = if radius < LOW_RESOLUTION_MAX_RADIUS {
+        "8"
+    } else if radius >= HIGH_RESOLUTION_MIN_RADIUS {
+        "48"
+    } else {
+        return None;
+    };
+    source_map.get(&format!("{folder}\\{name}"))
+}
+
+pub fn replace_studs(subfile_cmd: &weldr::SubFileRefCmd, stud_type: StudType) -> &str {
     // https://wiki.ldraw.org/wiki/Studs_with_Logos
     match stud_type {
         StudType::Disabled => {
@@ -555,6 +916,7 @@ fn replace_studs(subfile_cmd: &weldr::SubFileRefCmd, stud_type: StudType) -> &st
             _ => subfile_cmd.file.as_str(),
         },
         StudType::HighContrast => &subfile_cmd.file,
+        StudType::LogoNormalMap => &subfile_cmd.file,
     }
 }
 
@@ -571,7 +933,7 @@ fn add_triangle_face(
 ) {
     add_face(
         geometry,
-        ctx.transform,
+        ctx,
         vertices,
         uvs,
         winding,
@@ -637,7 +999,7 @@ fn project_texture<const N: usize>(
 
 fn add_face<const N: usize>(
     geometry: &mut LDrawGeometry,
-    transform: Mat4,
+    ctx: &GeometryContext,
     vertices: [Vec3; N],
     uvs: Option<[Vec2; N]>,
     winding: Winding,
@@ -650,7 +1012,11 @@ fn add_face<const N: usize>(
         vertices.reverse();
     }
 
+    let transform = ctx.transform;
     let texmap = texture.and_then(|t| project_texture(t, transform, vertices, uvs));
+    let stud_uvs = ctx
+        .stud_logo_transform
+        .and_then(|stud_transform| stud_top_uvs(stud_transform * transform, vertices));
 
     let starting_index = geometry.vertex_indices.len() as u32;
     let indices =
@@ -673,6 +1039,16 @@ fn add_face<const N: usize>(
             texture_info.uvs.extend([Vec2::ZERO; N]); // "Padding" so that all vertices get a UV.
         }
     }
+
+    // Stud tops use the same lazy initialization as textures.
+    if let Some(stud_uvs) = stud_uvs {
+        let stud_logo_info = geometry.stud_logo_info();
+        stud_logo_info.is_face_stud_top.push(true);
+        stud_logo_info.uvs.extend(stud_uvs);
+    } else if let Some(stud_logo_info) = &mut geometry.stud_logo_info {
+        stud_logo_info.is_face_stud_top.push(false);
+        stud_logo_info.uvs.extend([Vec2::ZERO; N]);
+    }
 }
 
 fn intersect_poly_box(polygon: &[Vec3], r: Vec3) -> bool {
@@ -759,39 +1135,11 @@ fn next_array<T: Default, const N: usize>(mut iter: impl Iterator<Item = T>) ->
 
 #[cfg(test)]
 mod tests {
-    use std::collections::HashMap;
-
     use super::*;
 
     use indoc::indoc;
 
-    struct DummyResolver {
-        files: HashMap<&'static str, Vec<u8>>,
-    }
-
-    impl DummyResolver {
-        fn new() -> Self {
-            Self {
-                files: HashMap::new(),
-            }
-        }
-    }
-
-    impl weldr::FileRefResolver for DummyResolver {
-        fn resolve<P: AsRef<std::path::Path>>(
-            &self,
-            filename: P,
-        ) -> Result<Vec<u8>, weldr::ResolveError> {
-            let filename = filename.as_ref().to_str().unwrap();
-            self.files
-                .get(filename)
-                .cloned()
-                .ok_or(weldr::ResolveError {
-                    filename: filename.to_owned(),
-                    resolve_error: None,
-                })
-        }
-    }
+    use crate::test_utils::DummyResolver;
 
     #[test]
     fn create_geometry_mpd() {
@@ -959,6 +1307,242 @@ mod tests {
         assert_eq!(vec![3, 3, 3, 3], geometry.face_sizes);
     }
 
+    #[test]
+    fn create_geometry_calculate_edges() {
+        let mut source_map = weldr::SourceMap::new();
+
+        // The second triangle collapses to a line after welding.
+        let document = indoc! {"
+            3 16 1 0 0 0 1 0 0 0 1
+            3 4 0 0 1 0 0 1.001 1 0 0
+            4 16 1 0 0 0 1 0 0 0 1 1 1 1
+        "};
+
+        let mut resolver = DummyResolver::new();
+        resolver.files.insert("root", document.as_bytes().to_vec());
+
+        let main_model_name = weldr::parse("root", &resolver, &mut source_map).unwrap();
+        let source_file = source_map.get(&main_model_name).unwrap();
+
+        let geometry = create_geometry(
+            &source_file,
+            &source_map,
+            "",
+            16,
+            true,
+            &GeometrySettings {
+                weld_vertices: true,
+                calculate_edges: true,
+                ..Default::default()
+            },
+        );
+
+        assert_eq!(vec![0, 1, 2, 0, 1, 2, 3], geometry.vertex_indices);
+        assert_eq!(vec![0, 3], geometry.face_start_indices);
+        assert_eq!(vec![3, 4], geometry.face_sizes);
+        assert_eq!(vec![16], geometry.face_colors);
+        assert_eq!(vec![[0, 1], [1, 2], [0, 2], [2, 3], [0, 3]], geometry.edges);
+        assert_eq!(vec![0, 1, 2, 0, 1, 3, 4], geometry.corner_edges);
+    }
+
+    #[test]
+    fn create_geometry_remove_degenerate_faces() {
+        let mut source_map = weldr::SourceMap::new();
+
+        // Zero area, duplicate, and opposite winding faces.
+        let document = indoc! {"
+            4 16 0 0 0 1 0 0 1 1 0 0 1 0
+            3 16 0 0 0 1 0 0 2 0 0
+            4 4 1 0 0 1 1 0 0 1 0 0 0 0
+            4 16 0 1 0 1 1 0 1 0 0 0 0 0
+            3 16 0 0 0 1 0 0 0 0 1
+        "};
+
+        let mut resolver = DummyResolver::new();
+        resolver.files.insert("root", document.as_bytes().to_vec());
+
+        let main_model_name = weldr::parse("root", &resolver, &mut source_map).unwrap();
+        let source_file = source_map.get(&main_model_name).unwrap();
+
+        let (geometry, removed_faces) = create_geometry_removed_faces(
+            &source_file,
+            &source_map,
+            "",
+            16,
+            true,
+            &GeometrySettings {
+                weld_vertices: true,
+                remove_degenerate_faces: true,
+                ..Default::default()
+            },
+        );
+
+        assert_eq!(vec![0, 1, 2, 3, 0, 1, 5], geometry.vertex_indices);
+        assert_eq!(vec![0, 4], geometry.face_start_indices);
+        assert_eq!(vec![4, 3], geometry.face_sizes);
+        assert_eq!(vec![16], geometry.face_colors);
+        assert_eq!(vec![false, false], geometry.is_face_stud);
+        assert_eq!(
+            RemovedFaces {
+                invalid_count: 0,
+                zero_area_count: 1,
+                duplicate_count: 2
+            },
+            removed_faces
+        );
+    }
+
+    #[test]
+    fn create_geometry_stud_logo_uvs() {
+        let mut source_map = weldr::SourceMap::new();
+
+        // Only the top face of the stud should be marked and mapped.
+        let document = indoc! {"
+            0 FILE main.ldr
+            4 16 -1 0 -1 -1 0 1 1 0 1 1 0 -1
+            1 16 10 0 0 1 0 0 0 1 0 0 0 1 stud.dat
+
+            0 FILE stud.dat
+            3 16 0 -4 0 6 -4 0 0 -4 6
+            4 16 6 0 0 6 -4 0 0 -4 6 0 0 6
+        "};
+
+        let mut resolver = DummyResolver::new();
+        resolver.files.insert("root", document.as_bytes().to_vec());
+
+        let main_model_name = weldr::parse("root", &resolver, &mut source_map).unwrap();
+        let source_file = source_map.get(&main_model_name).unwrap();
+
+        let geometry = create_geometry(
+            &source_file,
+            &source_map,
+            "",
+            16,
+            true,
+            &GeometrySettings {
+                stud_type: StudType::LogoNormalMap,
+                ..Default::default()
+            },
+        );
+
+        let stud_logo_info = geometry.stud_logo_info.unwrap();
+        assert_eq!(vec![false, true, false], stud_logo_info.is_face_stud_top);
+        assert_eq!(
+            vec![
+                Vec2::ZERO,
+                Vec2::ZERO,
+                Vec2::ZERO,
+                Vec2::ZERO,
+                Vec2::new(0.5, 0.5),
+                Vec2::new(1.0, 0.5),
+                Vec2::new(0.5, 1.0),
+                Vec2::ZERO,
+                Vec2::ZERO,
+                Vec2::ZERO,
+                Vec2::ZERO,
+            ],
+            stud_logo_info.uvs
+        );
+    }
+
+    #[test]
+    fn create_geometry_normal_studs_no_stud_logo_uvs() {
+        let mut source_map = weldr::SourceMap::new();
+
+        let document = indoc! {"
+            0 FILE main.ldr
+            1 16 0 0 0 1 0 0 0 1 0 0 0 1 stud.dat
+
+            0 FILE stud.dat
+            3 16 0 -4 0 6 -4 0 0 -4 6
+        "};
+
+        let mut resolver = DummyResolver::new();
+        resolver.files.insert("root", document.as_bytes().to_vec());
+
+        let main_model_name = weldr::parse("root", &resolver, &mut source_map).unwrap();
+        let source_file = source_map.get(&main_model_name).unwrap();
+
+        let geometry = create_geometry(
+            &source_file,
+            &source_map,
+            "",
+            16,
+            true,
+            &GeometrySettings::default(),
+        );
+
+        assert_eq!(None, geometry.stud_logo_info);
+    }
+
+    #[test]
+    fn create_geometry_adaptive_primitive_resolution() {
+        let mut source_map = weldr::SourceMap::new();
+
+        // Each resolution uses a different color to check which file was used.
+        let document = indoc! {"
+            0 FILE main.ldr
+            1 16 0 0 0 2 0 0 0 1 0 0 0 2 4-4cyli.dat
+            1 16 0 0 0 10 0 0 0 1 0 0 0 10 4-4cyli.dat
+            1 16 0 0 0 30 0 0 0 1 0 0 0 30 4-4cyli.dat
+            1 16 0 0 0 30 0 0 0 1 0 0 0 30 4-4disc.dat
+
+            0 FILE 4-4cyli.dat
+            3 1 1 0 0 0 1 0 0 0 1
+
+            0 FILE 8\\4-4cyli.dat
+            3 2 1 0 0 0 1 0 0 0 1
+
+            0 FILE 4-4disc.dat
+            3 3 1 0 0 0 1 0 0 0 1
+
+            0 FILE 48\\4-4disc.dat
+            3 4 1 0 0 0 1 0 0 0 1
+        "};
+
+        let mut resolver = DummyResolver::new();
+        resolver.files.insert("root", document.as_bytes().to_vec());
+
+        let main_model_name = weldr::parse("root", &resolver, &mut source_map).unwrap();
+        let source_file = source_map.get(&main_model_name).unwrap();
+
+        let geometry = create_geometry(
+            &source_file,
+            &source_map,
+            "",
+            16,
+            true,
+            &GeometrySettings {
+                primitive_resolution: PrimitiveResolution::Adaptive,
+                ..Default::default()
+            },
+        );
+
+        // Missing resolutions use the normal primitive.
+        assert_eq!(vec![2, 1, 1, 4], geometry.face_colors);
+    }
+
+    #[test]
+    fn create_preview_geometry_scaled_box() {
+        let geometry = create_preview_geometry(
+            Some(Bounds::new(
+                Vec3::new(-1.0, -2.0, -3.0),
+                Vec3::new(1.0, 2.0, 3.0),
+            )),
+            &GeometrySettings {
+                scene_scale: 0.5,
+                calculate_edges: true,
+                ..Default::default()
+            },
+        );
+        assert_eq!(8, geometry.vertices.len());
+        assert_eq!(Vec3::new(-0.5, -1.0, -1.5), geometry.vertices[0]);
+        assert_eq!(Vec3::new(0.5, 1.0, 1.5), geometry.vertices[7]);
+        assert_eq!(vec![4; 6], geometry.face_sizes);
+        assert_eq!(vec![CURRENT_COLOR], geometry.face_colors);
+        assert_eq!(12, geometry.edges.len());
+    }
+
     // TODO: Test create geometry with and without welding and triangulate options
 
     // TODO: Add tests for BFC certified superfiles.
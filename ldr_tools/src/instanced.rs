@@ -0,0 +1,320 @@
+use std::{
+    collections::{HashMap, HashSet},
+    sync::{Arc, Mutex},
+};
+
+use glam::Mat4;
+use rayon::prelude::*;
+use weldr::Command;
+
+use crate::{
+    filter::{is_included, step_commands},
+    has_geometry,
+    intern::{PartId, PartInterner},
+    is_part, replace_color, ColorCode, GeometryInitDescriptor, LoadFilter, CURRENT_COLOR,
+};
+
+/// Geometry instances for a file relative to the file's coordinate space.
+#[derive(Default)]
+pub struct LocalInstances<'a> {
+    /// Geometry for this file and its subfiles in the order it was first referenced.
+    pub geometry_descriptors: Vec<(PartId, GeometryInitDescriptor<'a>)>,
+    geometry_ids: HashSet<PartId>,
+    /// The geometry and color for this file itself.
+    geometry: Option<(PartId, ColorCode)>,
+    /// The transform and shared instances for each subfile reference in order.
+    children: Vec<(Mat4, Arc<LocalInstances<'a>>)>,
+}
+
+/// Cached instances for each file, current color, and parent inclusion.
+pub type InstanceCache<'a> = Mutex<HashMap<(PartId, ColorCode, bool), Arc<LocalInstances<'a>>>>;
+
+impl<'a> LocalInstances<'a> {
+    fn add_geometry(
+        &mut self,
+        id: PartId,
+        descriptor: GeometryInitDescriptor<'a>,
+        color: ColorCode,
+    ) {
+        if self.geometry_ids.insert(id) {
+            self.geometry_descriptors.push((id, descriptor));
+        }
+        self.geometry = Some((id, color));
+    }
+
+    fn add_child(&mut self, child: Arc<LocalInstances<'a>>, transform: Mat4) {
+        for (id, descriptor) in &child.geometry_descriptors {
+            if self.geometry_ids.insert(*id) {
+                self.geometry_descriptors.push((*id, *descriptor));
+            }
+        }
+        self.children.push((transform, child));
+    }
+
+    /// The transforms for each geometry and color relative to this file.
+    ///
+    /// Transforms are accumulated from the root like a recursive walk of the hierarchy,
+    /// so the values and the order of transforms for each key match the walk exactly.
+    /// Each subfile reference of this file is expanded in parallel.
+    pub fn geometry_transforms(&self) -> HashMap<(PartId, ColorCode), Vec<Mat4>> {
+        let world_transform = Mat4::IDENTITY;
+
+        let mut transforms: HashMap<_, Vec<_>> = HashMap::new();
+        if let Some(key) = self.geometry {
+            transforms.entry(key).or_default().push(world_transform);
+        }
+
+        // Appending the separate lists in reference order preserves the order of the walk.
+        let child_transforms: Vec<_> = self
+            .children
+            .par_iter()
+            .filter(|(_, child)| !child.geometry_descriptors.is_empty())
+            .map(|(transform, child)| {
+                let mut child_transforms = HashMap::new();
+                child.add_transforms(&(world_transform * *transform), &mut child_transforms);
+                child_transforms
+            })
+            .collect();
+        for child_transforms in child_transforms {
+            for (key, t) in child_transforms {
+                transforms.entry(key).or_default().extend(t);
+            }
+        }
+
+        transforms
+    }
+
+    fn add_transforms(
+        &self,
+        world_transform: &Mat4,
+        transforms: &mut HashMap<(PartId, ColorCode), Vec<Mat4>>,
+    ) {
+        if let Some(key) = self.geometry {
+            transforms.entry(key).or_default().push(*world_transform);
+        }
+
+        for (transform, child) in &self.children {
+            // Skip subfiles without any geometry.
+            if !child.geometry_descriptors.is_empty() {
+                child.add_transforms(&(*world_transform * *transform), transforms);
+            }
+        }
+    }
+}
+
+/// Find the instances for a file with `id` from `interner`.
+///
+/// The instances for each file and color are only calculated once
+/// and shared by each reference to that file.
+/// Unique subfile references are loaded in parallel.
+///
+/// Only files included by the filter's submodel names add geometry,
+/// and `step_range` only applies to the commands of this file.
+pub fn load_instances<'a>(
+    source_file: &'a weldr::SourceFile,
+    id: PartId,
+    source_map: &'a weldr::SourceMap,
+    current_color: ColorCode,
+    parent_included: bool,
+    step_range: Option<[u32; 2]>,
+    filter: &LoadFilter,
+    interner: &PartInterner,
+    cache: &InstanceCache<'a>,
+) -> Arc<LocalInstances<'a>> {
+    let key = (id, current_color, parent_included);
+    if let Some(instances) = cache.lock().unwrap().get(&key) {
+        return instances.clone();
+    }
+
+    let mut instances = LocalInstances::default();
+
+    let name = interner.name(id);
+    let included = is_included(filter, &name, parent_included);
+
+    // TODO: Find a way to avoid repetition.
+    let is_part = is_part(source_file, &name);
+    if included && is_part {
+        // Create geometry if the node is a part.
+        // Use the special color code to reuse identical parts in different colors.
+        instances.add_geometry(
+            id,
+            GeometryInitDescriptor {
+                source_file,
+                current_color: CURRENT_COLOR,
+                recursive: true,
+            },
+            current_color,
+        );
+    } else if included && has_geometry(source_file) {
+        // Just add geometry for this node.
+        // Use the current color at this node since this geometry might not be referenced elsewhere.
+        instances.add_geometry(
+            id,
+            GeometryInitDescriptor {
+                source_file,
+                current_color,
+                recursive: false,
+            },
+            current_color,
+        );
+    }
+
+    // Recursion is already handled for parts.
+    // Excluded files may still reference included submodels.
+    if !is_part {
+        let children: Vec<_> = step_commands(&source_file.cmds, step_range)
+            .into_iter()
+            .filter_map(|cmd| match cmd {
+                Command::SubFileRef(sfr_cmd) => {
+                    let subfile = source_map.get(&sfr_cmd.file)?;
+                    // Handle replacing colors.
+                    let child_color = replace_color(sfr_cmd.color, current_color);
+                    Some((
+                        interner.intern(&sfr_cmd.file),
+                        child_color,
+                        sfr_cmd.matrix(),
+                        subfile,
+                    ))
+                }
+                _ => None,
+            })
+            .collect();
+
+        // Each unique child is independent, so load them in parallel.
+        let mut unique_children = HashMap::new();
+        for (id, color, _, subfile) in &children {
+            unique_children.insert((*id, *color), *subfile);
+        }
+        let child_instances: HashMap<_, _> = unique_children
+            .into_par_iter()
+            .map(|((id, color), subfile)| {
+                let instances = load_instances(
+                    subfile, id, source_map, color, included, None, filter, interner, cache,
+                );
+                ((id, color), instances)
+            })
+            .collect();
+
+        for (id, color, transform, _) in children {
+            instances.add_child(child_instances[&(id, color)].clone(), transform);
+        }
+    }
+
+    let instances = Arc::new(instances);
+    cache.lock().unwrap().insert(key, instances.clone());
+    instances
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use indoc::indoc;
+
+    use crate::test_utils::DummyResolver;
+
+    /// The recursive walk used before instances were cached.
+    fn recursive_transforms(
+        source_file: &weldr::SourceFile,
+        filename: &str,
+        world_transform: &Mat4,
+        source_map: &weldr::SourceMap,
+        current_color: ColorCode,
+        transforms: &mut HashMap<(String, ColorCode), Vec<Mat4>>,
+    ) {
+        let is_part = is_part(source_file, filename);
+        if is_part || has_geometry(source_file) {
+            transforms
+                .entry((filename.to_lowercase(), current_color))
+                .or_default()
+                .push(*world_transform);
+        }
+
+        if !is_part {
+            for cmd in &source_file.cmds {
+                if let Command::SubFileRef(sfr_cmd) = cmd {
+                    if let Some(subfile) = source_map.get(&sfr_cmd.file) {
+                        recursive_transforms(
+                            subfile,
+                            &sfr_cmd.file,
+                            &(*world_transform * sfr_cmd.matrix()),
+                            source_map,
+                            replace_color(sfr_cmd.color, current_color),
+                            transforms,
+                        );
+                    }
+                }
+            }
+        }
+    }
+
+    #[test]
+    fn geometry_transforms_match_recursive_walk() {
+        // Rotations and scales with inexact values would expose
+        // any difference in the order of multiplication.
+        let resolver = DummyResolver::from([
+            (
+                "main.ldr",
+                indoc! {"
+                    1 16 0.1 0.2 0.3 0.8 0.6 0 -0.6 0.8 0 0 0 1.1 sub.ldr
+                    1 4 10.7 -3.3 0 0.3 0 0.9 0 1 0 -0.9 0 0.3 sub.ldr
+                    1 2 -5 7.9 1.3 1 0 0 0 0.7 -0.7 0 0.7 0.7 nested.ldr
+                    1 16 0 0 0 1 0 0 0 1 0 0 0 1 a.dat
+                "},
+            ),
+            (
+                "sub.ldr",
+                indoc! {"
+                    1 16 1.3 0 0.7 0.6 0 0.8 0 1 0 -0.8 0 0.6 a.dat
+                    1 1 20.1 0 0 1 0 0 0 0.9 0.1 0 -0.1 0.9 a.dat
+                    1 16 0 -8.3 0 1 0 0 0 1 0 0 0 1 b.dat
+                "},
+            ),
+            (
+                "nested.ldr",
+                indoc! {"
+                    1 16 0 0 20.3 0.8 -0.6 0 0.6 0.8 0 0 0 1 sub.ldr
+                    1 16 0.9 0.9 0.9 0.3 0 0.9 0 1 0 -0.9 0 0.3 sub.ldr
+                "},
+            ),
+            ("a.dat", "3 16 0 0 0 1 0 0 0 0 1\n"),
+            ("b.dat", "3 16 0 0 0 1 0 0 0 0 1\n"),
+        ]);
+        let mut source_map = weldr::SourceMap::new();
+        weldr::parse("main.ldr", &resolver, &mut source_map).unwrap();
+        let source_file = source_map.get("main.ldr").unwrap();
+
+        let mut expected = HashMap::new();
+        recursive_transforms(
+            source_file,
+            "main.ldr",
+            &Mat4::IDENTITY,
+            &source_map,
+            CURRENT_COLOR,
+            &mut expected,
+        );
+
+        let interner = PartInterner::default();
+        let instances = load_instances(
+            source_file,
+            interner.intern("main.ldr"),
+            &source_map,
+            CURRENT_COLOR,
+            false,
+            None,
+            &LoadFilter::default(),
+            &interner,
+            &Mutex::new(HashMap::new()),
+        );
+        let names = interner.names();
+        let transforms: HashMap<_, _> = instances
+            .geometry_transforms()
+            .into_iter()
+            .map(|((id, color), t)| ((names[id as usize].clone(), color), t))
+            .collect();
+
+        // Compare exactly without any tolerance.
+        assert_eq!(expected, transforms);
+        assert_eq!(2, transforms[&("a.dat".to_string(), 16)].len());
+    }
+}
@@ -0,0 +1,84 @@
+use std::{
+    collections::HashMap,
+    sync::{Arc, RwLock},
+};
+
+/// A compact identifier for a lowercase file name from a [PartInterner].
+pub type PartId = u32;
+
+/// Assigns a [PartId] to each unique file name ignoring case.
+///
+/// The ids are shared by all threads walking the same scene.
+/// Looking up a previously seen spelling of a name doesn't allocate or convert case.
+#[derive(Debug, Default)]
+pub struct PartInterner {
+    inner: RwLock<Interned>,
+}
+
+#[derive(Debug, Default)]
+struct Interned {
+    /// The id for each file name as written in subfile reference commands.
+    ids: HashMap<String, PartId>,
+    /// The id for each lowercase file name.
+    lowercase_ids: HashMap<Arc<str>, PartId>,
+    /// The lowercase file name for each id.
+    names: Vec<Arc<str>>,
+}
+
+impl PartInterner {
+    /// The id for the lowercase version of `filename`.
+    pub fn intern(&self, filename: &str) -> PartId {
+        if let Some(id) = self.inner.read().unwrap().ids.get(filename) {
+            return *id;
+        }
+
+        let mut inner = self.inner.write().unwrap();
+        let Interned {
+            ids,
+            lowercase_ids,
+            names,
+        } = &mut *inner;
+
+        // Another thread may have added the name since releasing the read lock.
+        if let Some(id) = ids.get(filename) {
+            return *id;
+        }
+
+        let name: Arc<str> = filename.to_lowercase().into();
+        let id = *lowercase_ids.entry(name.clone()).or_insert_with(|| {
+            names.push(name);
+            names.len() as PartId - 1
+        });
+        ids.insert(filename.to_string(), id);
+        id
+    }
+
+    /// The lowercase file name for `id`.
+    pub fn name(&self, id: PartId) -> Arc<str> {
+        self.inner.read().unwrap().names[id as usize].clone()
+    }
+
+    /// The lowercase file name for each id indexed by id.
+    pub fn names(&self) -> Vec<String> {
+        let inner = self.inner.read().unwrap();
+        inner.names.iter().map(|n| n.to_string()).collect()
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn intern_ignores_case() {
+        let interner = PartInterner::default();
+        assert_eq!(0, interner.intern("3001.dat"));
+        assert_eq!(1, interner.intern("Sub.ldr"));
+        assert_eq!(0, interner.intern("3001.DAT"));
+        assert_eq!(1, interner.intern("sub.ldr"));
+        assert_eq!(1, interner.intern("Sub.ldr"));
+
+        assert_eq!("sub.ldr", &*interner.name(1));
+        assert_eq!(vec!["3001.dat", "sub.ldr"], interner.names());
+    }
+}
@@ -1,18 +1,34 @@
 use std::{
-    collections::HashMap,
+    collections::{HashMap, HashSet},
     fs::File,
     io::{BufReader, Read},
     path::{Path, PathBuf},
+    sync::Mutex,
 };
 
-use geometry::create_geometry;
+use bounds::{file_bounds, Bounds};
+use dedup::{
+    deduplicate_geometry, deduplicate_textures, rename_instance_geometry, rename_node_geometry,
+};
+use filter::{is_included, step_commands};
+use geometry::{create_geometry_removed_faces, create_preview_geometry};
 use glam::{vec4, Mat4, Vec3};
+use instanced::{load_instances, LocalInstances};
+use intern::{PartId, PartInterner};
+use memory::{load_with_budget, projected_bytes};
+use mpd::MpdResolver;
 use rayon::prelude::*;
 use weldr::{Command, FileRefResolver, ResolveError};
 
+pub use bvh::InstanceBvh;
 pub use color::{load_color_table, LDrawColor};
-pub use geometry::{LDrawGeometry, LDrawTextureInfo};
+pub use geometry::{LDrawGeometry, LDrawStudLogoInfo, LDrawTextureInfo, RemovedFaces};
 pub use glam;
+pub use memory::{DeduplicationReport, Degradation, LoadStage, MemoryReport, StageMemory};
+pub use node_table::LDrawNodeTable;
+pub use packed::LDrawScenePacked;
+pub use scan::{scan_file, GeometryEstimate, SceneStats};
+pub use stud_logo::{bake_stud_logo, StudLogoMap};
 pub use weldr::Color;
 use zip::ZipArchive;
 
@@ -21,10 +37,26 @@ pub type ColorCode = u32;
 // Special color code that "inherits" the existing color.
 const CURRENT_COLOR: ColorCode = 16;
 
+mod bounds;
+mod bvh;
 mod color;
+mod dedup;
 mod edge_split;
+mod filter;
 mod geometry;
+mod instanced;
+mod intern;
+mod memory;
+mod mpd;
+mod node_table;
+mod normals;
+mod packed;
+mod scan;
 mod slope;
+mod stud_logo;
+#[cfg(test)]
+mod test_utils;
+mod topology;
 
 pub struct LDrawNode {
     pub name: String,
@@ -36,10 +68,20 @@ pub struct LDrawNode {
     /// Overrides colors in the geometry if present.
     pub current_color: ColorCode,
     pub children: Vec<LDrawNode>,
+    /// The key in [submodels](struct.LDrawScene.html#structfield.submodels)
+    /// for the children of this node or `None` if the children are stored in the node.
+    pub submodel: Option<(String, ColorCode)>,
 }
 
 struct DiskResolver {
     base_paths: Vec<PathBuf>,
+    /// The primitive folders checked for other resolutions with [PrimitiveResolution::Adaptive].
+    primitive_paths: Vec<PathBuf>,
+    /// The names of files resolved from `primitive_paths` since the last call to
+    /// [parse_primitive_variants].
+    resolved_primitives: Mutex<Vec<String>>,
+    /// The names of files that couldn't be found in any of the `base_paths`.
+    missing_files: Mutex<Vec<String>>,
 }
 
 impl DiskResolver {
@@ -49,6 +91,14 @@ impl DiskResolver {
         resolution: PrimitiveResolution,
     ) -> Self {
         let catalog_path = catalog_path.as_ref().to_owned();
+        let primitive_paths = if resolution == PrimitiveResolution::Adaptive {
+            vec![
+                catalog_path.join("p"),
+                catalog_path.join("UnOfficial").join("p"),
+            ]
+        } else {
+            Vec::new()
+        };
         let mut base_paths = vec![
             catalog_path.join("p"),
             catalog_path.join("parts"),
@@ -63,6 +113,8 @@ impl DiskResolver {
             PrimitiveResolution::Low => base_paths.insert(0, catalog_path.join("p").join("8")),
             PrimitiveResolution::Normal => (),
             PrimitiveResolution::High => base_paths.insert(0, catalog_path.join("p").join("48")),
+            // All resolutions are loaded using their folder like "48\4-4cyli.dat".
+            PrimitiveResolution::Adaptive => (),
         }
 
         // Users may want to specify additional folders for parts.
@@ -70,7 +122,12 @@ impl DiskResolver {
             base_paths.push(path.as_ref().to_owned());
         }
 
-        Self { base_paths }
+        Self {
+            base_paths,
+            primitive_paths,
+            resolved_primitives: Mutex::new(Vec::new()),
+            missing_files: Mutex::new(Vec::new()),
+        }
     }
 }
 
@@ -78,17 +135,32 @@ impl FileRefResolver for DiskResolver {
     fn resolve<P: AsRef<Path>>(&self, filename: P) -> Result<Vec<u8>, ResolveError> {
         let filename = filename.as_ref();
 
+        // References to files in subfolders use backslashes like "48\4-4cyli.dat".
+        let path = PathBuf::from(filename.to_string_lossy().replace('\\', "/"));
+
         // Find the first folder that contains the given file.
         let contents = self
             .base_paths
             .iter()
-            .find_map(|prefix| std::fs::read(prefix.join(filename)).ok());
+            .find_map(|prefix| Some((prefix, std::fs::read(prefix.join(&path)).ok()?)));
 
         match contents {
-            Some(contents) => Ok(contents),
+            Some((prefix, contents)) => {
+                if self.primitive_paths.contains(prefix) {
+                    self.resolved_primitives
+                        .lock()
+                        .unwrap()
+                        .push(filename.to_string_lossy().into_owned());
+                }
+                Ok(contents)
+            }
             None => {
                 // TODO: Is there a better way to allow partial imports with resolve errors?
                 println!("Error resolving {filename:?}");
+                self.missing_files
+                    .lock()
+                    .unwrap()
+                    .push(filename.to_string_lossy().into_owned());
                 Ok(Vec::new())
             }
         }
@@ -140,12 +212,50 @@ impl IoFileResolver {
 pub struct LDrawScene {
     pub root_node: LDrawNode,
     pub geometry_cache: HashMap<String, LDrawGeometry>,
+    /// The node hierarchy for each submodel and color with an identity transform.
+    /// This is empty unless [instance_submodels](struct.GeometrySettings.html#structfield.instance_submodels) is enabled.
+    pub submodels: HashMap<(String, ColorCode), LDrawNode>,
+    /// PNG-encoded images referenced by
+    /// [texture_ids](struct.LDrawTextureInfo.html#structfield.texture_ids) in the geometry.
+    pub textures: Vec<Vec<u8>>,
+    /// The faces removed from each geometry by name before deduplication.
+    /// Geometry without any removed faces is not included.
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
 }
 
 pub struct LDrawSceneInstanced {
     pub main_model_name: String,
     pub geometry_world_transforms: HashMap<(String, ColorCode), Vec<Mat4>>,
     pub geometry_cache: HashMap<String, LDrawGeometry>,
+    /// PNG-encoded images referenced by
+    /// [texture_ids](struct.LDrawTextureInfo.html#structfield.texture_ids) in the geometry.
+    pub textures: Vec<Vec<u8>>,
+    /// The faces removed from each geometry by name before deduplication.
+    /// Geometry without any removed faces is not included.
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
+}
+
+/// The instances for multiple models sharing the same geometry.
+pub struct LDrawBatchInstanced {
+    /// The instances for each model in the same order as the input paths.
+    pub models: Vec<LDrawModelInstances>,
+    pub geometry_cache: HashMap<String, LDrawGeometry>,
+    /// PNG-encoded images referenced by
+    /// [texture_ids](struct.LDrawTextureInfo.html#structfield.texture_ids) in the geometry.
+    pub textures: Vec<Vec<u8>>,
+    /// The faces removed from each geometry by name before deduplication.
+    /// Geometry without any removed faces is not included.
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
+}
+
+pub struct LDrawModelInstances {
+    pub main_model_name: String,
+    /// The world transforms for each geometry in
+    /// [geometry_cache](struct.LDrawBatchInstanced.html#structfield.geometry_cache) and color.
+    pub geometry_world_transforms: HashMap<(String, ColorCode), Vec<Mat4>>,
 }
 
 pub struct LDrawSceneInstancedPoints {
@@ -153,6 +263,13 @@ pub struct LDrawSceneInstancedPoints {
     /// Decomposed instance transforms for unique part and color.
     pub geometry_point_instances: HashMap<(String, ColorCode), PointInstances>,
     pub geometry_cache: HashMap<String, LDrawGeometry>,
+    /// PNG-encoded images referenced by
+    /// [texture_ids](struct.LDrawTextureInfo.html#structfield.texture_ids) in the geometry.
+    pub textures: Vec<Vec<u8>>,
+    /// The faces removed from each geometry by name before deduplication.
+    /// Geometry without any removed faces is not included.
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
 }
 
 #[derive(Debug, PartialEq)]
@@ -174,6 +291,10 @@ pub enum StudType {
     Logo4,
     /// Studs with black sides similar to official LEGO instructions.
     HighContrast,
+    /// The default stud model with UVs for the stud tops.
+    /// The logo can be applied as a shared texture from [bake_stud_logo]
+    /// for less geometry than [StudType::Logo4].
+    LogoNormalMap,
 }
 
 impl Default for StudType {
@@ -190,6 +311,10 @@ pub enum PrimitiveResolution {
     Normal,
     /// Primitives in the `p/48` folder.
     High,
+    /// Choose between [PrimitiveResolution::Low], [PrimitiveResolution::Normal],
+    /// and [PrimitiveResolution::High] for each primitive reference based on its size.
+    /// This uses high resolution only for large curved surfaces like dishes and round bricks.
+    Adaptive,
 }
 
 impl Default for PrimitiveResolution {
@@ -198,8 +323,28 @@ impl Default for PrimitiveResolution {
     }
 }
 
+/// Options for only loading part of a model.
+/// The default filter loads the entire model.
+#[derive(Debug, Default, Clone, PartialEq)]
+pub struct LoadFilter {
+    /// Only load geometry from these files and their subfiles if not empty.
+    /// Names are compared case insensitively.
+    pub submodel_names: Vec<String>,
+    /// Only load the steps of the main model in the inclusive range `[first, last]`.
+    /// Steps are separated by `0 STEP` or `0 ROTSTEP` and start from 1.
+    pub step_range: Option<[u32; 2]>,
+    /// Only load geometry whose bounds intersect these world space bounds `[min, max]` in LDraw units.
+    pub bounds: Option<[Vec3; 2]>,
+}
+
+impl LoadFilter {
+    pub fn is_empty(&self) -> bool {
+        self.submodel_names.is_empty() && self.step_range.is_none() && self.bounds.is_none()
+    }
+}
+
 // TODO: Come up with a better name.
-#[derive(Debug)]
+#[derive(Debug, Clone)]
 pub struct GeometrySettings {
     pub triangulate: bool,
     pub add_gap_between_parts: bool,
@@ -207,6 +352,35 @@ pub struct GeometrySettings {
     pub weld_vertices: bool, // TODO: default to true?
     pub primitive_resolution: PrimitiveResolution,
     pub scene_scale: f32,
+    /// Calculate normals for each face corner from the line type 2 edges
+    /// instead of splitting vertices along the edges.
+    pub corner_normals: bool,
+    /// Calculate unique edges and remove faces with repeated vertices.
+    /// This avoids needing to validate and calculate edges in applications like Blender.
+    pub calculate_edges: bool,
+    /// Remove faces with repeated vertices, zero area faces,
+    /// and faces that duplicate another face with the same or opposite winding.
+    pub remove_degenerate_faces: bool,
+    /// Combine geometry with identical data under different names
+    /// like aliases or copied MPD submodels.
+    /// References to removed geometry use the smallest name with the same data.
+    pub deduplicate_geometry: bool,
+    /// Store the hierarchy for each submodel and color once in [LDrawScene]
+    /// instead of in every node referencing the submodel.
+    pub instance_submodels: bool,
+    /// Skip parts of the model before creating any geometry.
+    /// Submodels are not instanced if the filter is not empty.
+    pub filter: LoadFilter,
+    /// The maximum size in bytes for the geometry and instances of the loaded scene.
+    /// Scenes over budget are reloaded with lower primitive resolution and plain studs
+    /// before replacing the smallest parts with bounding boxes.
+    /// See [MemoryReport] for the steps taken.
+    pub memory_budget: Option<usize>,
+    /// Create a box for the bounds of each part instead of the full part geometry.
+    /// The bounds are much faster to calculate for quickly previewing large models.
+    /// Geometry is not deduplicated, so each box keeps the name of its part
+    /// for replacing it with the full geometry later.
+    pub preview: bool,
 }
 
 impl Default for GeometrySettings {
@@ -218,6 +392,14 @@ impl Default for GeometrySettings {
             weld_vertices: Default::default(),
             primitive_resolution: Default::default(),
             scene_scale: 1.0,
+            corner_normals: false,
+            calculate_edges: false,
+            remove_degenerate_faces: false,
+            deduplicate_geometry: false,
+            instance_submodels: false,
+            filter: LoadFilter::default(),
+            memory_budget: None,
+            preview: false,
         }
     }
 }
@@ -230,7 +412,7 @@ fn replace_color(color: ColorCode, current_color: ColorCode) -> ColorCode {
     }
 }
 
-#[derive(Debug)]
+#[derive(Debug, Clone, Copy)]
 struct GeometryInitDescriptor<'a> {
     source_file: &'a weldr::SourceFile,
     current_color: ColorCode,
@@ -245,26 +427,83 @@ pub fn load_file(
     additional_paths: &[&str],
     settings: &GeometrySettings,
 ) -> LDrawScene {
-    let (source_map, main_model_name) = parse_file(path, ldraw_path, additional_paths, settings);
+    let (mut scene, memory) = load_with_budget(
+        settings,
+        |settings| parse_file(path, ldraw_path, additional_paths, settings),
+        |(source_map, main_model_name), settings| {
+            projected_bytes(source_map, std::slice::from_ref(main_model_name), settings)
+        },
+        |(source_map, main_model_name), settings| {
+            load_scene(&source_map, main_model_name, settings)
+        },
+    );
+    scene.memory = memory;
+    scene
+}
+
+fn load_scene(
+    source_map: &weldr::SourceMap,
+    main_model_name: String,
+    settings: &GeometrySettings,
+) -> LDrawScene {
     let source_file = source_map.get(&main_model_name).unwrap();
 
     // Collect the scene hierarchy and geometry descriptors.
+    let interner = PartInterner::default();
     let mut geometry_descriptors = HashMap::new();
-    let root_node = load_node(
+    let mut submodels = HashMap::new();
+    let mut root_node = load_node(
         source_file,
         &main_model_name,
         &Mat4::IDENTITY,
-        &source_map,
+        &Mat4::IDENTITY,
+        source_map,
         &mut geometry_descriptors,
+        &mut submodels,
+        &mut HashMap::new(),
         CURRENT_COLOR,
+        false,
+        settings.filter.step_range,
+        &interner,
         settings,
     );
 
-    let geometry_cache = create_geometry_cache(geometry_descriptors, &source_map, settings);
+    // Only convert ids back to names once for each unique file.
+    let names = interner.names();
+    let geometry_descriptors = geometry_descriptors
+        .into_iter()
+        .map(|(id, descriptor)| (names[id as usize].clone(), descriptor))
+        .collect();
+    let mut submodels: HashMap<_, _> = submodels
+        .into_iter()
+        .map(|((id, color), node)| ((names[id as usize].clone(), color), node))
+        .collect();
+
+    let (mut geometry_cache, removed_faces) =
+        create_geometry_cache(geometry_descriptors, source_map, settings);
+
+    // Parts with the same bounds would share a box, so don't deduplicate previews.
+    let mut deduplication = DeduplicationReport::default();
+    if settings.deduplicate_geometry && !settings.preview {
+        deduplication = deduplicate_geometry(&mut geometry_cache);
+        rename_node_geometry(&mut root_node, &deduplication.canonical_names);
+        for node in submodels.values_mut() {
+            rename_node_geometry(node, &deduplication.canonical_names);
+        }
+    }
+
+    let textures = deduplicate_textures(&mut geometry_cache, &mut deduplication);
 
     LDrawScene {
         root_node,
         geometry_cache,
+        submodels,
+        textures,
+        removed_faces,
+        memory: MemoryReport {
+            deduplication,
+            ..Default::default()
+        },
     }
 }
 
@@ -275,29 +514,132 @@ fn parse_file(
     additional_paths: &[&str],
     settings: &GeometrySettings,
 ) -> (weldr::SourceMap, String) {
-    let mut resolver = DiskResolver::new_from_library(
-        ldraw_path,
-        additional_paths.iter().cloned(),
-        settings.primitive_resolution,
-    );
-    // Resolve paths relative to the current file.
-    if let Some(parent) = Path::new(path).parent() {
-        resolver.base_paths.insert(0, parent.to_owned());
-    }
+    let (source_map, mut main_model_names, _) =
+        parse_files(&[path], ldraw_path, additional_paths, settings, false);
+    (source_map, main_model_names.remove(0))
+}
 
+/// Parse all files into the same source map so that shared files are only parsed once.
+/// Returns the main model name for each path and the sorted names of any missing files.
+///
+/// If `namespace_local_files` is `true`, the names of files embedded in or next to each model
+/// are prefixed with the model path as described in [MpdResolver::new_namespaced].
+#[tracing::instrument]
+fn parse_files(
+    paths: &[&str],
+    ldraw_path: &str,
+    additional_paths: &[&str],
+    settings: &GeometrySettings,
+    namespace_local_files: bool,
+) -> (weldr::SourceMap, Vec<String>, Vec<String>) {
     let mut source_map = weldr::SourceMap::new();
-    ensure_studs(settings, &resolver, &mut source_map);
+    let mut main_model_names = Vec::new();
+    let mut parsed_primitives = HashSet::new();
+    let mut missing_files = Vec::new();
+
+    for (i, path) in paths.iter().enumerate() {
+        let mut resolver = DiskResolver::new_from_library(
+            ldraw_path,
+            additional_paths.iter().cloned(),
+            settings.primitive_resolution,
+        );
+        // Resolve paths relative to the current file.
+        if let Some(parent) = Path::new(path).parent() {
+            resolver.base_paths.insert(0, parent.to_owned());
+        }
+
+        if i == 0 {
+            ensure_studs(settings, &resolver, &mut source_map);
+        }
+
+        let is_io = Path::new(path).extension() == Some("io".as_ref());
+
+        let resolver = if is_io {
+            let io_resolver = IoFileResolver::new(path.to_string(), resolver).unwrap();
+            let contents = &io_resolver.model_ldr;
+            main_model_names.push(parse_model(
+                path,
+                contents,
+                &io_resolver,
+                &mut source_map,
+                namespace_local_files,
+            ));
+            io_resolver.resolver
+        } else {
+            let contents = resolver.resolve(path).unwrap();
+            main_model_names.push(parse_model(
+                path,
+                &contents,
+                &resolver,
+                &mut source_map,
+                namespace_local_files,
+            ));
+            resolver
+        };
+
+        if settings.primitive_resolution == PrimitiveResolution::Adaptive {
+            parse_primitive_variants(&resolver, &mut source_map, &mut parsed_primitives);
+        }
+
+        missing_files.append(&mut resolver.missing_files.lock().unwrap());
+    }
 
-    let is_io = Path::new(path).extension() == Some("io".as_ref());
+    missing_files.sort();
+    missing_files.dedup();
 
-    let main_model_name = if is_io {
-        let io_resolver = IoFileResolver::new(path.to_owned(), resolver).unwrap();
-        weldr::parse(path, &io_resolver, &mut source_map).unwrap()
+    (source_map, main_model_names, missing_files)
+}
+
+/// Parse the model at `path` with `contents` and return the name of the main model.
+/// Files embedded in multi-part documents are only parsed if they are referenced.
+fn parse_model<R: FileRefResolver>(
+    path: &str,
+    contents: &[u8],
+    resolver: &R,
+    source_map: &mut weldr::SourceMap,
+    namespace_local_files: bool,
+) -> String {
+    let (resolver, main_model_name) = if namespace_local_files {
+        MpdResolver::new_namespaced(path, contents, resolver)
     } else {
-        weldr::parse(path, &resolver, &mut source_map).unwrap()
+        MpdResolver::new(path, contents, resolver)
     };
+    weldr::parse(&main_model_name, &resolver, source_map).unwrap()
+}
 
-    (source_map, main_model_name)
+/// Parse the low and high resolution versions of all primitives resolved so far.
+/// Geometry can then choose a resolution for each reference
+/// since each version has a different name like "8\4-4cyli.dat" or "48\4-4cyli.dat".
+fn parse_primitive_variants(
+    resolver: &DiskResolver,
+    source_map: &mut weldr::SourceMap,
+    parsed: &mut HashSet<String>,
+) {
+    // Parsing the variants can resolve additional primitives.
+    loop {
+        let names = std::mem::take(&mut *resolver.resolved_primitives.lock().unwrap());
+        if names.is_empty() {
+            break;
+        }
+
+        for name in names {
+            // Files in subfolders are already a specific resolution.
+            if name.contains(['\\', '/']) || !parsed.insert(name.clone()) {
+                continue;
+            }
+
+            for folder in ["8", "48"] {
+                let has_variant = resolver
+                    .primitive_paths
+                    .iter()
+                    .any(|path| path.join(folder).join(&name).is_file());
+                if has_variant {
+                    let variant = format!("{folder}\\{name}");
+                    weldr::parse(variant.as_str(), resolver, source_map).unwrap();
+                }
+            }
+        }
+    }
 }
 
 fn ensure_studs(
@@ -317,40 +659,62 @@ fn load_node<'a>(
     source_file: &'a weldr::SourceFile,
     filename: &str,
     transform: &Mat4,
+    world_transform: &Mat4,
     source_map: &'a weldr::SourceMap,
-    geometry_descriptors: &mut HashMap<String, GeometryInitDescriptor<'a>>,
+    geometry_descriptors: &mut HashMap<PartId, GeometryInitDescriptor<'a>>,
+    submodels: &mut HashMap<(PartId, ColorCode), LDrawNode>,
+    bounds_cache: &mut HashMap<String, Option<Bounds>>,
     current_color: ColorCode,
+    parent_included: bool,
+    step_range: Option<[u32; 2]>,
+    interner: &PartInterner,
     settings: &GeometrySettings,
 ) -> LDrawNode {
     let mut children = Vec::new();
     let mut geometry_name = None;
 
+    let included = is_included(&settings.filter, filename, parent_included);
+
     if is_part(source_file, filename) || has_geometry(source_file) {
         // Create geometry if the node is a part.
         // Use the special color code to reuse identical parts in different colors.
-        geometry_descriptors
-            .entry(filename.to_lowercase())
-            .or_insert_with(|| GeometryInitDescriptor {
+        let id = interner.intern(filename);
+        let name = interner.name(id);
+        if included
+            && is_in_bounds(
                 source_file,
-                current_color: CURRENT_COLOR,
-                recursive: true,
-            });
-
-        geometry_name = Some(filename.to_lowercase());
+                &name,
+                world_transform,
+                source_map,
+                bounds_cache,
+                settings,
+            )
+        {
+            geometry_descriptors
+                .entry(id)
+                .or_insert_with(|| GeometryInitDescriptor {
+                    source_file,
+                    current_color: CURRENT_COLOR,
+                    recursive: true,
+                });
+
+            geometry_name = Some(name.to_string());
+        }
     } else if has_geometry(source_file) {
         // Just add geometry for this node.
         // Use the current color at this node since this geometry might not be referenced elsewhere.
+        let id = interner.intern(filename);
         geometry_descriptors
-            .entry(filename.to_lowercase())
+            .entry(id)
             .or_insert_with(|| GeometryInitDescriptor {
                 source_file,
                 current_color,
                 recursive: false,
             });
 
-        geometry_name = Some(filename.to_lowercase());
+        geometry_name = Some(interner.name(id).to_string());
     } else {
-        for cmd in &source_file.cmds {
+        for cmd in step_commands(&source_file.cmds, step_range) {
             if let Command::SubFileRef(sfr_cmd) = cmd {
                 if let Some(subfile) = source_map.get(&sfr_cmd.file) {
                     // Don't apply node transforms to preserve the scene hierarchy.
@@ -360,16 +724,63 @@ fn load_node<'a>(
                     // Handle replacing colors.
                     let child_color = replace_color(sfr_cmd.color, current_color);
 
-                    let child_node = load_node(
-                        subfile,
-                        &sfr_cmd.file,
-                        &child_transform,
-                        source_map,
-                        geometry_descriptors,
-                        child_color,
-                        settings,
-                    );
-                    children.push(child_node);
+                    // Filtered hierarchies depend on the world transform and parent.
+                    let instance_submodels =
+                        settings.instance_submodels && settings.filter.is_empty();
+
+                    let child_node = if instance_submodels && is_submodel(subfile, &sfr_cmd.file) {
+                        // Only create the hierarchy once for each submodel and color.
+                        let id = interner.intern(&sfr_cmd.file);
+                        let key = (id, child_color);
+                        if !submodels.contains_key(&key) {
+                            let submodel = load_node(
+                                subfile,
+                                &sfr_cmd.file,
+                                &Mat4::IDENTITY,
+                                &Mat4::IDENTITY,
+                                source_map,
+                                geometry_descriptors,
+                                submodels,
+                                bounds_cache,
+                                child_color,
+                                included,
+                                None,
+                                interner,
+                                settings,
+                            );
+                            submodels.insert(key, submodel);
+                        }
+
+                        LDrawNode {
+                            name: sfr_cmd.file.to_string(),
+                            transform: scaled_transform(&child_transform, settings.scene_scale),
+                            geometry_name: None,
+                            current_color: child_color,
+                            children: Vec::new(),
+                            submodel: Some((interner.name(id).to_string(), child_color)),
+                        }
+                    } else {
+                        load_node(
+                            subfile,
+                            &sfr_cmd.file,
+                            &child_transform,
+                            &(*world_transform * child_transform),
+                            source_map,
+                            geometry_descriptors,
+                            submodels,
+                            bounds_cache,
+                            child_color,
+                            included,
+                            None,
+                            interner,
+                            settings,
+                        )
+                    };
+
+                    // Skip nodes with all of their geometry removed by the filter.
+                    if settings.filter.is_empty() || !is_empty_node(&child_node) {
+                        children.push(child_node);
+                    }
                 }
             }
         }
@@ -383,6 +794,47 @@ fn load_node<'a>(
         geometry_name,
         current_color,
         children,
+        submodel: None,
+    }
+}
+
+fn is_empty_node(node: &LDrawNode) -> bool {
+    node.geometry_name.is_none() && node.children.is_empty() && node.submodel.is_none()
+}
+
+/// Returns `true` if the bounds of the file with the given world transform
+/// intersect the filter bounds or if there are no filter bounds.
+fn is_in_bounds(
+    source_file: &weldr::SourceFile,
+    name: &str,
+    world_transform: &Mat4,
+    source_map: &weldr::SourceMap,
+    bounds_cache: &mut HashMap<String, Option<Bounds>>,
+    settings: &GeometrySettings,
+) -> bool {
+    settings.filter.bounds.is_none()
+        || intersects_filter_bounds(
+            file_bounds(source_file, name, source_map, bounds_cache),
+            world_transform,
+            settings,
+        )
+}
+
+/// Returns `true` if `bounds` with the given world transform
+/// intersect the filter bounds or if there are no filter bounds.
+fn intersects_filter_bounds(
+    bounds: Option<Bounds>,
+    world_transform: &Mat4,
+    settings: &GeometrySettings,
+) -> bool {
+    match settings.filter.bounds {
+        Some([min, max]) => bounds
+            .map(|b| {
+                b.transform(world_transform)
+                    .intersects(&Bounds::new(min, max))
+            })
+            .unwrap_or_default(),
+        None => true,
     }
 }
 
@@ -391,10 +843,27 @@ fn create_geometry_cache(
     geometry_descriptors: HashMap<String, GeometryInitDescriptor>,
     source_map: &weldr::SourceMap,
     settings: &GeometrySettings,
-) -> HashMap<String, LDrawGeometry> {
+) -> (
+    HashMap<String, LDrawGeometry>,
+    HashMap<String, RemovedFaces>,
+) {
+    if settings.preview {
+        // Bounds are cached for shared subfiles, so this is fast even on one thread.
+        let mut bounds_cache = HashMap::new();
+        let geometry_cache = geometry_descriptors
+            .into_iter()
+            .map(|(name, descriptor)| {
+                let bounds =
+                    file_bounds(descriptor.source_file, &name, source_map, &mut bounds_cache);
+                (name, create_preview_geometry(bounds, settings))
+            })
+            .collect();
+        return (geometry_cache, HashMap::new());
+    }
+
     // Create the actual geometry in parallel to improve performance.
     // TODO: The workload is incredibly uneven across threads.
-    geometry_descriptors
+    let geometry: Vec<_> = geometry_descriptors
         .into_par_iter()
         .map(|(name, descriptor)| {
             let GeometryInitDescriptor {
@@ -403,7 +872,7 @@ fn create_geometry_cache(
                 recursive,
             } = descriptor;
 
-            let geometry = create_geometry(
+            let (geometry, removed_faces) = create_geometry_removed_faces(
                 source_file,
                 source_map,
                 &name,
@@ -412,9 +881,19 @@ fn create_geometry_cache(
                 settings,
             );
 
-            (name, geometry)
+            (name, geometry, removed_faces)
         })
-        .collect()
+        .collect();
+
+    let mut geometry_cache = HashMap::new();
+    let mut removed_faces = HashMap::new();
+    for (name, geometry, removed) in geometry {
+        if removed.total_count() > 0 {
+            removed_faces.insert(name.clone(), removed);
+        }
+        geometry_cache.insert(name, geometry);
+    }
+    (geometry_cache, removed_faces)
 }
 
 fn scaled_transform(transform: &Mat4, scale: f32) -> Mat4 {
@@ -447,6 +926,9 @@ pub fn load_file_instanced_points(
         main_model_name: scene.main_model_name,
         geometry_point_instances,
         geometry_cache: scene.geometry_cache,
+        textures: scene.textures,
+        removed_faces: scene.removed_faces,
+        memory: scene.memory,
     }
 }
 
@@ -479,6 +961,20 @@ fn geometry_point_instances(transforms: Vec<Mat4>) -> PointInstances {
     }
 }
 
+/// Find the world transforms for each geometry like [load_file_instanced]
+/// but pack all geometry and instance data into contiguous buffers.
+/// This avoids allocating many small buffers for scenes with many unique parts.
+#[tracing::instrument]
+pub fn load_file_instanced_packed(
+    path: &str,
+    ldraw_path: &str,
+    additional_paths: &[&str],
+    settings: &GeometrySettings,
+) -> LDrawScenePacked {
+    let scene = load_file_instanced(path, ldraw_path, additional_paths, settings);
+    scene.into()
+}
+
 // TODO: Also instance studs to reduce memory usage?
 /// Find the world transforms for each geometry.
 /// This allows applications to more easily use instancing.
@@ -490,112 +986,268 @@ pub fn load_file_instanced(
     additional_paths: &[&str],
     settings: &GeometrySettings,
 ) -> LDrawSceneInstanced {
-    let (source_map, main_model_name) = parse_file(path, ldraw_path, additional_paths, settings);
+    let (mut scene, memory) = load_with_budget(
+        settings,
+        |settings| parse_file(path, ldraw_path, additional_paths, settings),
+        |(source_map, main_model_name), settings| {
+            projected_bytes(source_map, std::slice::from_ref(main_model_name), settings)
+        },
+        |(source_map, main_model_name), settings| {
+            load_scene_instanced(&source_map, main_model_name, settings)
+        },
+    );
+    scene.memory = memory;
+    scene
+}
+
+fn load_scene_instanced(
+    source_map: &weldr::SourceMap,
+    main_model_name: String,
+    settings: &GeometrySettings,
+) -> LDrawSceneInstanced {
     let source_file = source_map.get(&main_model_name).unwrap();
 
     // Find the world transforms for each geometry.
     // This allows applications to more easily use instancing.
-    let mut geometry_descriptors = HashMap::new();
-    let mut geometry_world_transforms = HashMap::new();
-    load_node_instanced(
+    // Submodels can be referenced many times, so only walk each submodel once.
+    let interner = PartInterner::default();
+    let cache = Mutex::new(HashMap::new());
+    let instances = load_instances(
         source_file,
-        &main_model_name,
-        &Mat4::IDENTITY,
-        &source_map,
-        &mut geometry_descriptors,
-        &mut geometry_world_transforms,
+        interner.intern(&main_model_name),
+        source_map,
         CURRENT_COLOR,
-        settings,
+        false,
+        settings.filter.step_range,
+        &settings.filter,
+        &interner,
+        &cache,
     );
 
-    let geometry_cache = create_geometry_cache(geometry_descriptors, &source_map, settings);
+    let transforms = world_transforms(&instances, source_map, &interner, settings);
+
+    // Only create geometry with at least one instance remaining.
+    let instanced_ids: HashSet<_> = transforms.keys().map(|(id, _)| *id).collect();
+    let names = interner.names();
+    let geometry_descriptors = instances
+        .geometry_descriptors
+        .iter()
+        .filter(|(id, _)| instanced_ids.contains(id))
+        .map(|(id, descriptor)| (names[*id as usize].clone(), *descriptor))
+        .collect();
+    let mut geometry_world_transforms = named_transforms(transforms, &names);
+
+    let (mut geometry_cache, removed_faces) =
+        create_geometry_cache(geometry_descriptors, source_map, settings);
+
+    let mut deduplication = DeduplicationReport::default();
+    if settings.deduplicate_geometry && !settings.preview {
+        deduplication = deduplicate_geometry(&mut geometry_cache);
+        geometry_world_transforms =
+            rename_instance_geometry(geometry_world_transforms, &deduplication.canonical_names);
+    }
+
+    let textures = deduplicate_textures(&mut geometry_cache, &mut deduplication);
 
     LDrawSceneInstanced {
         main_model_name,
         geometry_world_transforms,
         geometry_cache,
+        textures,
+        removed_faces,
+        memory: MemoryReport {
+            deduplication,
+            ..Default::default()
+        },
     }
 }
 
-// TODO: Share code with the non instanced function?
-fn load_node_instanced<'a>(
-    source_file: &'a weldr::SourceFile,
-    filename: &str,
-    world_transform: &Mat4,
-    source_map: &'a weldr::SourceMap,
-    geometry_descriptors: &mut HashMap<String, GeometryInitDescriptor<'a>>,
-    geometry_world_transforms: &mut HashMap<(String, ColorCode), Vec<Mat4>>,
-    current_color: ColorCode,
+/// Apply the filter bounds and scene scale to the instance transforms.
+fn world_transforms(
+    instances: &LocalInstances,
+    source_map: &weldr::SourceMap,
+    interner: &PartInterner,
     settings: &GeometrySettings,
-) {
-    // TODO: Find a way to avoid repetition.
-    let is_part = is_part(source_file, filename);
-    if is_part {
-        // Create geometry if the node is a part.
-        // Use the special color code to reuse identical parts in different colors.
-        geometry_descriptors
-            .entry(filename.to_lowercase())
-            .or_insert_with(|| GeometryInitDescriptor {
-                source_file,
-                current_color: CURRENT_COLOR,
-                recursive: true,
-            });
+) -> HashMap<(PartId, ColorCode), Vec<Mat4>> {
+    // Instances are shared between transforms, so check bounds for the final world transforms.
+    // Bounds are cached for shared subfiles, so find them once before filtering in parallel.
+    let mut bounds_cache = HashMap::new();
+    let geometry_bounds: HashMap<_, _> = if settings.filter.bounds.is_some() {
+        instances
+            .geometry_descriptors
+            .iter()
+            .map(|(id, descriptor)| {
+                let name = interner.name(*id);
+                let bounds =
+                    file_bounds(descriptor.source_file, &name, source_map, &mut bounds_cache);
+                (*id, bounds)
+            })
+            .collect()
+    } else {
+        HashMap::new()
+    };
 
-        // Add another instance of the current geometry.
-        // Also key by the color in case a part appears in multiple colors.
-        geometry_world_transforms
-            .entry((filename.to_lowercase(), current_color))
-            .or_default()
-            .push(scaled_transform(world_transform, settings.scene_scale));
-    } else if has_geometry(source_file) {
-        // Just add geometry for this node.
-        // Use the current color at this node since this geometry might not be referenced elsewhere.
-        geometry_descriptors
-            .entry(filename.to_lowercase())
-            .or_insert_with(|| GeometryInitDescriptor {
+    instances
+        .geometry_transforms()
+        .into_par_iter()
+        .filter_map(|((id, color), transforms)| {
+            let bounds = geometry_bounds.get(&id).copied().flatten();
+            let transforms: Vec<_> = transforms
+                .iter()
+                .filter(|t| intersects_filter_bounds(bounds, t, settings))
+                .map(|t| scaled_transform(t, settings.scene_scale))
+                .collect();
+
+            (!transforms.is_empty()).then_some(((id, color), transforms))
+        })
+        .collect()
+}
+
+/// Replace the part ids in the keys with the names from [PartInterner::names].
+fn named_transforms<T>(
+    transforms: HashMap<(PartId, ColorCode), T>,
+    names: &[String],
+) -> HashMap<(String, ColorCode), T> {
+    transforms
+        .into_iter()
+        .map(|((id, color), t)| ((names[id as usize].clone(), color), t))
+        .collect()
+}
+
+/// Find the world transforms for each geometry in each model like [load_file_instanced]
+/// but share the parsed files and geometry between all models.
+/// Models are processed in parallel.
+///
+/// Library files are shared by name, but files embedded in or next to each model
+/// are kept separate by prefixing their names with the model path like "model.mpd:wheel.ldr".
+/// Models with submodels or custom parts with the same name don't conflict.
+#[tracing::instrument]
+pub fn load_files_instanced(
+    paths: &[&str],
+    ldraw_path: &str,
+    additional_paths: &[&str],
+    settings: &GeometrySettings,
+) -> LDrawBatchInstanced {
+    let (mut batch, memory) = load_with_budget(
+        settings,
+        |settings| {
+            let (source_map, main_model_names, _) =
+                parse_files(paths, ldraw_path, additional_paths, settings, true);
+            (source_map, main_model_names)
+        },
+        |(source_map, main_model_names), settings| {
+            projected_bytes(source_map, main_model_names, settings)
+        },
+        |(source_map, main_model_names), settings| {
+            load_batch_instanced(paths, &source_map, main_model_names, settings)
+        },
+    );
+    batch.memory = memory;
+    batch
+}
+
+fn load_batch_instanced(
+    paths: &[&str],
+    source_map: &weldr::SourceMap,
+    main_model_names: Vec<String>,
+    settings: &GeometrySettings,
+) -> LDrawBatchInstanced {
+    // Submodels and parts used by multiple models are only walked once.
+    let interner = PartInterner::default();
+    let cache = Mutex::new(HashMap::new());
+    let instances: Vec<_> = main_model_names
+        .par_iter()
+        .map(|name| {
+            let source_file = source_map.get(name).unwrap();
+            load_instances(
                 source_file,
-                current_color,
-                recursive: false,
-            });
+                interner.intern(name),
+                source_map,
+                CURRENT_COLOR,
+                false,
+                settings.filter.step_range,
+                &settings.filter,
+                &interner,
+                &cache,
+            )
+        })
+        .collect();
 
-        // Add another instance of the current geometry.
-        // Also key by the color in case a part appears in multiple colors.
-        geometry_world_transforms
-            .entry((filename.to_lowercase(), current_color))
-            .or_default()
-            .push(scaled_transform(world_transform, settings.scene_scale));
+    let transforms: Vec<_> = instances
+        .iter()
+        .map(|instances| world_transforms(instances, source_map, &interner, settings))
+        .collect();
+
+    // Only create geometry with at least one instance remaining in any model.
+    let instanced_ids: HashSet<_> = transforms
+        .iter()
+        .flat_map(|t| t.keys().map(|(id, _)| *id))
+        .collect();
+    let names = interner.names();
+    let mut geometry_descriptors = HashMap::new();
+    for (id, descriptor) in instances.iter().flat_map(|i| &i.geometry_descriptors) {
+        if instanced_ids.contains(id) {
+            geometry_descriptors
+                .entry(names[*id as usize].clone())
+                .or_insert(*descriptor);
+        }
     }
 
-    // Recursion is already handled for parts.
-    if !is_part {
-        for cmd in &source_file.cmds {
-            if let Command::SubFileRef(sfr_cmd) = cmd {
-                if let Some(subfile) = source_map.get(&sfr_cmd.file) {
-                    // Accumulate transforms.
-                    let child_transform = *world_transform * sfr_cmd.matrix();
+    let mut models: Vec<_> = paths
+        .iter()
+        .zip(main_model_names)
+        .zip(transforms)
+        .map(|((path, main_model_name), transforms)| {
+            // Report the name from the file without the namespace.
+            let prefix = format!("{path}:");
+            LDrawModelInstances {
+                main_model_name: main_model_name
+                    .strip_prefix(&prefix)
+                    .map_or(main_model_name.clone(), str::to_string),
+                geometry_world_transforms: named_transforms(transforms, &names),
+            }
+        })
+        .collect();
 
-                    // Handle replacing colors.
-                    let child_color = replace_color(sfr_cmd.color, current_color);
+    let (mut geometry_cache, removed_faces) =
+        create_geometry_cache(geometry_descriptors, source_map, settings);
 
-                    load_node_instanced(
-                        subfile,
-                        &sfr_cmd.file,
-                        &child_transform,
-                        source_map,
-                        geometry_descriptors,
-                        geometry_world_transforms,
-                        child_color,
-                        settings,
-                    );
-                }
-            }
+    let mut deduplication = DeduplicationReport::default();
+    if settings.deduplicate_geometry && !settings.preview {
+        deduplication = deduplicate_geometry(&mut geometry_cache);
+        for model in &mut models {
+            model.geometry_world_transforms = rename_instance_geometry(
+                std::mem::take(&mut model.geometry_world_transforms),
+                &deduplication.canonical_names,
+            );
         }
     }
+
+    let textures = deduplicate_textures(&mut geometry_cache, &mut deduplication);
+
+    LDrawBatchInstanced {
+        models,
+        geometry_cache,
+        textures,
+        removed_faces,
+        memory: MemoryReport {
+            deduplication,
+            ..Default::default()
+        },
+    }
 }
 
 fn is_part(_source_file: &weldr::SourceFile, filename: &str) -> bool {
     // TODO: Check the part type rather than the extension.
-    filename.to_lowercase().ends_with(".dat")
+    // Compare without converting case since this is checked for every node.
+    filename
+        .get(filename.len().saturating_sub(4)..)
+        .map_or(false, |extension| extension.eq_ignore_ascii_case(".dat"))
+}
+
+fn is_submodel(source_file: &weldr::SourceFile, filename: &str) -> bool {
+    // Nodes for parts and files with geometry don't have children.
+    !is_part(source_file, filename) && !has_geometry(source_file)
 }
 
 fn has_geometry(source_file: &weldr::SourceFile) -> bool {
@@ -650,4 +1302,57 @@ mod tests {
             vec![vec3(1.0, 1.0, 1.0), vec3(-1.0, 1.0, 1.0)]
         );
     }
+
+    #[test]
+    fn load_files_instanced_same_submodel_names() {
+        let folder = std::env::temp_dir().join("ldr_tools_same_submodel_names");
+        std::fs::create_dir_all(folder.join("ldraw").join("parts")).unwrap();
+        std::fs::write(
+            folder.join("ldraw").join("parts").join("a.dat"),
+            "3 16 0 0 0 1 0 0 0 1 0\n",
+        )
+        .unwrap();
+
+        // Both models have a submodel named "sub.ldr" with different contents.
+        let model = |color, x| {
+            format!(
+                "0 FILE main.ldr\n\
+                 1 16 0 0 0 1 0 0 0 1 0 0 0 1 sub.ldr\n\
+                 0 FILE sub.ldr\n\
+                 1 {color} {x} 0 0 1 0 0 0 1 0 0 0 1 a.dat\n"
+            )
+        };
+        let path1 = folder.join("one.mpd");
+        let path2 = folder.join("two.mpd");
+        std::fs::write(&path1, model(4, 1.0)).unwrap();
+        std::fs::write(&path2, model(1, 2.0)).unwrap();
+
+        let batch = load_files_instanced(
+            &[path1.to_str().unwrap(), path2.to_str().unwrap()],
+            folder.join("ldraw").to_str().unwrap(),
+            &[],
+            &GeometrySettings::default(),
+        );
+
+        assert_eq!(
+            vec!["a.dat"],
+            batch.geometry_cache.keys().collect::<Vec<_>>()
+        );
+        assert_eq!("main.ldr", batch.models[0].main_model_name);
+        assert_eq!(
+            HashMap::from([(
+                ("a.dat".to_string(), 4),
+                vec![Mat4::from_translation(vec3(1.0, 0.0, 0.0))]
+            )]),
+            batch.models[0].geometry_world_transforms
+        );
+        assert_eq!("main.ldr", batch.models[1].main_model_name);
+        assert_eq!(
+            HashMap::from([(
+                ("a.dat".to_string(), 1),
+                vec![Mat4::from_translation(vec3(2.0, 0.0, 0.0))]
+            )]),
+            batch.models[1].geometry_world_transforms
+        );
+    }
 }
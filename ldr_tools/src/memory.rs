@@ -0,0 +1,717 @@
+use std::{
+    collections::{HashMap, HashSet},
+    mem::{size_of, size_of_val},
+};
+
+use glam::{Mat4, Vec3};
+
+use rayon::prelude::*;
+use weldr::Command;
+
+use crate::{
+    scan::scan_source_map, topology::face_edges, ColorCode, GeometryEstimate, GeometrySettings,
+    LDrawBatchInstanced, LDrawGeometry, LDrawNode, LDrawScene, LDrawSceneInstanced,
+    PrimitiveResolution, StudType, CURRENT_COLOR,
+};
+
+/// The estimated memory usage for a loaded scene.
+#[derive(Debug, Default, Clone, PartialEq)]
+pub struct MemoryReport {
+    /// The size in bytes of each geometry in the geometry cache.
+    pub geometry_bytes: HashMap<String, usize>,
+    /// The total size in bytes of the unique encoded texture images in the scene.
+    pub texture_bytes: usize,
+    /// The size in bytes of the scene nodes or instance transforms.
+    pub instance_bytes: usize,
+    /// The memory in use after each step of loading in order.
+    pub stages: Vec<StageMemory>,
+    /// The largest [total_bytes](struct.StageMemory.html#structfield.total_bytes) of any stage.
+    /// This includes the parsed files, so it is usually larger than the final size.
+    pub peak_bytes: usize,
+    /// The steps applied in order to fit within the
+    /// [memory_budget](struct.GeometrySettings.html#structfield.memory_budget).
+    pub degradations: Vec<Degradation>,
+    /// The geometry replaced by bounding boxes in order of increasing size.
+    pub proxy_geometry_names: Vec<String>,
+    /// The geometry removed by
+    /// [deduplicate_geometry](struct.GeometrySettings.html#structfield.deduplicate_geometry)
+    /// and the texture images shared between geometry.
+    pub deduplication: DeduplicationReport,
+}
+
+impl MemoryReport {
+    /// The total size in bytes of geometry, textures, and instances for the final scene.
+    pub fn total_bytes(&self) -> usize {
+        self.geometry_bytes.values().sum::<usize>() + self.texture_bytes + self.instance_bytes
+    }
+
+    /// Record the memory in use after `stage` and update the peak.
+    pub fn add_stage(&mut self, stage: LoadStage, bytes: usize, total_bytes: usize) {
+        self.stages.push(StageMemory {
+            stage,
+            bytes,
+            total_bytes,
+        });
+        self.peak_bytes = self.peak_bytes.max(total_bytes);
+    }
+}
+
+/// The memory in use after a step of loading a scene.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct StageMemory {
+    pub stage: LoadStage,
+    /// The size in bytes of the data created by this stage.
+    pub bytes: usize,
+    /// The size in bytes of all data still in use after this stage.
+    pub total_bytes: usize,
+}
+
+/// A step of loading a scene in the order the steps are applied.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum LoadStage {
+    /// The parsed files in the source map.
+    /// This repeats if a [Degradation] requires parsing again.
+    Parse,
+    /// The scene nodes or instance transforms.
+    Instances,
+    /// The geometry cache.
+    Geometry,
+    /// The encoded texture images.
+    Textures,
+    /// The geometry cache after replacing parts with bounding boxes.
+    /// The parsed files are no longer in use.
+    Proxies,
+    /// The contiguous buffers of [LDrawScenePacked](crate::LDrawScenePacked),
+    /// which replace the geometry cache and instance transforms.
+    Packed,
+    /// Copies of the packed buffers converted to other array types like numpy arrays.
+    Arrays,
+}
+
+/// The data removed for having the same contents as other data in the scene.
+#[derive(Debug, Default, Clone, PartialEq)]
+pub struct DeduplicationReport {
+    /// The canonical name in the geometry cache for each removed geometry name.
+    pub canonical_names: HashMap<String, String>,
+    /// The total size in bytes of the removed geometry.
+    pub saved_geometry_bytes: usize,
+    /// The number of texture images shared with another geometry.
+    pub merged_texture_count: usize,
+    /// The total size in bytes of the shared texture images.
+    pub saved_texture_bytes: usize,
+}
+
+impl DeduplicationReport {
+    /// The number of geometry names merged into another geometry.
+    pub fn merged_geometry_count(&self) -> usize {
+        self.canonical_names.len()
+    }
+}
+
+/// A step for reducing memory usage when a scene is over budget.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Degradation {
+    /// Use [PrimitiveResolution::Low].
+    LowPrimitiveResolution,
+    /// Replace logo studs with [StudType::Normal].
+    PlainStuds,
+    /// Replace the geometry for the smallest parts with bounding boxes.
+    BoundingBoxProxies,
+}
+
+pub trait ParsedMemory {
+    fn source_map_bytes(&self) -> usize;
+}
+
+impl ParsedMemory for (weldr::SourceMap, String) {
+    fn source_map_bytes(&self) -> usize {
+        source_map_bytes(&self.0, std::slice::from_ref(&self.1))
+    }
+}
+
+impl ParsedMemory for (weldr::SourceMap, Vec<String>) {
+    fn source_map_bytes(&self) -> usize {
+        source_map_bytes(&self.0, &self.1)
+    }
+}
+
+pub trait SceneMemory {
+    fn memory(&mut self) -> &mut MemoryReport;
+
+    fn geometry_cache(&mut self) -> &mut HashMap<String, LDrawGeometry>;
+
+    fn textures(&self) -> &[Vec<u8>];
+
+    fn instance_bytes(&self) -> usize;
+}
+
+impl SceneMemory for LDrawScene {
+    fn memory(&mut self) -> &mut MemoryReport {
+        &mut self.memory
+    }
+
+    fn geometry_cache(&mut self) -> &mut HashMap<String, LDrawGeometry> {
+        &mut self.geometry_cache
+    }
+
+    fn textures(&self) -> &[Vec<u8>] {
+        &self.textures
+    }
+
+    fn instance_bytes(&self) -> usize {
+        node_bytes(&self.root_node)
+            + self
+                .submodels
+                .iter()
+                .map(|((name, _), node)| name.len() + node_bytes(node))
+                .sum::<usize>()
+    }
+}
+
+impl SceneMemory for LDrawSceneInstanced {
+    fn memory(&mut self) -> &mut MemoryReport {
+        &mut self.memory
+    }
+
+    fn geometry_cache(&mut self) -> &mut HashMap<String, LDrawGeometry> {
+        &mut self.geometry_cache
+    }
+
+    fn textures(&self) -> &[Vec<u8>] {
+        &self.textures
+    }
+
+    fn instance_bytes(&self) -> usize {
+        transforms_bytes(&self.geometry_world_transforms)
+    }
+}
+
+impl SceneMemory for LDrawBatchInstanced {
+    fn memory(&mut self) -> &mut MemoryReport {
+        &mut self.memory
+    }
+
+    fn geometry_cache(&mut self) -> &mut HashMap<String, LDrawGeometry> {
+        &mut self.geometry_cache
+    }
+
+    fn textures(&self) -> &[Vec<u8>] {
+        &self.textures
+    }
+
+    fn instance_bytes(&self) -> usize {
+        self.models
+            .iter()
+            .map(|m| transforms_bytes(&m.geometry_world_transforms))
+            .sum()
+    }
+}
+
+fn node_bytes(node: &LDrawNode) -> usize {
+    size_of::<LDrawNode>()
+        + node.name.len()
+        + node.geometry_name.as_ref().map_or(0, String::len)
+        + node.children.iter().map(node_bytes).sum::<usize>()
+}
+
+fn transforms_bytes<K>(transforms: &HashMap<(String, K), Vec<Mat4>>) -> usize {
+    transforms
+        .iter()
+        .map(|((name, _), t)| name.len() + size_of_val(t.as_slice()))
+        .sum()
+}
+
+/// Parse a scene, degrade the settings one step at a time until the projected size
+/// fits within the memory budget if present, and then load the scene once.
+///
+/// The parsed files and the projected size from `project` are checked before creating
+/// any geometry, so degrading only repeats parsing when the primitive resolution changes.
+/// If the loaded scene is still over budget, the smallest parts are replaced with boxes.
+pub fn load_with_budget<P: ParsedMemory, T: SceneMemory>(
+    settings: &GeometrySettings,
+    parse: impl Fn(&GeometrySettings) -> P,
+    project: impl Fn(&P, &GeometrySettings) -> usize,
+    load: impl FnOnce(P, &GeometrySettings) -> T,
+) -> (T, MemoryReport) {
+    let mut settings = settings.clone();
+    let mut report = MemoryReport::default();
+
+    let mut parsed = parse(&settings);
+    let mut source_map_bytes = parsed.source_map_bytes();
+    report.add_stage(LoadStage::Parse, source_map_bytes, source_map_bytes);
+
+    if let Some(budget) = settings.memory_budget {
+        loop {
+            // The parsed files are still in use while creating the scene.
+            let projected_bytes = source_map_bytes + project(&parsed, &settings);
+            if projected_bytes <= budget {
+                break;
+            }
+
+            let Some(degradation) = degrade(&mut settings) else {
+                break;
+            };
+            tracing::warn!(
+                projected_bytes,
+                budget,
+                ?degradation,
+                "scene projected over memory budget"
+            );
+            report.degradations.push(degradation);
+
+            // Lower resolution primitives are different files.
+            // Free the previous files first to avoid keeping both in memory.
+            if degradation == Degradation::LowPrimitiveResolution {
+                drop(parsed);
+                parsed = parse(&settings);
+                source_map_bytes = parsed.source_map_bytes();
+                report.add_stage(LoadStage::Parse, source_map_bytes, source_map_bytes);
+            }
+        }
+    }
+
+    let mut scene = load(parsed, &settings);
+    report.deduplication = std::mem::take(&mut scene.memory().deduplication);
+
+    // The parsed files are freed at the end of loading,
+    // so the peak is after creating the last data for the scene.
+    let instance_bytes = scene.instance_bytes();
+    let geometry_bytes = scene
+        .geometry_cache()
+        .values()
+        .map(LDrawGeometry::size_in_bytes)
+        .sum::<usize>();
+    let texture_bytes = scene.textures().iter().map(Vec::len).sum::<usize>();
+    let mut total_bytes = source_map_bytes;
+    for (stage, bytes) in [
+        (LoadStage::Instances, instance_bytes),
+        (LoadStage::Geometry, geometry_bytes),
+        (LoadStage::Textures, texture_bytes),
+    ] {
+        total_bytes += bytes;
+        report.add_stage(stage, bytes, total_bytes);
+    }
+    let scene_bytes = total_bytes - source_map_bytes;
+
+    // Projected sizes are estimates, so check the loaded scene as well.
+    if let Some(budget) = settings.memory_budget.filter(|b| scene_bytes > *b) {
+        let max_geometry_bytes = budget.saturating_sub(texture_bytes + instance_bytes);
+        report.proxy_geometry_names =
+            replace_with_proxies(scene.geometry_cache(), max_geometry_bytes, &settings);
+        if !report.proxy_geometry_names.is_empty() {
+            let degradation = Degradation::BoundingBoxProxies;
+            tracing::warn!(
+                total_bytes = scene_bytes,
+                budget,
+                ?degradation,
+                proxy_count = report.proxy_geometry_names.len(),
+                "scene over memory budget"
+            );
+            report.degradations.push(degradation);
+
+            let geometry_bytes = scene
+                .geometry_cache()
+                .values()
+                .map(LDrawGeometry::size_in_bytes)
+                .sum::<usize>();
+            report.add_stage(
+                LoadStage::Proxies,
+                geometry_bytes,
+                geometry_bytes + texture_bytes + instance_bytes,
+            );
+        }
+    }
+
+    report.geometry_bytes = scene
+        .geometry_cache()
+        .iter()
+        .map(|(name, g)| (name.clone(), g.size_in_bytes()))
+        .collect();
+    report.texture_bytes = texture_bytes;
+    report.instance_bytes = instance_bytes;
+    tracing::debug!(
+        total_bytes = report.total_bytes(),
+        peak_bytes = report.peak_bytes,
+        "memory report"
+    );
+
+    (scene, report)
+}
+
+/// The projected size in bytes of the geometry, textures, and instance transforms
+/// for the models in `source_map` like [scan_file](crate::scan_file).
+///
+/// Geometry used by multiple models is only counted once.
+/// Vertex counts from [GeometryEstimate] are an upper bound,
+/// so this usually overestimates the size of welded or deduplicated geometry.
+/// Textures use the decoded size of the images in `PE_TEX_INFO` commands.
+pub fn projected_bytes(
+    source_map: &weldr::SourceMap,
+    main_model_names: &[String],
+    settings: &GeometrySettings,
+) -> usize {
+    let stats: Vec<_> = main_model_names
+        .par_iter()
+        .map(|name| scan_source_map(source_map, name, settings))
+        .collect();
+
+    let mut estimates = HashMap::new();
+    for stats in &stats {
+        estimates.extend(stats.part_estimates.iter());
+    }
+    let geometry_bytes: usize = estimates
+        .values()
+        .map(|e| estimated_geometry_bytes(e, settings))
+        .sum();
+
+    let instance_count: usize = stats.iter().flat_map(|s| s.instance_counts.values()).sum();
+
+    // Textures shared between models are counted for each model.
+    let texture_bytes: usize = stats.iter().map(|s| s.texture_bytes).sum();
+
+    geometry_bytes + texture_bytes + instance_count * size_of::<Mat4>()
+}
+
+/// The approximate size in bytes of the parsed files used by the models in `source_map`.
+fn source_map_bytes(source_map: &weldr::SourceMap, main_model_names: &[String]) -> usize {
+    let mut visited = HashSet::new();
+    let mut names: Vec<String> = main_model_names.to_vec();
+    let mut bytes = 0;
+    while let Some(name) = names.pop() {
+        if !visited.insert(name.to_lowercase()) {
+            continue;
+        }
+        let Some(source_file) = source_map.get(&name) else {
+            continue;
+        };
+
+        bytes += size_of_val(source_file.cmds.as_slice());
+        for cmd in &source_file.cmds {
+            match cmd {
+                Command::SubFileRef(sfr_cmd) => {
+                    bytes += sfr_cmd.file.len();
+                    // Include the low and high resolution primitives used for loading.
+                    for folder in ["8", "48"] {
+                        names.push(format!("{folder}\\{}", sfr_cmd.file));
+                    }
+                    names.push(sfr_cmd.file.clone());
+                }
+                Command::Comment(c) => bytes += c.text.len(),
+                _ => (),
+            }
+        }
+    }
+    bytes
+}
+
+/// The size in bytes of [LDrawGeometry] with at most the estimated number of faces and vertices.
+fn estimated_geometry_bytes(estimate: &GeometryEstimate, settings: &GeometrySettings) -> usize {
+    // Quads count as two triangles, so this is also an upper bound for the face count.
+    let faces = estimate.triangles;
+    let corners = estimate.vertices;
+
+    // Vertices, vertex indices, and the start, size, color, stud, and grainy flags for faces.
+    let mut bytes = corners * (size_of::<Vec3>() + size_of::<u32>())
+        + faces * (2 * size_of::<u32>() + size_of::<ColorCode>() + 2 * size_of::<bool>());
+    if settings.corner_normals {
+        bytes += corners * (size_of::<Vec3>() + size_of::<bool>());
+    }
+    if settings.calculate_edges {
+        // Each corner has one edge, so there are at most as many edges as corners.
+        bytes += corners * size_of::<u32>() + corners * size_of::<[u32; 2]>();
+    }
+    bytes
+}
+
+fn degrade(settings: &mut GeometrySettings) -> Option<Degradation> {
+    if settings.primitive_resolution != PrimitiveResolution::Low {
+        settings.primitive_resolution = PrimitiveResolution::Low;
+        Some(Degradation::LowPrimitiveResolution)
+    } else if settings.stud_type == StudType::Logo4 {
+        settings.stud_type = StudType::Normal;
+        Some(Degradation::PlainStuds)
+    } else {
+        None
+    }
+}
+
+/// Replace geometry with bounding boxes starting from the smallest bounding box
+/// until the total size is at most `max_bytes`.
+/// Returns the names of the replaced geometry.
+fn replace_with_proxies(
+    geometry_cache: &mut HashMap<String, LDrawGeometry>,
+    max_bytes: usize,
+    settings: &GeometrySettings,
+) -> Vec<String> {
+    let mut total_bytes: usize = geometry_cache.values().map(|g| g.size_in_bytes()).sum();
+
+    let mut candidates: Vec<_> = geometry_cache
+        .iter()
+        .filter_map(|(name, g)| {
+            let (min, max) = vertex_bounds(&g.vertices)?;
+            Some((name.clone(), (max - min).max(Vec3::ZERO)))
+        })
+        .collect();
+    // Sort by name for a consistent order for parts with the same size.
+    candidates.sort_by(|(n1, d1), (n2, d2)| {
+        let volume = |d: &Vec3| d.x * d.y * d.z;
+        volume(d1).total_cmp(&volume(d2)).then(n1.cmp(n2))
+    });
+
+    let mut names = Vec::new();
+    for (name, _) in candidates {
+        if total_bytes <= max_bytes {
+            break;
+        }
+
+        let geometry = geometry_cache.get_mut(&name).unwrap();
+        let proxy = bounding_box_geometry(geometry, settings);
+        let (old_bytes, new_bytes) = (geometry.size_in_bytes(), proxy.size_in_bytes());
+        if new_bytes < old_bytes {
+            *geometry = proxy;
+            total_bytes -= old_bytes - new_bytes;
+            names.push(name);
+        }
+    }
+    names
+}
+
+fn vertex_bounds(vertices: &[Vec3]) -> Option<(Vec3, Vec3)> {
+    let min = vertices.iter().copied().reduce(Vec3::min)?;
+    let max = vertices.iter().copied().reduce(Vec3::max)?;
+    Some((min, max))
+}
+
+/// A box covering the vertices of `geometry` using the same optional attributes.
+fn bounding_box_geometry(geometry: &LDrawGeometry, settings: &GeometrySettings) -> LDrawGeometry {
+    let (min, max) = vertex_bounds(&geometry.vertices).unwrap_or_default();
+
+    // Keep the color if all faces share a color.
+    let face_color = match geometry.face_colors.as_slice() {
+        [color] => *color,
+        _ => CURRENT_COLOR,
+    };
+
+    box_geometry(min, max, face_color, settings)
+}
+
+/// A box from `min` to `max` with the optional attributes enabled in `settings`.
+pub(crate) fn box_geometry(
+    min: Vec3,
+    max: Vec3,
+    face_color: ColorCode,
+    settings: &GeometrySettings,
+) -> LDrawGeometry {
+    // Corner i uses the max for x, y, and z if bits 0, 1, and 2 are set.
+    let vertices = (0..8)
+        .map(|i| {
+            Vec3::select(
+                glam::BVec3::new(i & 1 != 0, i & 2 != 0, i & 4 != 0),
+                max,
+                min,
+            )
+        })
+        .collect();
+
+    // Faces wind counterclockwise when viewed from outside the box.
+    let quads: [([u32; 4], Vec3); 6] = [
+        ([0, 4, 6, 2], Vec3::NEG_X),
+        ([1, 3, 7, 5], Vec3::X),
+        ([0, 1, 5, 4], Vec3::NEG_Y),
+        ([2, 6, 7, 3], Vec3::Y),
+        ([0, 2, 3, 1], Vec3::NEG_Z),
+        ([4, 5, 7, 6], Vec3::Z),
+    ];
+    let faces: Vec<(Vec<u32>, Vec3)> = if settings.triangulate {
+        quads
+            .iter()
+            .flat_map(|([a, b, c, d], n)| [(vec![*a, *b, *c], *n), (vec![*a, *c, *d], *n)])
+            .collect()
+    } else {
+        quads.iter().map(|(q, n)| (q.to_vec(), *n)).collect()
+    };
+
+    let vertex_indices: Vec<_> = faces.iter().flat_map(|(f, _)| f.clone()).collect();
+    let face_sizes: Vec<_> = faces.iter().map(|(f, _)| f.len() as u32).collect();
+    let face_start_indices: Vec<_> = face_sizes
+        .iter()
+        .scan(0, |start, size| {
+            let face_start = *start;
+            *start += size;
+            Some(face_start)
+        })
+        .collect();
+
+    let (corner_normals, is_corner_edge_sharp) = if settings.corner_normals {
+        (
+            faces
+                .iter()
+                .flat_map(|(f, n)| std::iter::repeat(*n).take(f.len()))
+                .collect(),
+            vec![true; vertex_indices.len()],
+        )
+    } else {
+        (Vec::new(), Vec::new())
+    };
+
+    let (edges, corner_edges) = if settings.calculate_edges {
+        face_edges(&vertex_indices, &face_start_indices, &face_sizes)
+    } else {
+        (Vec::new(), Vec::new())
+    };
+
+    LDrawGeometry {
+        vertices,
+        vertex_indices,
+        face_start_indices,
+        face_sizes,
+        face_colors: vec![face_color],
+        is_face_stud: vec![false; faces.len()],
+        edge_line_indices: Vec::new(),
+        corner_normals,
+        is_corner_edge_sharp,
+        edges,
+        corner_edges,
+        has_grainy_slopes: false,
+        is_face_grainy: Vec::new(),
+        texture_info: None,
+        stud_logo_info: None,
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use glam::vec3;
+
+    fn geometry(vertices: Vec<Vec3>) -> LDrawGeometry {
+        let count = vertices.len() as u32;
+        LDrawGeometry {
+            vertices,
+            vertex_indices: (0..count).collect(),
+            face_start_indices: (0..count / 3).map(|i| i * 3).collect(),
+            face_sizes: vec![3; count as usize / 3],
+            face_colors: vec![4],
+            is_face_stud: vec![false; count as usize / 3],
+            ..Default::default()
+        }
+    }
+
+    #[test]
+    fn bounding_box_geometry_quads() {
+        let proxy = bounding_box_geometry(
+            &geometry(vec![Vec3::ZERO, vec3(1.0, 2.0, 3.0), Vec3::X]),
+            &GeometrySettings::default(),
+        );
+        assert_eq!(8, proxy.vertices.len());
+        assert_eq!(vec3(1.0, 2.0, 3.0), proxy.vertices[7]);
+        assert_eq!(vec![4; 6], proxy.face_sizes);
+        assert_eq!(vec![0, 4, 8, 12, 16, 20], proxy.face_start_indices);
+        assert_eq!(vec![4], proxy.face_colors);
+    }
+
+    #[test]
+    fn replace_with_proxies_smallest_first() {
+        // Large triangle lists that are bigger than a box.
+        let small = geometry((0..300).map(|i| Vec3::splat(i as f32 * 0.01)).collect());
+        let large = geometry((0..300).map(|i| Vec3::splat(i as f32)).collect());
+        let mut geometry_cache = [
+            ("large.dat".to_string(), large),
+            ("small.dat".to_string(), small),
+        ]
+        .into();
+
+        let total: usize = geometry_cache
+            .values()
+            .map(LDrawGeometry::size_in_bytes)
+            .sum();
+
+        let names = replace_with_proxies(&mut geometry_cache, total - 1, &Default::default());
+        assert_eq!(vec!["small.dat".to_string()], names);
+        assert_eq!(8, geometry_cache["small.dat"].vertices.len());
+        assert_eq!(300, geometry_cache["large.dat"].vertices.len());
+    }
+
+    impl ParsedMemory for usize {
+        fn source_map_bytes(&self) -> usize {
+            *self
+        }
+    }
+
+    #[test]
+    fn load_with_budget_projected() {
+        let settings = GeometrySettings {
+            stud_type: StudType::Logo4,
+            memory_budget: Some(100),
+            ..Default::default()
+        };
+
+        // Only the final settings are loaded, and studs don't need to parse again.
+        let parse_count = std::cell::Cell::new(0);
+        let (scene, report) = load_with_budget(
+            &settings,
+            |settings| {
+                parse_count.set(parse_count.get() + 1);
+                match settings.primitive_resolution {
+                    PrimitiveResolution::Low => 20usize,
+                    _ => 30,
+                }
+            },
+            |_, settings| match settings.stud_type {
+                StudType::Logo4 => 200,
+                _ => 50,
+            },
+            |_, settings| {
+                assert_eq!(PrimitiveResolution::Low, settings.primitive_resolution);
+                assert_eq!(StudType::Normal, settings.stud_type);
+                LDrawSceneInstanced {
+                    main_model_name: "main.ldr".to_string(),
+                    geometry_world_transforms: HashMap::new(),
+                    geometry_cache: HashMap::new(),
+                    textures: Vec::new(),
+                    removed_faces: HashMap::new(),
+                    memory: MemoryReport::default(),
+                }
+            },
+        );
+
+        assert_eq!(2, parse_count.get());
+        assert_eq!("main.ldr", scene.main_model_name);
+        assert_eq!(
+            vec![Degradation::LowPrimitiveResolution, Degradation::PlainStuds],
+            report.degradations
+        );
+        assert_eq!(
+            vec![
+                StageMemory {
+                    stage: LoadStage::Parse,
+                    bytes: 30,
+                    total_bytes: 30
+                },
+                StageMemory {
+                    stage: LoadStage::Parse,
+                    bytes: 20,
+                    total_bytes: 20
+                },
+                StageMemory {
+                    stage: LoadStage::Instances,
+                    bytes: 0,
+                    total_bytes: 20
+                },
+                StageMemory {
+                    stage: LoadStage::Geometry,
+                    bytes: 0,
+                    total_bytes: 20
+                },
+                StageMemory {
+                    stage: LoadStage::Textures,
+                    bytes: 0,
+                    total_bytes: 20
+                },
+            ],
+            report.stages
+        );
+        assert_eq!(30, report.peak_bytes);
+    }
+}
@@ -0,0 +1,449 @@
+use std::{
+    collections::HashMap,
+    ops::Range,
+    path::{Path, PathBuf},
+    sync::Mutex,
+};
+
+use weldr::{FileRefResolver, ResolveError};
+
+/// An embedded file in a multi-part document (MPD).
+#[derive(Debug, PartialEq)]
+pub struct MpdChunk {
+    /// The name from the `0 FILE` line.
+    pub name: String,
+    /// The byte range of the lines after the `0 FILE` line.
+    pub range: Range<usize>,
+}
+
+/// Find the files separated by `0 FILE` and `0 NOFILE` lines in the order they appear.
+///
+/// Comments and meta commands before the first `0 FILE` line are ignored.
+/// Returns an empty list if `contents` has any other commands before the first `0 FILE` line
+/// since this isn't a multi-part document.
+pub fn split_mpd(contents: &[u8]) -> Vec<MpdChunk> {
+    let mut chunks = Vec::new();
+    let mut current: Option<(String, usize)> = None;
+
+    let mut offset = if contents.starts_with("\u{FEFF}".as_bytes()) {
+        3
+    } else {
+        0
+    };
+    for line in contents[offset..].split_inclusive(|b| *b == b'\n') {
+        let line_start = offset;
+        offset += line.len();
+
+        match file_command(line) {
+            Some(FileCommand::File(name)) => {
+                if let Some((name, start)) = current.take() {
+                    chunks.push(MpdChunk {
+                        name,
+                        range: start..line_start,
+                    });
+                }
+                current = Some((name, offset));
+            }
+            Some(FileCommand::NoFile) => {
+                if let Some((name, start)) = current.take() {
+                    chunks.push(MpdChunk {
+                        name,
+                        range: start..line_start,
+                    });
+                }
+            }
+            None => {
+                if chunks.is_empty() && current.is_none() && !is_blank_or_meta(line) {
+                    return Vec::new();
+                }
+            }
+        }
+    }
+
+    if let Some((name, start)) = current {
+        chunks.push(MpdChunk {
+            name,
+            range: start..contents.len(),
+        });
+    }
+
+    chunks
+}
+
+fn is_blank_or_meta(line: &[u8]) -> bool {
+    // Line type 0 is for comments and meta commands like "0 // comment" or "0 Author: name".
+    let mut bytes = line.iter().skip_while(|b| b.is_ascii_whitespace());
+    match bytes.next() {
+        None => true,
+        Some(b'0') => bytes.next().map_or(true, |b| b.is_ascii_whitespace()),
+        Some(_) => false,
+    }
+}
+
+enum FileCommand {
+    File(String),
+    NoFile,
+}
+
+fn file_command(line: &[u8]) -> Option<FileCommand> {
+    // Avoid converting most lines to text since this runs for every line.
+    if line.iter().find(|b| !b.is_ascii_whitespace()) != Some(&b'0') {
+        return None;
+    }
+
+    let text = std::str::from_utf8(line).ok()?.trim();
+    let command = text.strip_prefix('0')?.trim_start();
+    if command == "NOFILE" {
+        return Some(FileCommand::NoFile);
+    }
+
+    // Names can contain spaces like "0 FILE Main Model.ldr".
+    let name = command.strip_prefix("FILE")?;
+    if !name.starts_with(char::is_whitespace) {
+        return None;
+    }
+    Some(FileCommand::File(name.trim().to_string()))
+}
+
+/// Find the byte offset and name of the file for a subfile reference line
+/// like "1 16 0 0 0 1 0 0 0 1 0 0 0 1 a.dat".
+fn subfile_name(line: &[u8]) -> Option<(usize, &str)> {
+    // Avoid converting most lines to text like file_command.
+    if line.iter().find(|b| !b.is_ascii_whitespace()) != Some(&b'1') {
+        return None;
+    }
+
+    // Skip the line type, color, and 12 transform values.
+    let text = std::str::from_utf8(line).ok()?;
+    let mut rest = text;
+    for _ in 0..14 {
+        rest = rest.trim_start();
+        rest = &rest[rest.find(char::is_whitespace)?..];
+    }
+
+    let rest = rest.trim_start();
+    let name = rest.trim_end();
+    (!name.is_empty()).then_some((text.len() - rest.len(), name))
+}
+
+/// Resolves the files embedded in a model from its contents and other files with `resolver`.
+///
+/// Embedded files of multi-part documents are only parsed if they are referenced
+/// instead of parsing the whole document at once.
+/// Parsing still happens on a single thread, since weldr only adds files to a
+/// [SourceMap](weldr::SourceMap) while parsing and can't insert files parsed separately.
+/// The model is read into memory once and each embedded file is only copied when parsed,
+/// so memory mapping the file wouldn't avoid much copying.
+pub struct MpdResolver<'a, R> {
+    contents: &'a [u8],
+    /// The byte range in `contents` for each lowercase file name.
+    files: HashMap<String, Range<usize>>,
+    resolver: &'a R,
+    namespace: Option<Namespace>,
+}
+
+/// The files local to a model when parsing multiple models into the same source map.
+struct Namespace {
+    /// The prefix added to the names of local files like "model.mpd:".
+    prefix: String,
+    /// The folder of the model for finding local files on disk.
+    folder: PathBuf,
+    /// Cached results for checking if a referenced name is a local file.
+    is_local: Mutex<HashMap<String, bool>>,
+}
+
+impl<'a, R: FileRefResolver> MpdResolver<'a, R> {
+    /// Create a resolver for the model at `path` and the name of its main model.
+    ///
+    /// The main model is the first file in a multi-part document
+    /// or `path` itself for other files.
+    pub fn new(path: &str, contents: &'a [u8], resolver: &'a R) -> (Self, String) {
+        Self::with_namespace(path, contents, resolver, None)
+    }
+
+    /// Create a resolver like [MpdResolver::new] that adds the prefix `"{path}:"` to the names
+    /// of embedded files and files in the same folder as `path` like "model.mpd:wheel.ldr".
+    ///
+    /// This keeps local files with the same name in different models separate
+    /// while still sharing library files when parsing models into the same source map.
+    pub fn new_namespaced(path: &str, contents: &'a [u8], resolver: &'a R) -> (Self, String) {
+        let namespace = Namespace {
+            prefix: format!("{path}:"),
+            folder: Path::new(path).parent().unwrap_or(Path::new("")).to_owned(),
+            is_local: Mutex::new(HashMap::new()),
+        };
+        Self::with_namespace(path, contents, resolver, Some(namespace))
+    }
+
+    fn with_namespace(
+        path: &str,
+        contents: &'a [u8],
+        resolver: &'a R,
+        namespace: Option<Namespace>,
+    ) -> (Self, String) {
+        let chunks = split_mpd(contents);
+
+        let prefix = namespace.as_ref().map_or("", |n| n.prefix.as_str());
+        let (main_model_name, files) = match chunks.first() {
+            Some(main) => {
+                let mut files = HashMap::new();
+                for chunk in &chunks {
+                    // Use the first file if names are repeated.
+                    files
+                        .entry(format!("{prefix}{}", chunk.name).to_lowercase())
+                        .or_insert_with(|| chunk.range.clone());
+                }
+                (format!("{prefix}{}", main.name), files)
+            }
+            // The path is already unique to this model.
+            None => (
+                path.to_string(),
+                HashMap::from([(path.to_lowercase(), 0..contents.len())]),
+            ),
+        };
+
+        (
+            Self {
+                contents,
+                files,
+                resolver,
+                namespace,
+            },
+            main_model_name,
+        )
+    }
+
+    /// Add the namespace prefix to references to other local files.
+    fn local_file(&self, contents: &[u8]) -> Vec<u8> {
+        let Some(namespace) = &self.namespace else {
+            return contents.to_vec();
+        };
+
+        let mut output = Vec::with_capacity(contents.len());
+        for line in contents.split_inclusive(|b| *b == b'\n') {
+            match subfile_name(line) {
+                Some((start, name)) if self.is_local(namespace, name) => {
+                    output.extend_from_slice(&line[..start]);
+                    output.extend_from_slice(namespace.prefix.as_bytes());
+                    output.extend_from_slice(&line[start..]);
+                }
+                _ => output.extend_from_slice(line),
+            }
+        }
+        output
+    }
+
+    fn is_local(&self, namespace: &Namespace, name: &str) -> bool {
+        let mut is_local = namespace.is_local.lock().unwrap();
+        if let Some(value) = is_local.get(name) {
+            return *value;
+        }
+
+        // Match the lookup order of the resolvers for the embedded and model folder files.
+        let value = self
+            .files
+            .contains_key(&format!("{}{name}", namespace.prefix).to_lowercase())
+            || namespace.folder.join(name.replace('\\', "/")).is_file();
+        is_local.insert(name.to_string(), value);
+        value
+    }
+}
+
+impl<'a, R: FileRefResolver> FileRefResolver for MpdResolver<'a, R> {
+    fn resolve<P: AsRef<Path>>(&self, filename: P) -> Result<Vec<u8>, ResolveError> {
+        let name = filename.as_ref().to_string_lossy();
+        if let Some(range) = self.files.get(&name.to_lowercase()) {
+            return Ok(self.local_file(&self.contents[range.clone()]));
+        }
+
+        // Local files on disk are only namespaced if referenced by another local file.
+        let local_name = self
+            .namespace
+            .as_ref()
+            .and_then(|n| name.strip_prefix(n.prefix.as_str()));
+        match local_name {
+            Some(local_name) => Ok(self.local_file(&self.resolver.resolve(local_name)?)),
+            None => self.resolver.resolve(filename),
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use indoc::indoc;
+
+    struct DummyResolver;
+
+    impl FileRefResolver for DummyResolver {
+        fn resolve<P: AsRef<Path>>(&self, filename: P) -> Result<Vec<u8>, ResolveError> {
+            match filename.as_ref().to_str().unwrap() {
+                "a.dat" => Ok(b"3 16 0 0 0 1 0 0 0 0 1\n".to_vec()),
+                filename => Err(ResolveError {
+                    filename: filename.to_owned(),
+                    resolve_error: None,
+                }),
+            }
+        }
+    }
+
+    const MPD: &str = indoc! {"
+        0 FILE Main Model.ldr
+        1 16 0 0 0 1 0 0 0 1 0 0 0 1 SUB.ldr
+        0 NOFILE
+        0 FILE sub.ldr
+        1 4 0 0 0 1 0 0 0 1 0 0 0 1 a.dat
+
+        0 FILE unused.ldr
+        1 4 0 0 0 1 0 0 0 1 0 0 0 1 missing.dat
+    "};
+
+    #[test]
+    fn split_mpd_files() {
+        let chunks = split_mpd(MPD.as_bytes());
+        let names: Vec<_> = chunks.iter().map(|c| c.name.as_str()).collect();
+        assert_eq!(vec!["Main Model.ldr", "sub.ldr", "unused.ldr"], names);
+        assert_eq!(
+            "1 4 0 0 0 1 0 0 0 1 0 0 0 1 a.dat\n\n",
+            &MPD[chunks[1].range.clone()]
+        );
+        assert_eq!(
+            "1 16 0 0 0 1 0 0 0 1 0 0 0 1 SUB.ldr\n",
+            &MPD[chunks[0].range.clone()]
+        );
+    }
+
+    #[test]
+    fn split_mpd_byte_order_mark() {
+        let contents = "\u{FEFF}0 FILE main.ldr\r\n0 Title\r\n";
+        assert_eq!(
+            vec![MpdChunk {
+                name: "main.ldr".to_string(),
+                range: 20..contents.len()
+            }],
+            split_mpd(contents.as_bytes())
+        );
+    }
+
+    #[test]
+    fn split_mpd_header_comments() {
+        let contents = indoc! {"
+            0 // Exported by a program
+            0 Author: name
+
+            0 FILE main.ldr
+            1 16 0 0 0 1 0 0 0 1 0 0 0 1 a.dat
+        "};
+        let chunks = split_mpd(contents.as_bytes());
+        assert_eq!(1, chunks.len());
+        assert_eq!("main.ldr", chunks[0].name);
+        assert_eq!(
+            "1 16 0 0 0 1 0 0 0 1 0 0 0 1 a.dat\n",
+            &contents[chunks[0].range.clone()]
+        );
+    }
+
+    #[test]
+    fn split_mpd_single_file() {
+        assert!(split_mpd(b"0 Title\n1 16 0 0 0 1 0 0 0 1 0 0 0 1 a.dat\n").is_empty());
+        assert!(split_mpd(b"1 16 0 0 0 1 0 0 0 1 0 0 0 1 a.dat\n0 FILE a.ldr\n").is_empty());
+    }
+
+    #[test]
+    fn parse_referenced_files() {
+        let (resolver, main_model_name) =
+            MpdResolver::new("model.mpd", MPD.as_bytes(), &DummyResolver);
+        assert_eq!("Main Model.ldr", main_model_name);
+
+        let mut source_map = weldr::SourceMap::new();
+        weldr::parse(&main_model_name, &resolver, &mut source_map).unwrap();
+
+        assert!(source_map.get("sub.ldr").is_some());
+        assert!(source_map.get("a.dat").is_some());
+        assert!(source_map.get("unused.ldr").is_none());
+    }
+
+    #[test]
+    fn subfile_names() {
+        assert_eq!(
+            Some((30, "Sub Model.ldr")),
+            subfile_name(b" 1 16 0 0 0 1 0 0 0 1 0 0 0 1 Sub Model.ldr\r\n")
+        );
+        assert_eq!(None, subfile_name(b"0 FILE a.ldr\n"));
+        assert_eq!(None, subfile_name(b"1 16 0 0 0 1 0 0 0 1 0 0 0 1\n"));
+    }
+
+    fn subfile_colors(source_map: &weldr::SourceMap, name: &str) -> Vec<(String, u32)> {
+        source_map
+            .get(name)
+            .unwrap()
+            .cmds
+            .iter()
+            .filter_map(|c| match c {
+                weldr::Command::SubFileRef(s) => Some((s.file.clone(), s.color)),
+                _ => None,
+            })
+            .collect()
+    }
+
+    #[test]
+    fn parse_namespaced_same_submodel_names() {
+        let model1 = indoc! {"
+            0 FILE main.ldr
+            1 16 0 0 0 1 0 0 0 1 0 0 0 1 sub.ldr
+            0 FILE sub.ldr
+            1 4 0 0 0 1 0 0 0 1 0 0 0 1 a.dat
+        "};
+        let model2 = indoc! {"
+            0 FILE main.ldr
+            1 16 0 0 0 1 0 0 0 1 0 0 0 1 sub.ldr
+            0 FILE sub.ldr
+            1 1 0 0 0 1 0 0 0 1 0 0 0 1 a.dat
+        "};
+
+        // Parse both models into the same source map like a batch.
+        let mut source_map = weldr::SourceMap::new();
+        let mut main_model_names = Vec::new();
+        for (path, contents) in [("one.mpd", model1), ("two.mpd", model2)] {
+            let (resolver, main_model_name) =
+                MpdResolver::new_namespaced(path, contents.as_bytes(), &DummyResolver);
+            main_model_names
+                .push(weldr::parse(&main_model_name, &resolver, &mut source_map).unwrap());
+        }
+
+        assert_eq!(
+            vec!["one.mpd:main.ldr", "two.mpd:main.ldr"],
+            main_model_names
+        );
+        assert_eq!(
+            vec![("one.mpd:sub.ldr".to_string(), 16)],
+            subfile_colors(&source_map, "one.mpd:main.ldr")
+        );
+        assert_eq!(
+            vec![("two.mpd:sub.ldr".to_string(), 16)],
+            subfile_colors(&source_map, "two.mpd:main.ldr")
+        );
+
+        // Each model keeps its own submodel, but library files are shared.
+        assert_eq!(
+            vec![("a.dat".to_string(), 4)],
+            subfile_colors(&source_map, "one.mpd:sub.ldr")
+        );
+        assert_eq!(
+            vec![("a.dat".to_string(), 1)],
+            subfile_colors(&source_map, "two.mpd:sub.ldr")
+        );
+        assert!(source_map.get("sub.ldr").is_none());
+        assert!(source_map.get("a.dat").is_some());
+    }
+
+    #[test]
+    fn resolve_single_file() {
+        let contents = b"1 16 0 0 0 1 0 0 0 1 0 0 0 1 a.dat\n";
+        let (resolver, main_model_name) = MpdResolver::new("Model.ldr", contents, &DummyResolver);
+        assert_eq!("Model.ldr", main_model_name);
+        assert_eq!(contents.to_vec(), resolver.resolve("model.ldr").unwrap());
+        assert!(resolver.resolve("b.dat").is_err());
+    }
+}
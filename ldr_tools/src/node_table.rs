@@ -0,0 +1,195 @@
+use std::collections::HashMap;
+
+use glam::Mat4;
+
+use crate::{ColorCode, LDrawNode, LDrawScene};
+
+/// A flattened version of the node hierarchy in an [LDrawScene].
+///
+/// Nodes are stored in depth first order, so parents always come before their children.
+/// Indices of `-1` indicate no parent, geometry, or submodel.
+/// The root node is the first node in the table.
+#[derive(Debug, PartialEq)]
+pub struct LDrawNodeTable {
+    /// The unique node names.
+    pub names: Vec<String>,
+    /// The index in `names` for each node.
+    pub name_indices: Vec<u32>,
+    /// The index of the parent node or `-1` for the root of each hierarchy.
+    pub parent_indices: Vec<i32>,
+    /// The transform of each node relative to its parent.
+    pub transforms: Vec<Mat4>,
+    /// The unique geometry names in [geometry_cache](struct.LDrawScene.html#structfield.geometry_cache).
+    pub geometry_names: Vec<String>,
+    /// The index in `geometry_names` for each node.
+    pub geometry_ids: Vec<i32>,
+    /// The current color for each node.
+    pub colors: Vec<ColorCode>,
+    /// The index in `submodels` for each node.
+    pub submodel_ids: Vec<i32>,
+    /// The keys in [submodels](struct.LDrawScene.html#structfield.submodels) sorted by name and color.
+    pub submodels: Vec<(String, ColorCode)>,
+    /// The range of nodes for the hierarchy of each submodel as `[offset, count]`.
+    pub submodel_ranges: Vec<[u32; 2]>,
+}
+
+impl From<&LDrawScene> for LDrawNodeTable {
+    fn from(scene: &LDrawScene) -> Self {
+        let mut submodels: Vec<_> = scene.submodels.keys().cloned().collect();
+        submodels.sort();
+
+        let submodel_ids: HashMap<_, _> = submodels
+            .iter()
+            .enumerate()
+            .map(|(i, key)| (key.clone(), i as i32))
+            .collect();
+
+        let mut builder = NodeTableBuilder {
+            table: LDrawNodeTable {
+                names: Vec::new(),
+                name_indices: Vec::new(),
+                parent_indices: Vec::new(),
+                transforms: Vec::new(),
+                geometry_names: Vec::new(),
+                geometry_ids: Vec::new(),
+                colors: Vec::new(),
+                submodel_ids: Vec::new(),
+                submodels: Vec::new(),
+                submodel_ranges: Vec::new(),
+            },
+            name_indices: HashMap::new(),
+            geometry_ids: HashMap::new(),
+            submodel_ids,
+        };
+
+        builder.add_node(&scene.root_node, -1);
+
+        for key in &submodels {
+            let start = builder.table.parent_indices.len();
+            builder.add_node(&scene.submodels[key], -1);
+            let count = builder.table.parent_indices.len() - start;
+            builder
+                .table
+                .submodel_ranges
+                .push([start as u32, count as u32]);
+        }
+
+        builder.table.submodels = submodels;
+        builder.table
+    }
+}
+
+struct NodeTableBuilder {
+    table: LDrawNodeTable,
+    name_indices: HashMap<String, u32>,
+    geometry_ids: HashMap<String, i32>,
+    submodel_ids: HashMap<(String, ColorCode), i32>,
+}
+
+impl NodeTableBuilder {
+    fn add_node(&mut self, node: &LDrawNode, parent_index: i32) {
+        let index = self.table.parent_indices.len() as i32;
+
+        let names = &mut self.table.names;
+        let name_index = *self
+            .name_indices
+            .entry(node.name.clone())
+            .or_insert_with(|| {
+                names.push(node.name.clone());
+                names.len() as u32 - 1
+            });
+
+        let geometry_id = match &node.geometry_name {
+            Some(name) => {
+                let geometry_names = &mut self.table.geometry_names;
+                *self.geometry_ids.entry(name.clone()).or_insert_with(|| {
+                    geometry_names.push(name.clone());
+                    geometry_names.len() as i32 - 1
+                })
+            }
+            None => -1,
+        };
+
+        let submodel_id = node
+            .submodel
+            .as_ref()
+            .and_then(|key| self.submodel_ids.get(key).copied())
+            .unwrap_or(-1);
+
+        self.table.name_indices.push(name_index);
+        self.table.parent_indices.push(parent_index);
+        self.table.transforms.push(node.transform);
+        self.table.geometry_ids.push(geometry_id);
+        self.table.colors.push(node.current_color);
+        self.table.submodel_ids.push(submodel_id);
+
+        for child in &node.children {
+            self.add_node(child, index);
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use glam::vec3;
+
+    fn node(name: &str, geometry_name: Option<&str>, children: Vec<LDrawNode>) -> LDrawNode {
+        LDrawNode {
+            name: name.to_string(),
+            transform: Mat4::IDENTITY,
+            geometry_name: geometry_name.map(|n| n.to_string()),
+            current_color: 16,
+            children,
+            submodel: None,
+        }
+    }
+
+    #[test]
+    fn node_table_submodels() {
+        let mut reference = node("sub.ldr", None, Vec::new());
+        reference.transform = Mat4::from_translation(vec3(1.0, 2.0, 3.0));
+        reference.submodel = Some(("sub.ldr".to_string(), 4));
+
+        let scene = LDrawScene {
+            root_node: node(
+                "main.ldr",
+                None,
+                vec![
+                    node("a.dat", Some("a.dat"), Vec::new()),
+                    reference,
+                    node("a.dat", Some("a.dat"), Vec::new()),
+                ],
+            ),
+            geometry_cache: HashMap::new(),
+            submodels: [(
+                ("sub.ldr".to_string(), 4),
+                node(
+                    "sub.ldr",
+                    None,
+                    vec![node("b.dat", Some("b.dat"), Vec::new())],
+                ),
+            )]
+            .into(),
+            textures: Vec::new(),
+            removed_faces: HashMap::new(),
+            memory: Default::default(),
+        };
+
+        let table = LDrawNodeTable::from(&scene);
+
+        assert_eq!(vec!["main.ldr", "a.dat", "sub.ldr", "b.dat"], table.names);
+        assert_eq!(vec![0, 1, 2, 1, 2, 3], table.name_indices);
+        assert_eq!(vec![-1, 0, 0, 0, -1, 4], table.parent_indices);
+        assert_eq!(vec!["a.dat", "b.dat"], table.geometry_names);
+        assert_eq!(vec![-1, 0, -1, 0, -1, 1], table.geometry_ids);
+        assert_eq!(vec![-1, -1, 0, -1, -1, -1], table.submodel_ids);
+        assert_eq!(vec![("sub.ldr".to_string(), 4)], table.submodels);
+        assert_eq!(vec![[4, 2]], table.submodel_ranges);
+        assert_eq!(
+            Mat4::from_translation(vec3(1.0, 2.0, 3.0)),
+            table.transforms[2]
+        );
+    }
+}
@@ -0,0 +1,218 @@
+use std::collections::{HashMap, HashSet};
+
+use glam::Vec3;
+
+/// Calculate smooth normals for each face corner and whether the edge
+/// starting at each corner is in `sharp_edges`.
+/// Faces are only smoothed across edges not in `sharp_edges`.
+///
+/// This works similarly to Blender's custom normals with sharp edges
+/// without needing to duplicate any vertices.
+pub fn corner_normals(
+    vertices: &[Vec3],
+    vertex_indices: &[u32],
+    face_starts: &[u32],
+    face_sizes: &[u32],
+    sharp_edges: &[[u32; 2]],
+) -> (Vec<Vec3>, Vec<bool>) {
+    let sharp_edges: HashSet<_> = sharp_edges.iter().map(|e| undirected(*e)).collect();
+
+    let face_normals: Vec<_> = face_starts
+        .iter()
+        .zip(face_sizes)
+        .map(|(start, size)| {
+            let face = &vertex_indices[*start as usize..*start as usize + *size as usize];
+            face_normal(vertices, face)
+        })
+        .collect();
+
+    // Find the corners for the start and end of each edge.
+    let mut is_corner_edge_sharp = vec![false; vertex_indices.len()];
+    let mut edge_corners: HashMap<[u32; 2], Vec<(usize, usize)>> = HashMap::new();
+    for (start, size) in face_starts.iter().zip(face_sizes) {
+        let start = *start as usize;
+        let size = *size as usize;
+        for i in 0..size {
+            let c0 = start + i;
+            let c1 = start + (i + 1) % size;
+            let edge = undirected([vertex_indices[c0], vertex_indices[c1]]);
+            is_corner_edge_sharp[c0] = sharp_edges.contains(&edge);
+            edge_corners.entry(edge).or_default().push((c0, c1));
+        }
+    }
+
+    // Corners that share a vertex across a smooth edge share a normal.
+    let mut groups = CornerGroups::new(vertex_indices.len());
+    for corners in edge_corners.values() {
+        // Blender treats non manifold edges and edges with inconsistent winding as sharp.
+        if let [(a0, a1), (b0, b1)] = corners[..] {
+            if !is_corner_edge_sharp[a0] && vertex_indices[a0] == vertex_indices[b1] {
+                groups.union(a0, b1);
+                groups.union(a1, b0);
+            }
+        }
+    }
+
+    let mut corner_faces = vec![0; vertex_indices.len()];
+    for (face, (start, size)) in face_starts.iter().zip(face_sizes).enumerate() {
+        corner_faces[*start as usize..*start as usize + *size as usize].fill(face);
+    }
+
+    // Weight face normals by the corner angle like Blender.
+    let mut group_normals = vec![Vec3::ZERO; vertex_indices.len()];
+    for (start, size) in face_starts.iter().zip(face_sizes) {
+        let start = *start as usize;
+        let size = *size as usize;
+        for i in 0..size {
+            let corner = start + i;
+            let prev = start + (i + size - 1) % size;
+            let next = start + (i + 1) % size;
+
+            let v = vertices[vertex_indices[corner] as usize];
+            let e0 = vertices[vertex_indices[prev] as usize] - v;
+            let e1 = vertices[vertex_indices[next] as usize] - v;
+            let angle = if e0.length_squared() > 0.0 && e1.length_squared() > 0.0 {
+                e0.angle_between(e1)
+            } else {
+                0.0
+            };
+
+            let group = groups.find(corner);
+            group_normals[group] += face_normals[corner_faces[corner]] * angle;
+        }
+    }
+
+    let normals = (0..vertex_indices.len())
+        .map(|corner| {
+            let normal = group_normals[groups.find(corner)].normalize_or_zero();
+            if normal == Vec3::ZERO {
+                face_normals[corner_faces[corner]]
+            } else {
+                normal
+            }
+        })
+        .collect();
+
+    (normals, is_corner_edge_sharp)
+}
+
+fn undirected([v0, v1]: [u32; 2]) -> [u32; 2] {
+    [v0.min(v1), v0.max(v1)]
+}
+
+/// The unit normal of a face or zero for degenerate faces.
+pub fn face_normal(vertices: &[Vec3], face: &[u32]) -> Vec3 {
+    // Summing the cross products also works for quads that aren't perfectly planar.
+    let origin = vertices[face[0] as usize];
+    let mut normal = Vec3::ZERO;
+    for (i, v0) in face.iter().enumerate() {
+        let v1 = face[(i + 1) % face.len()];
+        let p0 = vertices[*v0 as usize] - origin;
+        let p1 = vertices[v1 as usize] - origin;
+        normal += p0.cross(p1);
+    }
+    normal.normalize_or_zero()
+}
+
+/// A disjoint set of face corners with a shared normal.
+struct CornerGroups {
+    parents: Vec<usize>,
+}
+
+impl CornerGroups {
+    fn new(count: usize) -> Self {
+        Self {
+            parents: (0..count).collect(),
+        }
+    }
+
+    fn find(&mut self, corner: usize) -> usize {
+        let mut root = corner;
+        while self.parents[root] != root {
+            root = self.parents[root];
+        }
+
+        // Compress the path to speed up later queries.
+        let mut current = corner;
+        while self.parents[current] != root {
+            let next = self.parents[current];
+            self.parents[current] = root;
+            current = next;
+        }
+
+        root
+    }
+
+    fn union(&mut self, a: usize, b: usize) {
+        let a = self.find(a);
+        let b = self.find(b);
+        if a != b {
+            self.parents[b] = a;
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use std::f32::consts::FRAC_1_SQRT_2;
+
+    use approx::assert_relative_eq;
+    use glam::vec3;
+
+    fn assert_normals_eq(expected: &[Vec3], actual: &[Vec3]) {
+        assert_eq!(expected.len(), actual.len());
+        for (e, a) in expected.iter().zip(actual) {
+            assert_relative_eq!(e.to_array()[..], a.to_array()[..], epsilon = 0.0001);
+        }
+    }
+
+    #[test]
+    fn corner_normals_triangle() {
+        // 2
+        // | \
+        // 0 - 1
+        let (normals, sharp) = corner_normals(
+            &[
+                vec3(0.0, 0.0, 0.0),
+                vec3(1.0, 0.0, 0.0),
+                vec3(0.0, 1.0, 0.0),
+            ],
+            &[0, 1, 2],
+            &[0],
+            &[3],
+            &[],
+        );
+        assert_normals_eq(&[Vec3::Z, Vec3::Z, Vec3::Z], &normals);
+        assert_eq!(vec![false, false, false], sharp);
+    }
+
+    #[test]
+    fn corner_normals_folded_triangles() {
+        // Two right triangles folded 90 degrees along the edge 1-2.
+        // 2
+        // | \
+        // 0 - 1
+        let vertices = [
+            vec3(0.0, 0.0, 0.0),
+            vec3(1.0, 0.0, 0.0),
+            vec3(0.0, 1.0, 0.0),
+            vec3(0.5, 0.5, -FRAC_1_SQRT_2),
+        ];
+        let indices = [0, 1, 2, 2, 1, 3];
+        let n0 = Vec3::Z;
+        let n1 = vec3(1.0, 1.0, 0.0).normalize();
+        let smooth = (n0 + n1).normalize();
+
+        // The shared vertices 1 and 2 have the same angle in both faces.
+        let (normals, sharp) = corner_normals(&vertices, &indices, &[0, 3], &[3, 3], &[]);
+        assert_normals_eq(&[n0, smooth, smooth, smooth, smooth, n1], &normals);
+        assert_eq!(vec![false; 6], sharp);
+
+        // Marking the fold as sharp uses the face normals.
+        let (normals, sharp) = corner_normals(&vertices, &indices, &[0, 3], &[3, 3], &[[2, 1]]);
+        assert_normals_eq(&[n0, n0, n0, n1, n1, n1], &normals);
+        assert_eq!(vec![false, true, false, true, false, false], sharp);
+    }
+}
@@ -0,0 +1,333 @@
+use std::{collections::HashMap, mem::size_of_val};
+
+use glam::{Mat4, Vec3};
+
+use crate::{
+    ColorCode, LDrawGeometry, LDrawSceneInstanced, LDrawStudLogoInfo, LDrawTextureInfo, LoadStage,
+    MemoryReport, RemovedFaces,
+};
+
+/// An instanced scene with all geometry and instance data packed into contiguous buffers.
+///
+/// Ranges are stored as `[offset, count]` into the corresponding packed buffer.
+/// Indices within a range are relative to the start of that geometry,
+/// so each slice has the same layout as the fields of [LDrawGeometry].
+#[derive(Debug, Default, PartialEq)]
+pub struct LDrawScenePacked {
+    pub main_model_name: String,
+    /// The unique geometry names indexed by geometry id.
+    pub geometry_names: Vec<String>,
+
+    pub vertices: Vec<Vec3>,
+    pub vertex_indices: Vec<u32>,
+    pub face_start_indices: Vec<u32>,
+    pub face_sizes: Vec<u32>,
+    pub face_colors: Vec<ColorCode>,
+    pub is_face_stud: Vec<bool>,
+    pub edge_line_indices: Vec<[u32; 2]>,
+    /// Smooth normals for each face corner using the same ranges as `vertex_indices`.
+    pub corner_normals: Vec<Vec3>,
+    /// Sharp edge flags for each face corner using the same ranges as `vertex_indices`.
+    pub is_corner_edge_sharp: Vec<bool>,
+    /// Unique face edges for each geometry.
+    pub edges: Vec<[u32; 2]>,
+    /// Edge indices for each face corner using the same ranges as `vertex_indices`.
+    pub corner_edges: Vec<u32>,
+    /// `true` if the geometry is part of a slope piece with grainy faces.
+    pub has_grainy_slopes: Vec<bool>,
+    /// Grainy slope flags for each face using the same ranges as `face_sizes`.
+    /// Faces of geometry without grainy slopes are `false`.
+    pub is_face_grainy: Vec<bool>,
+    /// Texture information for the geometry ids with textures.
+    pub texture_info: HashMap<u32, LDrawTextureInfo>,
+    /// PNG-encoded images referenced by the `texture_ids` in `texture_info`.
+    pub textures: Vec<Vec<u8>>,
+    /// Stud top information for the geometry ids with stud tops.
+    pub stud_logo_info: HashMap<u32, LDrawStudLogoInfo>,
+    /// The minimum vertex position for each geometry.
+    pub geometry_min: Vec<Vec3>,
+    /// The maximum vertex position for each geometry.
+    pub geometry_max: Vec<Vec3>,
+
+    /// The range in `vertices` for each geometry.
+    pub vertex_ranges: Vec<[u32; 2]>,
+    /// The range in `vertex_indices` for each geometry.
+    pub vertex_index_ranges: Vec<[u32; 2]>,
+    /// The range in `face_start_indices`, `face_sizes`, `is_face_stud`, and `is_face_grainy` for each geometry.
+    pub face_ranges: Vec<[u32; 2]>,
+    /// The range in `face_colors` for each geometry.
+    pub face_color_ranges: Vec<[u32; 2]>,
+    /// The range in `edge_line_indices` for each geometry.
+    pub edge_line_ranges: Vec<[u32; 2]>,
+    /// The range in `edges` for each geometry.
+    pub edge_ranges: Vec<[u32; 2]>,
+
+    /// The geometry id for each unique part and color.
+    pub group_geometry_ids: Vec<u32>,
+    /// The color code for each unique part and color.
+    pub group_colors: Vec<ColorCode>,
+    /// The range in `transforms` for each unique part and color.
+    pub group_transform_ranges: Vec<[u32; 2]>,
+    /// The world transforms for all instances.
+    pub transforms: Vec<Mat4>,
+    /// The faces removed from each geometry by name before deduplication.
+    /// Geometry without any removed faces is not included.
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
+}
+
+impl From<LDrawSceneInstanced> for LDrawScenePacked {
+    fn from(scene: LDrawSceneInstanced) -> Self {
+        let mut packed = LDrawScenePacked {
+            main_model_name: scene.main_model_name,
+            geometry_names: Vec::new(),
+            vertices: Vec::new(),
+            vertex_indices: Vec::new(),
+            face_start_indices: Vec::new(),
+            face_sizes: Vec::new(),
+            face_colors: Vec::new(),
+            is_face_stud: Vec::new(),
+            edge_line_indices: Vec::new(),
+            corner_normals: Vec::new(),
+            is_corner_edge_sharp: Vec::new(),
+            edges: Vec::new(),
+            corner_edges: Vec::new(),
+            has_grainy_slopes: Vec::new(),
+            is_face_grainy: Vec::new(),
+            texture_info: HashMap::new(),
+            textures: scene.textures,
+            stud_logo_info: HashMap::new(),
+            geometry_min: Vec::new(),
+            geometry_max: Vec::new(),
+            vertex_ranges: Vec::new(),
+            vertex_index_ranges: Vec::new(),
+            face_ranges: Vec::new(),
+            face_color_ranges: Vec::new(),
+            edge_line_ranges: Vec::new(),
+            edge_ranges: Vec::new(),
+            group_geometry_ids: Vec::new(),
+            group_colors: Vec::new(),
+            group_transform_ranges: Vec::new(),
+            transforms: Vec::new(),
+            removed_faces: scene.removed_faces,
+            memory: scene.memory,
+        };
+
+        // Sort by name for a deterministic layout.
+        let mut geometry_cache: Vec<_> = scene.geometry_cache.into_iter().collect();
+        geometry_cache.sort_by(|(a, _), (b, _)| a.cmp(b));
+
+        let mut geometry_ids = HashMap::new();
+        for (name, geometry) in geometry_cache {
+            let id = packed.geometry_names.len() as u32;
+            packed.append_geometry(id, geometry);
+            geometry_ids.insert(name.clone(), id);
+            packed.geometry_names.push(name);
+        }
+
+        let mut groups: Vec<_> = scene.geometry_world_transforms.into_iter().collect();
+        groups.sort_by(|(a, _), (b, _)| a.cmp(b));
+
+        for ((name, color), transforms) in groups {
+            // Instances should always reference geometry in the cache.
+            let Some(id) = geometry_ids.get(&name) else {
+                continue;
+            };
+            packed.group_geometry_ids.push(*id);
+            packed.group_colors.push(color);
+            packed
+                .group_transform_ranges
+                .push(range(&packed.transforms, &transforms));
+            packed.transforms.extend(transforms);
+        }
+
+        // Each geometry is freed after appending it to the packed buffers.
+        let bytes = packed.size_in_bytes();
+        packed.memory.add_stage(LoadStage::Packed, bytes, bytes);
+
+        packed
+    }
+}
+
+impl LDrawScenePacked {
+    /// The size in bytes of the packed buffers, textures, and transforms.
+    pub fn size_in_bytes(&self) -> usize {
+        let texture_size: usize = self
+            .texture_info
+            .values()
+            .map(|t| {
+                t.textures.iter().map(Vec::len).sum::<usize>()
+                    + size_of_val(t.texture_ids.as_slice())
+                    + size_of_val(t.indices.as_slice())
+                    + size_of_val(t.uvs.as_slice())
+            })
+            .sum();
+        let stud_logo_size: usize = self
+            .stud_logo_info
+            .values()
+            .map(|s| size_of_val(s.is_face_stud_top.as_slice()) + size_of_val(s.uvs.as_slice()))
+            .sum();
+
+        self.geometry_names.iter().map(String::len).sum::<usize>()
+            + size_of_val(self.vertices.as_slice())
+            + size_of_val(self.vertex_indices.as_slice())
+            + size_of_val(self.face_start_indices.as_slice())
+            + size_of_val(self.face_sizes.as_slice())
+            + size_of_val(self.face_colors.as_slice())
+            + size_of_val(self.is_face_stud.as_slice())
+            + size_of_val(self.edge_line_indices.as_slice())
+            + size_of_val(self.corner_normals.as_slice())
+            + size_of_val(self.is_corner_edge_sharp.as_slice())
+            + size_of_val(self.edges.as_slice())
+            + size_of_val(self.corner_edges.as_slice())
+            + size_of_val(self.has_grainy_slopes.as_slice())
+            + size_of_val(self.is_face_grainy.as_slice())
+            + texture_size
+            + self.textures.iter().map(Vec::len).sum::<usize>()
+            + stud_logo_size
+            + size_of_val(self.geometry_min.as_slice())
+            + size_of_val(self.geometry_max.as_slice())
+            + size_of_val(self.vertex_ranges.as_slice())
+            + size_of_val(self.vertex_index_ranges.as_slice())
+            + size_of_val(self.face_ranges.as_slice())
+            + size_of_val(self.face_color_ranges.as_slice())
+            + size_of_val(self.edge_line_ranges.as_slice())
+            + size_of_val(self.edge_ranges.as_slice())
+            + size_of_val(self.group_geometry_ids.as_slice())
+            + size_of_val(self.group_colors.as_slice())
+            + size_of_val(self.group_transform_ranges.as_slice())
+            + size_of_val(self.transforms.as_slice())
+    }
+
+    fn append_geometry(&mut self, id: u32, geometry: LDrawGeometry) {
+        let LDrawGeometry {
+            vertices,
+            vertex_indices,
+            face_start_indices,
+            face_sizes,
+            face_colors,
+            is_face_stud,
+            edge_line_indices,
+            corner_normals,
+            is_corner_edge_sharp,
+            edges,
+            corner_edges,
+            has_grainy_slopes,
+            is_face_grainy,
+            texture_info,
+            stud_logo_info,
+        } = geometry;
+
+        self.vertex_ranges.push(range(&self.vertices, &vertices));
+        self.vertex_index_ranges
+            .push(range(&self.vertex_indices, &vertex_indices));
+        self.face_ranges
+            .push(range(&self.face_start_indices, &face_start_indices));
+        self.face_color_ranges
+            .push(range(&self.face_colors, &face_colors));
+        self.edge_line_ranges
+            .push(range(&self.edge_line_indices, &edge_line_indices));
+        self.edge_ranges.push(range(&self.edges, &edges));
+
+        let min = vertices.iter().copied().reduce(Vec3::min);
+        let max = vertices.iter().copied().reduce(Vec3::max);
+        self.geometry_min.push(min.unwrap_or_default());
+        self.geometry_max.push(max.unwrap_or_default());
+
+        self.vertices.extend(vertices);
+        self.vertex_indices.extend(vertex_indices);
+        self.face_start_indices.extend(face_start_indices);
+        let face_count = face_sizes.len();
+        self.face_sizes.extend(face_sizes);
+        self.face_colors.extend(face_colors);
+        self.is_face_stud.extend(is_face_stud);
+        self.edge_line_indices.extend(edge_line_indices);
+        self.corner_normals.extend(corner_normals);
+        self.is_corner_edge_sharp.extend(is_corner_edge_sharp);
+        self.edges.extend(edges);
+        self.corner_edges.extend(corner_edges);
+        self.has_grainy_slopes.push(has_grainy_slopes);
+        if is_face_grainy.is_empty() {
+            // Keep the same ranges as the other face attributes.
+            self.is_face_grainy
+                .extend(std::iter::repeat(false).take(face_count));
+        } else {
+            self.is_face_grainy.extend(is_face_grainy);
+        }
+
+        if let Some(texture_info) = texture_info {
+            self.texture_info.insert(id, texture_info);
+        }
+        if let Some(stud_logo_info) = stud_logo_info {
+            self.stud_logo_info.insert(id, stud_logo_info);
+        }
+    }
+}
+
+fn range<T>(packed: &[T], values: &[T]) -> [u32; 2] {
+    [packed.len() as u32, values.len() as u32]
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use glam::vec3;
+
+    fn geometry(vertex_count: usize, face_colors: Vec<ColorCode>) -> LDrawGeometry {
+        LDrawGeometry {
+            vertices: vec![Vec3::ZERO; vertex_count],
+            vertex_indices: vec![0, 1, 2],
+            face_start_indices: vec![0],
+            face_sizes: vec![3],
+            face_colors,
+            is_face_stud: vec![false],
+            edge_line_indices: vec![[0, 1]],
+            ..Default::default()
+        }
+    }
+
+    #[test]
+    fn packed_scene_ranges() {
+        let scene = LDrawSceneInstanced {
+            main_model_name: "main.ldr".to_string(),
+            geometry_world_transforms: [
+                (("b.dat".to_string(), 4), vec![Mat4::IDENTITY]),
+                (
+                    ("a.dat".to_string(), 16),
+                    vec![Mat4::IDENTITY, Mat4::from_translation(vec3(1.0, 2.0, 3.0))],
+                ),
+                (("a.dat".to_string(), 1), vec![Mat4::IDENTITY]),
+            ]
+            .into(),
+            geometry_cache: [
+                ("b.dat".to_string(), geometry(4, vec![16])),
+                ("a.dat".to_string(), geometry(3, vec![16])),
+            ]
+            .into(),
+            textures: Vec::new(),
+            removed_faces: HashMap::new(),
+            memory: MemoryReport::default(),
+        };
+
+        let packed = LDrawScenePacked::from(scene);
+
+        assert_eq!(vec!["a.dat", "b.dat"], packed.geometry_names);
+        assert_eq!(7, packed.vertices.len());
+        assert_eq!(vec![[0, 3], [3, 4]], packed.vertex_ranges);
+        assert_eq!(vec![[0, 3], [3, 3]], packed.vertex_index_ranges);
+        assert_eq!(vec![[0, 1], [1, 1]], packed.face_ranges);
+        assert_eq!(vec![[0, 1], [1, 1]], packed.face_color_ranges);
+        assert_eq!(vec![[0, 1], [1, 1]], packed.edge_line_ranges);
+        assert_eq!(vec![[0, 0], [0, 0]], packed.edge_ranges);
+        assert_eq!(vec![0, 1, 2, 0, 1, 2], packed.vertex_indices);
+        assert_eq!(vec![Vec3::ZERO; 2], packed.geometry_min);
+        assert_eq!(vec![Vec3::ZERO; 2], packed.geometry_max);
+
+        assert_eq!(vec![0, 0, 1], packed.group_geometry_ids);
+        assert_eq!(vec![1, 16, 4], packed.group_colors);
+        assert_eq!(vec![[0, 1], [1, 2], [3, 1]], packed.group_transform_ranges);
+        assert_eq!(4, packed.transforms.len());
+        assert_eq!(packed.size_in_bytes(), packed.memory.peak_bytes);
+    }
+}
@@ -0,0 +1,372 @@
+use std::{
+    collections::{HashMap, HashSet},
+    ops::AddAssign,
+    sync::Mutex,
+};
+
+use weldr::Command;
+
+use crate::{
+    filter::step_commands, geometry::replace_studs, instanced::load_instances,
+    intern::PartInterner, is_submodel, named_transforms, parse_files, world_transforms, ColorCode,
+    GeometrySettings, CURRENT_COLOR,
+};
+
+/// The size of the box geometry for each part with
+/// [preview](struct.GeometrySettings.html#structfield.preview) enabled.
+const PREVIEW_ESTIMATE: GeometryEstimate = GeometryEstimate {
+    triangles: 12,
+    vertices: 8,
+};
+
+/// Statistics for a model from [scan_file] without creating any geometry.
+#[derive(Debug, Default, PartialEq)]
+pub struct SceneStats {
+    pub main_model_name: String,
+    /// The estimated size of a single instance of each unique part.
+    pub part_estimates: HashMap<String, GeometryEstimate>,
+    /// The number of instances for each part and color.
+    pub instance_counts: HashMap<(String, ColorCode), usize>,
+    /// The number of references to each lowercase submodel name in the whole model.
+    pub submodel_counts: HashMap<String, usize>,
+    /// The number of unique images from Studio `PE_TEX_INFO` commands in the parts.
+    pub texture_count: usize,
+    /// The decoded size in bytes of the unique images from Studio `PE_TEX_INFO` commands.
+    pub texture_bytes: usize,
+    /// The referenced files that could not be found in the model or library.
+    pub missing_files: Vec<String>,
+    /// The estimated size of all part instances combined.
+    pub total_estimate: GeometryEstimate,
+}
+
+/// Geometry sizes estimated from the triangle and quad commands in a file and its subfiles.
+#[derive(Debug, Default, Clone, Copy, PartialEq, Eq)]
+pub struct GeometryEstimate {
+    /// The number of triangles with each quad counting as two triangles.
+    pub triangles: usize,
+    /// The number of face corners.
+    /// This matches the vertex count without
+    /// [weld_vertices](struct.GeometrySettings.html#structfield.weld_vertices)
+    /// and is an upper bound otherwise.
+    pub vertices: usize,
+}
+
+impl AddAssign for GeometryEstimate {
+    fn add_assign(&mut self, rhs: Self) {
+        self.triangles += rhs.triangles;
+        self.vertices += rhs.vertices;
+    }
+}
+
+/// Parse a file and walk its hierarchy to find the parts, instances, and estimated size
+/// of the scene from [load_file_instanced](crate::load_file_instanced) with the same settings.
+/// This is much faster than loading since no geometry is created.
+///
+/// Estimates use the primitive resolution from `settings` for every primitive
+/// and don't account for removed faces or a memory budget.
+#[tracing::instrument]
+pub fn scan_file(
+    path: &str,
+    ldraw_path: &str,
+    additional_paths: &[&str],
+    settings: &GeometrySettings,
+) -> SceneStats {
+    let (source_map, mut main_model_names, missing_files) =
+        parse_files(&[path], ldraw_path, additional_paths, settings, false);
+
+    let mut stats = scan_source_map(&source_map, &main_model_names.remove(0), settings);
+    stats.missing_files = missing_files;
+    stats
+}
+
+pub(crate) fn scan_source_map(
+    source_map: &weldr::SourceMap,
+    main_model_name: &str,
+    settings: &GeometrySettings,
+) -> SceneStats {
+    let source_file = source_map.get(main_model_name).unwrap();
+
+    // Reuse the instancing used for loading to apply the same filters.
+    let interner = PartInterner::default();
+    let cache = Mutex::new(HashMap::new());
+    let instances = load_instances(
+        source_file,
+        interner.intern(main_model_name),
+        source_map,
+        CURRENT_COLOR,
+        false,
+        settings.filter.step_range,
+        &settings.filter,
+        &interner,
+        &cache,
+    );
+    let transforms = world_transforms(&instances, source_map, &interner, settings);
+
+    // Only estimate geometry with at least one instance remaining.
+    let instanced_ids: HashSet<_> = transforms.keys().map(|(id, _)| *id).collect();
+    let names = interner.names();
+    let mut counter = EstimateCounter {
+        source_map,
+        settings,
+        estimates: HashMap::new(),
+        textures: HashSet::new(),
+    };
+    let part_estimates: HashMap<_, _> = instances
+        .geometry_descriptors
+        .iter()
+        .filter(|(id, _)| instanced_ids.contains(id))
+        .map(|(id, descriptor)| {
+            let name = &names[*id as usize];
+            let estimate = if settings.preview {
+                PREVIEW_ESTIMATE
+            } else {
+                counter.estimate(descriptor.source_file, name, descriptor.recursive)
+            };
+            (name.clone(), estimate)
+        })
+        .collect();
+
+    let instance_counts: HashMap<_, _> = named_transforms(transforms, &names)
+        .into_iter()
+        .map(|(key, transforms)| (key, transforms.len()))
+        .collect();
+
+    let mut total_estimate = GeometryEstimate::default();
+    for ((name, _), count) in &instance_counts {
+        let estimate = part_estimates[name];
+        total_estimate += GeometryEstimate {
+            triangles: estimate.triangles * count,
+            vertices: estimate.vertices * count,
+        };
+    }
+
+    SceneStats {
+        main_model_name: main_model_name.to_string(),
+        texture_count: counter.textures.len(),
+        texture_bytes: counter
+            .textures
+            .iter()
+            .map(|image| base64::decoded_len_estimate(image.len()))
+            .sum(),
+        part_estimates,
+        instance_counts,
+        submodel_counts: submodel_counts(
+            source_file,
+            source_map,
+            settings.filter.step_range,
+            &mut HashMap::new(),
+        ),
+        missing_files: Vec::new(),
+        total_estimate,
+    }
+}
+
+struct EstimateCounter<'a> {
+    source_map: &'a weldr::SourceMap,
+    settings: &'a GeometrySettings,
+    /// The estimates for each lowercase file name including subfiles.
+    estimates: HashMap<String, GeometryEstimate>,
+    /// The base64 encoded images for textures.
+    textures: HashSet<&'a str>,
+}
+
+impl<'a> EstimateCounter<'a> {
+    fn estimate(
+        &mut self,
+        source_file: &'a weldr::SourceFile,
+        name: &str,
+        recursive: bool,
+    ) -> GeometryEstimate {
+        if recursive {
+            if let Some(estimate) = self.estimates.get(name) {
+                return *estimate;
+            }
+        }
+
+        let mut estimate = GeometryEstimate::default();
+        for cmd in &source_file.cmds {
+            match cmd {
+                Command::Triangle(_) => {
+                    estimate += GeometryEstimate {
+                        triangles: 1,
+                        vertices: 3,
+                    }
+                }
+                Command::Quad(_) => {
+                    estimate += GeometryEstimate {
+                        triangles: 2,
+                        vertices: 4,
+                    }
+                }
+                Command::Comment(c) if c.text.starts_with("PE_TEX_INFO ") => {
+                    // The image is always the last word.
+                    if let Some(image) = c.text.split_whitespace().last() {
+                        self.textures.insert(image);
+                    }
+                }
+                Command::SubFileRef(subfile_cmd) if recursive => {
+                    // Match the stud files used when creating geometry.
+                    let subfilename = replace_studs(subfile_cmd, self.settings.stud_type);
+                    if let Some(subfile) = self.source_map.get(subfilename) {
+                        estimate += self.estimate(subfile, &subfilename.to_lowercase(), true);
+                    }
+                }
+                _ => (),
+            }
+        }
+
+        if recursive {
+            self.estimates.insert(name.to_string(), estimate);
+        }
+        estimate
+    }
+}
+
+/// Count the references to each submodel in the file and its submodels.
+/// The cache stores the counts for each lowercase submodel name.
+fn submodel_counts(
+    source_file: &weldr::SourceFile,
+    source_map: &weldr::SourceMap,
+    step_range: Option<[u32; 2]>,
+    cache: &mut HashMap<String, HashMap<String, usize>>,
+) -> HashMap<String, usize> {
+    let mut counts = HashMap::new();
+    for cmd in step_commands(&source_file.cmds, step_range) {
+        if let Command::SubFileRef(sfr_cmd) = cmd {
+            let Some(subfile) = source_map.get(&sfr_cmd.file) else {
+                continue;
+            };
+            if !is_submodel(subfile, &sfr_cmd.file) {
+                continue;
+            }
+
+            let name = sfr_cmd.file.to_lowercase();
+            *counts.entry(name.clone()).or_default() += 1;
+
+            let child_counts = match cache.get(&name) {
+                Some(child_counts) => child_counts.clone(),
+                None => {
+                    let child_counts = submodel_counts(subfile, source_map, None, cache);
+                    cache.insert(name, child_counts.clone());
+                    child_counts
+                }
+            };
+            for (child_name, count) in child_counts {
+                *counts.entry(child_name).or_default() += count;
+            }
+        }
+    }
+    counts
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use indoc::indoc;
+
+    use crate::{geometry::create_geometry, test_utils::DummyResolver};
+
+    fn source_map() -> weldr::SourceMap {
+        let resolver = DummyResolver::from([
+            (
+                "main.ldr",
+                indoc! {"
+                    1 16 0 0 0 1 0 0 0 1 0 0 0 1 sub.ldr
+                    1 16 0 0 40 1 0 0 0 1 0 0 0 1 sub.ldr
+                    1 4 0 0 80 1 0 0 0 1 0 0 0 1 a.dat
+                "},
+            ),
+            (
+                "sub.ldr",
+                indoc! {"
+                    1 1 0 0 0 1 0 0 0 1 0 0 0 1 a.dat
+                    1 1 20 0 0 1 0 0 0 1 0 0 0 1 a.dat
+                "},
+            ),
+            (
+                "a.dat",
+                indoc! {"
+                    4 16 0 0 0 1 0 0 1 1 0 0 1 0
+                    1 16 0 0 0 1 0 0 0 1 0 0 0 1 b.dat
+                    1 16 0 2 0 1 0 0 0 1 0 0 0 1 b.dat
+                "},
+            ),
+            ("b.dat", "3 16 0 0 0 1 0 0 0 0 1\n"),
+        ]);
+
+        let mut source_map = weldr::SourceMap::new();
+        weldr::parse("main.ldr", &resolver, &mut source_map).unwrap();
+        source_map
+    }
+
+    #[test]
+    fn scan_source_map_counts() {
+        let stats = scan_source_map(&source_map(), "main.ldr", &GeometrySettings::default());
+
+        let estimate = GeometryEstimate {
+            triangles: 4,
+            vertices: 10,
+        };
+        assert_eq!(
+            HashMap::from([("a.dat".to_string(), estimate)]),
+            stats.part_estimates
+        );
+        assert_eq!(
+            HashMap::from([(("a.dat".to_string(), 1), 4), (("a.dat".to_string(), 4), 1)]),
+            stats.instance_counts
+        );
+        assert_eq!(
+            HashMap::from([("sub.ldr".to_string(), 2)]),
+            stats.submodel_counts
+        );
+        assert_eq!(
+            GeometryEstimate {
+                triangles: 20,
+                vertices: 50,
+            },
+            stats.total_estimate
+        );
+    }
+
+    #[test]
+    fn scan_source_map_matches_geometry() {
+        // Estimates are exact without welding or removing any faces.
+        let source_map = source_map();
+        let stats = scan_source_map(&source_map, "main.ldr", &GeometrySettings::default());
+
+        let geometry = create_geometry(
+            source_map.get("a.dat").unwrap(),
+            &source_map,
+            "a.dat",
+            16,
+            true,
+            &GeometrySettings::default(),
+        );
+        let triangles: u32 = geometry.face_sizes.iter().map(|s| s - 2).sum();
+
+        let estimate = stats.part_estimates["a.dat"];
+        assert_eq!(estimate.triangles, triangles as usize);
+        assert_eq!(estimate.vertices, geometry.vertices.len());
+    }
+
+    #[test]
+    fn scan_source_map_preview() {
+        let stats = scan_source_map(
+            &source_map(),
+            "main.ldr",
+            &GeometrySettings {
+                preview: true,
+                ..Default::default()
+            },
+        );
+        assert_eq!(PREVIEW_ESTIMATE, stats.part_estimates["a.dat"]);
+        assert_eq!(
+            GeometryEstimate {
+                triangles: 60,
+                vertices: 40,
+            },
+            stats.total_estimate
+        );
+    }
+}
@@ -1,5 +1,13 @@
+use glam::Vec3;
 use phf::phf_set;
 
+use crate::normals::face_normal;
+
+/// Faces with a smaller absolute normal Y component are considered vertical.
+const VERTICAL_MAX_NORMAL_Y: f32 = 0.05;
+/// Faces with a larger absolute normal Y component are considered horizontal.
+const HORIZONTAL_MIN_NORMAL_Y: f32 = 0.95;
+
 static SLOPE_PIECES: phf::Set<&'static str> = phf_set! {
     "962",
     "2341",
@@ -100,3 +108,60 @@ pub fn is_slope_piece(name: &str) -> bool {
     let name = name.trim_end_matches(|c: char| c.is_ascii_alphabetic());
     SLOPE_PIECES.contains(name)
 }
+
+/// `true` for each face that should use a grainy texture.
+/// Faces are grainy if they aren't studs and aren't horizontal or vertical.
+pub fn grainy_faces(
+    vertices: &[Vec3],
+    vertex_indices: &[u32],
+    face_starts: &[u32],
+    face_sizes: &[u32],
+    is_face_stud: &[bool],
+) -> Vec<bool> {
+    face_starts
+        .iter()
+        .zip(face_sizes)
+        .zip(is_face_stud)
+        .map(|((start, size), is_stud)| {
+            let face = &vertex_indices[*start as usize..*start as usize + *size as usize];
+            // Up is -Y in LDraw, so check both directions.
+            let y = face_normal(vertices, face).y.abs();
+            !is_stud && (VERTICAL_MAX_NORMAL_Y..=HORIZONTAL_MIN_NORMAL_Y).contains(&y)
+        })
+        .collect()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    use glam::vec3;
+
+    #[test]
+    fn slope_piece_suffixes() {
+        assert!(is_slope_piece("3039.dat"));
+        assert!(is_slope_piece("3040b.dat"));
+        assert!(!is_slope_piece("3001.dat"));
+        assert!(!is_slope_piece("3039"));
+    }
+
+    #[test]
+    fn grainy_faces_slopes() {
+        let vertices = vec![
+            vec3(0.0, 0.0, 0.0),
+            vec3(1.0, 0.0, 0.0),
+            vec3(0.0, 0.0, 1.0),
+            vec3(0.0, 1.0, 0.0),
+            vec3(0.0, 1.0, 1.0),
+        ];
+        // Horizontal, vertical, sloped, and a sloped stud face.
+        let grainy = grainy_faces(
+            &vertices,
+            &[0, 1, 2, 0, 2, 4, 3, 1, 4, 3, 1, 4],
+            &[0, 3, 6, 9],
+            &[3, 3, 3, 3],
+            &[false, false, false, true],
+        );
+        assert_eq!(vec![false, false, true, false], grainy);
+    }
+}
@@ -0,0 +1,165 @@
+use glam::{vec3, Vec2, Vec3, Vec3Swizzles};
+
+use crate::{geometry::create_geometry, DiskResolver, GeometrySettings, PrimitiveResolution};
+
+/// The stud top in stud space has a radius of 6 LDU at `y = -4`.
+const STUD_RADIUS: f32 = 6.0;
+const STUD_TOP: f32 = -4.0;
+
+/// A normal and height map of the stud logo for the UVs in
+/// [LDrawStudLogoInfo](struct.LDrawStudLogoInfo.html).
+#[derive(Debug, PartialEq)]
+pub struct StudLogoMap {
+    /// The width and height of the square map in pixels.
+    pub resolution: usize,
+    /// RGBA pixels in rows from `v = 0` to `v = 1`.
+    /// RGB is the tangent space normal remapped to the range 0.0 to 1.0
+    /// and alpha is the height of the logo relief normalized to the range 0.0 to 1.0.
+    pub pixels: Vec<[f32; 4]>,
+}
+
+/// Bake the modeled logo of `stud-logo4.dat` into a texture for plain studs
+/// with [StudType::LogoNormalMap](enum.StudType.html#variant.LogoNormalMap).
+///
+/// Returns `None` if the library doesn't contain the logo stud.
+#[tracing::instrument]
+pub fn bake_stud_logo(ldraw_path: &str, resolution: usize) -> Option<StudLogoMap> {
+    let resolver =
+        DiskResolver::new_from_library(ldraw_path, std::iter::empty(), PrimitiveResolution::Normal);
+    let mut source_map = weldr::SourceMap::new();
+    let name = weldr::parse("stud-logo4.dat", &resolver, &mut source_map).ok()?;
+    let source_file = source_map.get(&name)?;
+
+    // Triangles are easier to rasterize.
+    let settings = GeometrySettings {
+        triangulate: true,
+        ..Default::default()
+    };
+    let geometry = create_geometry(source_file, &source_map, &name, 16, true, &settings);
+
+    let heights = rasterize_heights(&geometry.vertices, &geometry.vertex_indices, resolution);
+    Some(StudLogoMap {
+        resolution,
+        pixels: height_map_pixels(&heights, resolution),
+    })
+}
+
+/// The highest point above the stud top for the center of each pixel.
+fn rasterize_heights(vertices: &[Vec3], vertex_indices: &[u32], resolution: usize) -> Vec<f32> {
+    let mut heights = vec![0.0f32; resolution * resolution];
+    let texel_size = 2.0 * STUD_RADIUS / resolution as f32;
+
+    for triangle in vertex_indices.chunks_exact(3) {
+        let [a, b, c] = [0, 1, 2].map(|i| vertices[triangle[i] as usize]);
+
+        // Walls of the logo don't cover any area when viewed from above.
+        let [pa, pb, pc] = [a, b, c].map(|v| v.xz());
+        let area = (pb - pa).perp_dot(pc - pa);
+        if area.abs() < 1e-6 {
+            continue;
+        }
+
+        // Only visit the pixels overlapping the triangle's bounds.
+        let to_pixel = |x: f32| (x + STUD_RADIUS) / texel_size - 0.5;
+        let min = pa.min(pb).min(pc);
+        let max = pa.max(pb).max(pc);
+        let start = [min.x, min.y].map(|x| to_pixel(x).ceil().max(0.0) as usize);
+        let end = [max.x, max.y].map(|x| (to_pixel(x).floor() + 1.0).max(0.0) as usize);
+
+        for j in start[1]..end[1].min(resolution) {
+            for i in start[0]..end[0].min(resolution) {
+                let p = Vec2::new(i as f32 + 0.5, j as f32 + 0.5) * texel_size - STUD_RADIUS;
+
+                // Barycentric coordinates for interpolating the height.
+                let w0 = (pc - pb).perp_dot(p - pb) / area;
+                let w1 = (pa - pc).perp_dot(p - pc) / area;
+                let w2 = 1.0 - w0 - w1;
+                if w0 < -1e-5 || w1 < -1e-5 || w2 < -1e-5 {
+                    continue;
+                }
+
+                // Up is -Y in LDraw, so higher points have smaller y values.
+                let y = w0 * a.y + w1 * b.y + w2 * c.y;
+                let height = &mut heights[j * resolution + i];
+                *height = height.max(STUD_TOP - y);
+            }
+        }
+    }
+
+    heights
+}
+
+fn height_map_pixels(heights: &[f32], resolution: usize) -> Vec<[f32; 4]> {
+    let texel_size = 2.0 * STUD_RADIUS / resolution as f32;
+    let max_height = heights.iter().copied().fold(0.0, f32::max);
+
+    let height =
+        |i: usize, j: usize| heights[j.min(resolution - 1) * resolution + i.min(resolution - 1)];
+
+    let mut pixels = Vec::with_capacity(heights.len());
+    for j in 0..resolution {
+        for i in 0..resolution {
+            // Central differences in LDU preserve the steepness of the modeled relief.
+            let dx = (height(i + 1, j) - height(i.saturating_sub(1), j)) / (2.0 * texel_size);
+            let dz = (height(i, j + 1) - height(i, j.saturating_sub(1))) / (2.0 * texel_size);
+
+            // The tangent and bitangent follow the UVs along +X and +Z.
+            let normal = vec3(-dx, -dz, 1.0).normalize() * 0.5 + 0.5;
+            let h = if max_height > 0.0 {
+                height(i, j) / max_height
+            } else {
+                0.0
+            };
+            pixels.push([normal.x, normal.y, normal.z, h]);
+        }
+    }
+
+    pixels
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn rasterize_heights_raised_square() {
+        // A square 1 LDU above the stud top covering the center of the stud.
+        let vertices = vec![
+            vec3(-3.0, -5.0, -3.0),
+            vec3(3.0, -5.0, -3.0),
+            vec3(3.0, -5.0, 3.0),
+            vec3(-3.0, -5.0, 3.0),
+            // The stud top itself.
+            vec3(-6.0, -4.0, -6.0),
+            vec3(6.0, -4.0, -6.0),
+            vec3(6.0, -4.0, 6.0),
+        ];
+        let heights = rasterize_heights(&vertices, &[0, 1, 2, 0, 2, 3, 4, 5, 6], 4);
+        assert_eq!(
+            vec![
+                0.0, 0.0, 0.0, 0.0, //
+                0.0, 1.0, 1.0, 0.0, //
+                0.0, 1.0, 1.0, 0.0, //
+                0.0, 0.0, 0.0, 0.0, //
+            ],
+            heights
+        );
+    }
+
+    #[test]
+    fn height_map_pixels_flat() {
+        assert_eq!(
+            vec![[0.5, 0.5, 1.0, 0.0]; 4],
+            height_map_pixels(&[0.0; 4], 2)
+        );
+    }
+
+    #[test]
+    fn height_map_pixels_slope() {
+        // Heights increasing along +X tilt the normal towards -X.
+        let pixels = height_map_pixels(&[0.0, 3.0, 0.0, 3.0], 2);
+        assert_eq!(1.0, pixels[1][3]);
+        assert!(pixels[0][0] < 0.5);
+        assert_eq!(0.5, pixels[0][1]);
+    }
+}
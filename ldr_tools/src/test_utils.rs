@@ -0,0 +1,41 @@
+use std::collections::HashMap;
+
+/// An in memory resolver for parsing test documents.
+pub struct DummyResolver {
+    pub files: HashMap<&'static str, Vec<u8>>,
+}
+
+impl DummyResolver {
+    pub fn new() -> Self {
+        Self {
+            files: HashMap::new(),
+        }
+    }
+}
+
+impl<const N: usize> From<[(&'static str, &'static str); N]> for DummyResolver {
+    fn from(files: [(&'static str, &'static str); N]) -> Self {
+        Self {
+            files: files
+                .into_iter()
+                .map(|(name, contents)| (name, contents.as_bytes().to_vec()))
+                .collect(),
+        }
+    }
+}
+
+impl weldr::FileRefResolver for DummyResolver {
+    fn resolve<P: AsRef<std::path::Path>>(
+        &self,
+        filename: P,
+    ) -> Result<Vec<u8>, weldr::ResolveError> {
+        let filename = filename.as_ref().to_str().unwrap();
+        self.files
+            .get(filename)
+            .cloned()
+            .ok_or(weldr::ResolveError {
+                filename: filename.to_owned(),
+                resolve_error: None,
+            })
+    }
+}
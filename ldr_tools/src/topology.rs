@@ -0,0 +1,148 @@
+use std::collections::HashMap;
+
+use glam::Vec3;
+
+/// Calculate the unique undirected edges and the edge index for each face corner.
+/// The edge for a corner connects the corner to the next corner in the face.
+///
+/// This matches the edges and loop edge indices in Blender's mesh layout.
+pub fn face_edges(
+    vertex_indices: &[u32],
+    face_starts: &[u32],
+    face_sizes: &[u32],
+) -> (Vec<[u32; 2]>, Vec<u32>) {
+    let mut edges = Vec::new();
+    let mut corner_edges = vec![0; vertex_indices.len()];
+    let mut edge_by_vertices = HashMap::new();
+
+    for (start, size) in face_starts.iter().zip(face_sizes) {
+        let start = *start as usize;
+        let size = *size as usize;
+        for i in 0..size {
+            let v0 = vertex_indices[start + i];
+            let v1 = vertex_indices[start + (i + 1) % size];
+            let edge = [v0.min(v1), v0.max(v1)];
+
+            corner_edges[start + i] = *edge_by_vertices.entry(edge).or_insert_with(|| {
+                edges.push(edge);
+                edges.len() as u32 - 1
+            });
+        }
+    }
+
+    (edges, corner_edges)
+}
+
+/// Returns `true` if the face has at least 3 vertices, no repeated vertices,
+/// and only references vertices in the range `0..vertex_count`.
+///
+/// Blender removes faces that don't meet these requirements when validating meshes.
+pub fn is_valid_face(face: &[u32], vertex_count: usize) -> bool {
+    face.len() >= 3
+        && face.iter().all(|v| (*v as usize) < vertex_count)
+        && face
+            .iter()
+            .enumerate()
+            .all(|(i, v)| !face[i + 1..].contains(v))
+}
+
+/// The area of a possibly non planar polygon.
+pub fn face_area(vertices: &[Vec3], face: &[u32]) -> f32 {
+    let origin = vertices[face[0] as usize];
+    let mut cross = Vec3::ZERO;
+    for (i, v0) in face.iter().enumerate() {
+        let v1 = face[(i + 1) % face.len()];
+        cross += (vertices[*v0 as usize] - origin).cross(vertices[v1 as usize] - origin);
+    }
+    cross.length() * 0.5
+}
+
+/// Rotate and reverse the face if needed to start with the smallest vertex index
+/// followed by the smaller of its neighbors.
+///
+/// Faces with the same vertices in the same or opposite winding order have the same key.
+pub fn undirected_face(face: &[u32]) -> Vec<u32> {
+    let Some(start) = (0..face.len()).min_by_key(|i| face[*i]) else {
+        return Vec::new();
+    };
+    let next = face[(start + 1) % face.len()];
+    let prev = face[(start + face.len() - 1) % face.len()];
+
+    if next <= prev {
+        (0..face.len())
+            .map(|i| face[(start + i) % face.len()])
+            .collect()
+    } else {
+        (0..face.len())
+            .map(|i| face[(start + face.len() - i) % face.len()])
+            .collect()
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn face_edges_quad() {
+        // Quad of two tris.
+        // 2 - 3
+        // | \ |
+        // 0 - 1
+        assert_eq!(
+            (
+                vec![[0, 1], [1, 2], [0, 2], [1, 3], [2, 3]],
+                vec![0, 1, 2, 1, 3, 4]
+            ),
+            face_edges(&[0, 1, 2, 2, 1, 3], &[0, 3], &[3, 3])
+        );
+    }
+
+    #[test]
+    fn face_edges_two_quads() {
+        // 3 - 2 - 5
+        // |   |   |
+        // 0 - 1 - 4
+        assert_eq!(
+            (
+                vec![[0, 1], [1, 2], [2, 3], [0, 3], [1, 4], [4, 5], [2, 5]],
+                vec![0, 1, 2, 3, 4, 5, 6, 1]
+            ),
+            face_edges(&[0, 1, 2, 3, 1, 4, 5, 2], &[0, 4], &[4, 4])
+        );
+    }
+
+    #[test]
+    fn is_valid_face_degenerate() {
+        assert!(is_valid_face(&[0, 1, 2], 3));
+        assert!(is_valid_face(&[0, 1, 2, 3], 4));
+        assert!(!is_valid_face(&[0, 1], 3));
+        assert!(!is_valid_face(&[0, 1, 0], 3));
+        assert!(!is_valid_face(&[0, 1, 2, 1], 3));
+        assert!(!is_valid_face(&[0, 1, 3], 3));
+    }
+
+    #[test]
+    fn face_area_quad() {
+        let vertices = [
+            Vec3::new(0.0, 0.0, 0.0),
+            Vec3::new(2.0, 0.0, 0.0),
+            Vec3::new(2.0, 3.0, 0.0),
+            Vec3::new(0.0, 3.0, 0.0),
+        ];
+        assert_eq!(6.0, face_area(&vertices, &[0, 1, 2, 3]));
+        assert_eq!(0.0, face_area(&vertices, &[0, 1, 1]));
+    }
+
+    #[test]
+    fn undirected_face_winding() {
+        assert_eq!(vec![0, 1, 2], undirected_face(&[0, 1, 2]));
+        assert_eq!(vec![0, 1, 2], undirected_face(&[1, 2, 0]));
+        assert_eq!(vec![0, 1, 2], undirected_face(&[2, 1, 0]));
+        assert_eq!(vec![1, 2, 3, 4], undirected_face(&[3, 2, 1, 4]));
+        assert_ne!(
+            undirected_face(&[0, 1, 2, 3]),
+            undirected_face(&[0, 2, 1, 3])
+        );
+    }
+}
@@ -21,8 +21,13 @@ def menuImport(self, context):
     )
 
 
+def menuRefine(self, context):
+    self.layout.operator(operator.RefineOperator.bl_idname)
+
+
 classes = [
     operator.ImportOperator,
+    operator.RefineOperator,
     operator.LIST_OT_NewItem,
     operator.LIST_OT_DeleteItem,
 ]
@@ -37,6 +42,7 @@ def register():
     )
 
     bpy.types.TOPBAR_MT_file_import.append(menuImport)
+    bpy.types.VIEW3D_MT_object.append(menuRefine)
 
 
 def unregister():
@@ -46,6 +52,7 @@ def unregister():
     del bpy.types.Scene.ldr_path_to_add
 
     bpy.types.TOPBAR_MT_file_import.remove(menuImport)
+    bpy.types.VIEW3D_MT_object.remove(menuRefine)
 
 
 if __name__ == "__main__":
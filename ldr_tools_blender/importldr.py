@@ -2,9 +2,14 @@ import bpy
 import numpy as np
 import mathutils
 import math
+import os
+import hashlib
 import struct
 import typing
 import itertools
+import threading
+import time
+from dataclasses import dataclass
 
 from bpy.types import (
     Mesh,
@@ -16,38 +21,323 @@ from bpy.types import (
     GeometryNodeObjectInfo,
     GeometryNodeInputNamedAttribute,
     GeometryNodeInstanceOnPoints,
+    GeometryNodeCollectionInfo,
     FunctionNodeAxisAngleToRotation,
+    NodeSocketCollection,
 )
 
 if typing.TYPE_CHECKING:
     import ldr_tools_py
-    from ldr_tools_py import LDrawNode, LDrawGeometry, LDrawColor, GeometrySettings
+    from ldr_tools_py import LDrawGeometry, LDrawColor, GeometrySettings
 else:
     from . import ldr_tools_py
-    from .ldr_tools_py import LDrawNode, LDrawGeometry, LDrawColor, GeometrySettings
+    from .ldr_tools_py import LDrawGeometry, LDrawColor, GeometrySettings
+
+from .material import (
+    get_material,
+    get_attribute_material,
+    color_attributes,
+    viewport_color,
+    STUD_LOGO_IMAGE,
+    STUD_LOGO_UV_MAP,
+    STUD_TOP_ATTRIBUTE,
+    GRAINY_ATTRIBUTE,
+)
 
-from .material import get_material
+from .node_dsl import NodeGraph, GraphNode
 
-from .node_dsl import NodeGraph
 
+@dataclass
+class ImportProgress:
+    """The number of completed items for the current stage of an import."""
 
-def import_ldraw(
-    operator: bpy.types.Operator,
-    filepath: str,
-    ldraw_path: str,
-    additional_paths: list[str],
-    instance_type: str,
-    settings: GeometrySettings,
+    stage: str
+    completed: int
+    total: int
+
+    def fraction(self) -> float:
+        return self.completed / self.total if self.total > 0 else 1.0
+
+
+# The width and height of the baked stud logo normal map.
+STUD_LOGO_RESOLUTION = 512
+
+# Custom properties on preview meshes for finding their full geometry when refining.
+PREVIEW_FILEPATH = "ldr_preview_filepath"
+PREVIEW_GEOMETRY_NAME = "ldr_preview_geometry_name"
+PREVIEW_MESH_COLOR = "ldr_preview_mesh_color"
+
+# The custom property and mesh name for meshes saved in a MeshLibrary.
+LIBRARY_KEY = "ldr_library_key"
+# Increment when changes to mesh or material creation make saved meshes outdated.
+MESH_LIBRARY_VERSION = 2
+
+
+ImportSteps: typing.TypeAlias = typing.Generator[
+    ImportProgress, None, ldr_tools_py.MemoryReport
+]
+
+# The geometry name and mesh color or None for attribute colors.
+MeshKey: typing.TypeAlias = tuple[str, int | None]
+
+T = typing.TypeVar("T")
+
+
+class LDrawImport:
+    """An import split into small steps to keep the UI responsive."""
+
+    def __init__(
+        self,
+        filepath: str,
+        ldraw_path: str,
+        additional_paths: list[str],
+        instance_type: str,
+        settings: GeometrySettings,
+        attribute_colors: bool,
+        mesh_library_path: str = "",
+    ) -> None:
+        self.filepath = filepath
+        self.ldraw_path = ldraw_path
+        self.additional_paths = additional_paths
+        self.instance_type = instance_type
+        self.settings = settings
+        self.attribute_colors = attribute_colors
+        self.mesh_library_path = mesh_library_path
+
+        self.memory: ldr_tools_py.MemoryReport | None = None
+        self.stage_times: dict[str, float] = {}
+
+        # Only remove data created by the import steps when canceling.
+        # The modal operator passes events through, so the user may add data between steps.
+        self.created_ids: set[int] = set()
+
+    def steps(self) -> typing.Iterator[ImportProgress]:
+        steps = self.import_steps()
+        while True:
+            # Each step yields after its work, so time the work before each yield.
+            before_ids = {data.as_pointer() for data in blender_ids()}
+            start = time.perf_counter()
+            try:
+                progress = next(steps)
+            except StopIteration as stop:
+                self.memory = stop.value
+                return
+            finally:
+                elapsed = time.perf_counter() - start
+                self.add_created_ids(before_ids)
+
+            self.stage_times[progress.stage] = (
+                self.stage_times.get(progress.stage, 0.0) + elapsed
+            )
+            yield progress
+
+    def import_steps(self) -> ImportSteps:
+        color_by_code = ldr_tools_py.load_color_table(self.ldraw_path)
+
+        if self.settings.stud_type == ldr_tools_py.StudType.LogoNormalMap:
+            # Materials for stud tops reference the image, so bake it first.
+            load_stud_logo(self.ldraw_path)
+
+        # Preview boxes are faster to create than to load from the library.
+        library = None
+        if self.mesh_library_path and not self.settings.preview:
+            library = MeshLibrary(self.mesh_library_path)
+            # Older versions saved the library to a single .blend file.
+            if os.path.isfile(library.folder):
+                print(f"Mesh library {library.folder} is a file instead of a folder")
+                library = None
+
+        # TODO: Add an option to make the lowest point have a height of 0 using obj.dimensions?
+        if self.instance_type == "SingleInstancer":
+            return (
+                yield from import_single_instancer(
+                    self.filepath,
+                    self.ldraw_path,
+                    self.additional_paths,
+                    color_by_code,
+                    self.settings,
+                    self.attribute_colors,
+                    library,
+                )
+            )
+        elif self.instance_type == "GeometryNodes":
+            return (
+                yield from import_instanced(
+                    self.filepath,
+                    self.ldraw_path,
+                    self.additional_paths,
+                    color_by_code,
+                    self.settings,
+                    self.attribute_colors,
+                    library,
+                )
+            )
+        else:
+            return (
+                yield from import_objects(
+                    self.filepath,
+                    self.ldraw_path,
+                    self.additional_paths,
+                    color_by_code,
+                    self.settings,
+                    self.attribute_colors,
+                    library,
+                )
+            )
+
+    def add_created_ids(self, before_ids: set[int]) -> None:
+        after_ids = {data.as_pointer() for data in blender_ids()}
+        # Forget removed data in case Blender reuses the pointer for other data.
+        self.created_ids &= after_ids
+        self.created_ids |= after_ids - before_ids
+
+    def cancel(self) -> None:
+        created = [
+            data for data in blender_ids() if data.as_pointer() in self.created_ids
+        ]
+        bpy.data.batch_remove(created)
+
+    def report(self, operator: bpy.types.Operator) -> None:
+        timings = ", ".join(f"{k} {v:.2f}s" for k, v in self.stage_times.items())
+        total = sum(self.stage_times.values())
+        print(f"Import: {total:.2f}s ({timings})")
+        operator.report({"INFO"}, f"Imported in {total:.2f}s ({timings})")
+
+        if self.memory is not None:
+            report_memory(operator, self.memory)
+
+
+class LDrawRefine:
+    """Replace the box meshes from preview imports with the full part geometry.
+
+    Objects and instancers keep using the same mesh data blocks by name,
+    so any edits made to the preview layout are preserved.
+    """
+
+    def __init__(
+        self,
+        ldraw_path: str,
+        additional_paths: list[str],
+        settings: GeometrySettings,
+    ) -> None:
+        self.ldraw_path = ldraw_path
+        self.additional_paths = additional_paths
+        self.settings = settings
+
+        # Meshes are still in LDraw units with any scale applied to the root object.
+        self.settings.scene_scale = 1.0
+        self.settings.preview = False
+        # Preview geometry names are the part names, so don't rename any geometry.
+        self.settings.deduplicate_geometry = False
+
+        self.refined_count = 0
+
+    def steps(self) -> typing.Iterator[ImportProgress]:
+        color_by_code = ldr_tools_py.load_color_table(self.ldraw_path)
+
+        if self.settings.stud_type == ldr_tools_py.StudType.LogoNormalMap:
+            load_stud_logo(self.ldraw_path)
+
+        meshes_by_file: dict[str, list[Mesh]] = {}
+        for mesh in bpy.data.meshes:
+            filepath = mesh.get(PREVIEW_FILEPATH)
+            if filepath is not None:
+                meshes_by_file.setdefault(filepath, []).append(mesh)
+
+        for filepath, meshes in meshes_by_file.items():
+            scene = yield from load_in_background(
+                lambda: ldr_tools_py.load_file_instanced(
+                    filepath, self.ldraw_path, self.additional_paths, self.settings
+                )
+            )
+            images = load_images(scene.textures)
+
+            for completed, mesh in enumerate(meshes, start=1):
+                geometry = scene.geometry_cache.get(mesh[PREVIEW_GEOMETRY_NAME])
+                if geometry is not None:
+                    replace_mesh(mesh, geometry, color_by_code, images)
+                    self.refined_count += 1
+
+                yield ImportProgress("Meshes", completed, len(meshes))
+
+
+def load_in_background(
+    load: typing.Callable[[], T],
+) -> typing.Generator[ImportProgress, None, T]:
+    # Loading releases the GIL, so the UI can update while waiting.
+    result: list[T] = []
+    errors: list[BaseException] = []
+
+    def run() -> None:
+        try:
+            result.append(load())
+        except BaseException as e:
+            # Rust panics aren't subclasses of Exception.
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while thread.is_alive():
+        thread.join(timeout=0.01)
+        yield ImportProgress("Loading", 0, 1)
+
+    if errors:
+        raise errors[0]
+    yield ImportProgress("Loading", 1, 1)
+    return result[0]
+
+
+def replace_mesh(
+    mesh: Mesh,
+    geometry: LDrawGeometry,
+    color_by_code: dict[int, LDrawColor],
+    images: list[bpy.types.Image],
 ) -> None:
-    color_by_code = ldr_tools_py.load_color_table(ldraw_path)
+    mesh_color = mesh[PREVIEW_MESH_COLOR]
+    name = mesh.name
+    refined = create_colored_mesh_from_geometry(
+        name,
+        None if mesh_color < 0 else mesh_color,
+        color_by_code,
+        geometry,
+        images,
+    )
 
-    # TODO: Add an option to make the lowest point have a height of 0 using obj.dimensions?
-    if instance_type == "GeometryNodes":
-        import_instanced(
-            filepath, ldraw_path, additional_paths, color_by_code, settings
-        )
-    elif instance_type == "LinkedDuplicates":
-        import_objects(filepath, ldraw_path, additional_paths, color_by_code, settings)
+    # Objects and geometry node instances all reference the mesh data block.
+    mesh.user_remap(refined)
+    bpy.data.meshes.remove(mesh)
+    refined.name = name
+
+
+def blender_ids() -> typing.Iterator[bpy.types.ID]:
+    # The types of data created when importing.
+    yield from bpy.data.objects
+    yield from bpy.data.meshes
+    yield from bpy.data.materials
+    yield from bpy.data.images
+    yield from bpy.data.node_groups
+    yield from bpy.data.collections
+
+
+def report_memory(
+    operator: bpy.types.Operator, memory: ldr_tools_py.MemoryReport
+) -> None:
+    mb = 1024 * 1024
+    print(
+        f"Memory: {memory.total_bytes / mb:.1f} MB total, {memory.peak_bytes / mb:.1f} MB peak, "
+        f"{memory.texture_bytes / mb:.1f} MB textures, {memory.instance_bytes / mb:.1f} MB instances"
+    )
+
+    # Let the user know the imported scene doesn't match the selected settings.
+    for degradation in memory.degradations:
+        if degradation == ldr_tools_py.Degradation.LowPrimitiveResolution:
+            message = "Using low primitive resolution to fit the memory budget"
+        elif degradation == ldr_tools_py.Degradation.PlainStuds:
+            message = "Using studs without logos to fit the memory budget"
+        else:
+            count = len(memory.proxy_geometry_names)
+            message = f"Replaced {count} parts with boxes to fit the memory budget"
+        operator.report({"WARNING"}, message)
 
 
 def import_objects(
@@ -56,63 +346,179 @@ def import_objects(
     additional_paths: list[str],
     color_by_code: dict[int, LDrawColor],
     settings: GeometrySettings,
-) -> None:
-    # Create an object for each part in the scene.
-    # This still uses instances the mesh data blocks for reduced memory usage.
-    blender_mesh_cache: dict[tuple[str, int], Mesh] = {}
-
+    attribute_colors: bool,
+    library: "MeshLibrary | None" = None,
+) -> ImportSteps:
     # Don't scale any coordinates on the Rust side, just change the scale of the parent object
     scale = settings.scene_scale
     settings.scene_scale = 1.0
 
-    scene = ldr_tools_py.load_file(filepath, ldraw_path, additional_paths, settings)
+    scene = yield from load_in_background(
+        lambda: ldr_tools_py.load_file(filepath, ldraw_path, additional_paths, settings)
+    )
 
-    root_obj = add_nodes(
-        scene.root_node, scene.geometry_cache, blender_mesh_cache, color_by_code
+    preview_filepath = filepath if settings.preview else None
+    importer = ObjectImporter(
+        scene, color_by_code, attribute_colors, preview_filepath, library
     )
+    yield from importer.create_meshes()
+    root_obj = yield from importer.add_hierarchy(0, bpy.context.collection)
+
     # Account for Blender having a different coordinate system.
     root_obj.rotation_euler = mathutils.Euler((math.radians(-90.0), 0.0, 0.0), "XYZ")
     root_obj.scale = (scale, scale, scale)
 
+    return scene.memory
+
+
+class ObjectImporter:
+    def __init__(
+        self,
+        scene: ldr_tools_py.LDrawScene,
+        color_by_code: dict[int, LDrawColor],
+        attribute_colors: bool,
+        preview_filepath: str | None = None,
+        library: "MeshLibrary | None" = None,
+    ) -> None:
+        # Use the flattened hierarchy to avoid converting nested nodes from Rust.
+        self.table = scene.node_table
+        self.geometry_cache = scene.geometry_cache
+        self.color_by_code = color_by_code
+        self.attribute_colors = attribute_colors
+        self.preview_filepath = preview_filepath
+        self.library = library
+
+        # Images are shared by all parts using the same texture.
+        self.images = load_images(scene.textures)
+
+        # Convert all the column major transforms at once.
+        self.transforms = self.table.transforms.transpose(0, 2, 1)
+
+        # Create an object for each part in the scene.
+        # This still uses instances the mesh data blocks for reduced memory usage.
+        self.blender_mesh_cache: dict[MeshKey, Mesh] = {}
+
+        # Submodels referenced more than once are only created once as a collection.
+        self.submodel_collections: dict[int, bpy.types.Collection] = {}
+        submodel_ids = self.table.submodel_ids
+        self.submodel_counts = np.bincount(
+            submodel_ids[submodel_ids >= 0], minlength=len(self.table.submodels)
+        )
 
-def add_nodes(
-    node: LDrawNode,
-    geometry_cache: dict[str, LDrawGeometry],
-    blender_mesh_cache: dict[tuple[str, int], Mesh],
-    color_by_code: dict[int, LDrawColor],
-) -> bpy.types.Object:
-
-    if node.geometry_name is not None:
-        geometry = geometry_cache[node.geometry_name]
+        # Each node in the table is added exactly once.
+        self.added_node_count = 0
+
+    def create_meshes(self) -> typing.Iterator[ImportProgress]:
+        # Create the meshes before any objects since this is usually the slowest stage.
+        # Attribute colors share a single mesh for all colors.
+        # Meshes use the name of the first node referencing the geometry.
+        table = self.table
+        mesh_names: dict[MeshKey, str] = {}
+        for i, geometry_id in enumerate(table.geometry_ids):
+            if geometry_id >= 0:
+                mesh_color = None if self.attribute_colors else int(table.colors[i])
+                key = (table.geometry_names[geometry_id], mesh_color)
+                if key not in mesh_names:
+                    mesh_names[key] = table.names[table.name_indices[i]]
+
+        self.blender_mesh_cache = yield from create_meshes(
+            mesh_names,
+            self.geometry_cache,
+            self.color_by_code,
+            self.images,
+            self.library,
+            self.preview_filepath,
+        )
 
-        # Cache meshes to optimize import times and instance mesh data.
-        # Linking an existing mesh data block greatly reduces memory usage.
-        mesh_key = (node.geometry_name, node.current_color)
+    def add_hierarchy(
+        self, start: int, collection: bpy.types.Collection
+    ) -> typing.Generator[ImportProgress, None, bpy.types.Object]:
+        # Parents always come before their children in the table.
+        objects: list[bpy.types.Object] = []
+        parent_indices = self.table.parent_indices
+
+        i = start
+        while True:
+            obj = yield from self.add_node(i, collection)
+            if objects:
+                obj.parent = objects[parent_indices[i] - start]
+            objects.append(obj)
+
+            i += 1
+            if i >= len(parent_indices) or parent_indices[i] < 0:
+                break
+
+        return objects[0]
+
+    def add_node(
+        self, i: int, collection: bpy.types.Collection
+    ) -> typing.Generator[ImportProgress, None, bpy.types.Object]:
+        table = self.table
+        name = table.names[table.name_indices[i]]
+        color = int(table.colors[i])
+        geometry_id = table.geometry_ids[i]
+        submodel_id = table.submodel_ids[i]
+
+        if submodel_id >= 0:
+            if self.submodel_counts[submodel_id] > 1:
+                # Place repeated submodels using collection instances.
+                obj = bpy.data.objects.new(name, None)
+                obj.instance_type = "COLLECTION"
+                obj.instance_collection = yield from self.submodel_collection(
+                    submodel_id
+                )
+                collection.objects.link(obj)
+            else:
+                start, _ = table.submodel_ranges[submodel_id]
+                obj = yield from self.add_hierarchy(int(start), collection)
+
+            # Submodel hierarchies use an identity transform.
+            obj.matrix_local = self.transforms[i]
+            yield self.node_progress()
+            return obj
+
+        if geometry_id >= 0:
+            geometry_name = table.geometry_names[geometry_id]
 
-        blender_mesh = blender_mesh_cache.get(mesh_key)
-        if blender_mesh is None:
-            mesh = create_colored_mesh_from_geometry(
-                node.name, node.current_color, color_by_code, geometry
-            )
+            # Use an existing mesh data block like with linked duplicates (alt+d).
+            # Linking an existing mesh data block greatly reduces memory usage.
+            mesh_color = None if self.attribute_colors else color
+            mesh = self.blender_mesh_cache[(geometry_name, mesh_color)]
+            obj = bpy.data.objects.new(name, mesh)
 
-            blender_mesh_cache[mesh_key] = mesh
-            obj = bpy.data.objects.new(node.name, mesh)
+            if self.attribute_colors:
+                set_color_properties(obj, self.color_by_code, color)
         else:
-            # Use an existing mesh data block like with linked duplicates (alt+d).
-            obj = bpy.data.objects.new(node.name, blender_mesh)
-    else:
-        # Create an empty by setting the data to None.
-        obj = bpy.data.objects.new(node.name, None)
+            # Create an empty by setting the data to None.
+            obj = bpy.data.objects.new(name, None)
+
+        # Each node is transformed relative to its parent.
+        obj.matrix_local = self.transforms[i]
+        collection.objects.link(obj)
 
-    # Each node is transformed relative to its parent.
-    obj.matrix_local = mathutils.Matrix(node.transform).transposed()
-    bpy.context.collection.objects.link(obj)
+        yield self.node_progress()
+        return obj
 
-    for child in node.children:
-        child_obj = add_nodes(child, geometry_cache, blender_mesh_cache, color_by_code)
-        child_obj.parent = obj
+    def node_progress(self) -> ImportProgress:
+        self.added_node_count += 1
+        return ImportProgress(
+            "Objects", self.added_node_count, len(self.table.parent_indices)
+        )
 
-    return obj
+    def submodel_collection(
+        self, submodel_id: int
+    ) -> typing.Generator[ImportProgress, None, bpy.types.Collection]:
+        collection = self.submodel_collections.get(submodel_id)
+        if collection is None:
+            name, color = self.table.submodels[submodel_id]
+            # The collection doesn't need to be in the scene to be instanced.
+            collection = bpy.data.collections.new(f"{name} {color}")
+
+            start, _ = self.table.submodel_ranges[submodel_id]
+            yield from self.add_hierarchy(int(start), collection)
+            self.submodel_collections[submodel_id] = collection
+
+        return collection
 
 
 def import_instanced(
@@ -121,24 +527,36 @@ def import_instanced(
     additional_paths: list[str],
     color_by_code: dict[int, LDrawColor],
     settings: GeometrySettings,
-) -> None:
+    attribute_colors: bool,
+    library: "MeshLibrary | None" = None,
+) -> ImportSteps:
     scale = settings.scene_scale
     settings.scene_scale = 1.0
 
     # Instance each part on the points of a mesh.
     # This avoids overhead from object creation for large scenes.
-    scene = ldr_tools_py.load_file_instanced_points(
-        filepath, ldraw_path, additional_paths, settings
+    scene = yield from load_in_background(
+        lambda: ldr_tools_py.load_file_instanced_points(
+            filepath, ldraw_path, additional_paths, settings
+        )
     )
 
-    # First create all the meshes and materials.
-    blender_mesh_cache = {}
-    for name, color in scene.geometry_point_instances:
-        geometry = scene.geometry_cache[name]
-
-        mesh = create_colored_mesh_from_geometry(name, color, color_by_code, geometry)
+    images = load_images(scene.textures)
 
-        blender_mesh_cache[(name, color)] = mesh
+    # First create all the meshes and materials.
+    # Attribute colors share a single mesh for all colors.
+    mesh_keys = dict.fromkeys(
+        (name, None if attribute_colors else color)
+        for name, color in scene.geometry_point_instances
+    )
+    blender_mesh_cache = yield from create_meshes(
+        {key: key[0] for key in mesh_keys},
+        scene.geometry_cache,
+        color_by_code,
+        images,
+        library,
+        filepath if settings.preview else None,
+    )
 
     root_obj = bpy.data.objects.new(scene.main_model_name, None)
     # Account for Blender having a different coordinate system.
@@ -147,8 +565,13 @@ def import_instanced(
     bpy.context.collection.objects.link(root_obj)
 
     # Instant each unique colored part on the faces of a mesh.
-    for (name, color), instances in scene.geometry_point_instances.items():
+    instance_count = len(scene.geometry_point_instances)
+    for completed, ((name, color), instances) in enumerate(
+        scene.geometry_point_instances.items(), start=1
+    ):
         instancer_mesh = create_instancer_mesh(f"{name}_{color}_instancer", instances)
+        if attribute_colors:
+            set_color_attributes(instancer_mesh, color_by_code, color)
 
         instancer_object = bpy.data.objects.new(
             f"{name}_{color}_instancer", instancer_mesh
@@ -157,8 +580,10 @@ def import_instanced(
 
         bpy.context.collection.objects.link(instancer_object)
 
-        mesh = blender_mesh_cache[(name, color)]
+        mesh = blender_mesh_cache[(name, None if attribute_colors else color)]
         instance_object = bpy.data.objects.new(f"{name}_{color}_instance", mesh)
+        if attribute_colors:
+            set_color_properties(instance_object, color_by_code, color)
         instance_object.parent = instancer_object
         bpy.context.collection.objects.link(instance_object)
 
@@ -172,6 +597,107 @@ def import_instanced(
         # This also avoids performance overhead from object creation.
         create_geometry_node_instancing(instancer_object, instance_object)
 
+        yield ImportProgress("Instancers", completed, instance_count)
+
+    return scene.memory
+
+
+def import_single_instancer(
+    filepath: str,
+    ldraw_path: str,
+    additional_paths: list[str],
+    color_by_code: dict[int, LDrawColor],
+    settings: GeometrySettings,
+    attribute_colors: bool,
+    library: "MeshLibrary | None" = None,
+) -> ImportSteps:
+    scale = settings.scene_scale
+    settings.scene_scale = 1.0
+
+    scene = yield from load_in_background(
+        lambda: ldr_tools_py.load_file_instanced_points(
+            filepath, ldraw_path, additional_paths, settings
+        )
+    )
+
+    images = load_images(scene.textures)
+
+    # Attribute colors share a single mesh for all colors.
+    mesh_keys = dict.fromkeys(
+        (name, None if attribute_colors else color)
+        for name, color in scene.geometry_point_instances
+    )
+    blender_mesh_cache = yield from create_meshes(
+        {key: key[0] for key in mesh_keys},
+        scene.geometry_cache,
+        color_by_code,
+        images,
+        library,
+        filepath if settings.preview else None,
+    )
+
+    instances = scene.geometry_point_instances
+    if not instances:
+        return scene.memory
+
+    # The collection isn't linked to the scene, so the part objects aren't visible.
+    parts = bpy.data.collections.new(f"{scene.main_model_name} Parts")
+
+    # Pick Instance sorts the collection children by name.
+    # Prefix names with the index to match the instance_index attribute.
+    digits = len(str(len(instances)))
+    for index, (name, color) in enumerate(instances):
+        mesh = blender_mesh_cache[(name, None if attribute_colors else color)]
+        obj = bpy.data.objects.new(f"{index:0{digits}}_{name}_{color}", mesh)
+        parts.objects.link(obj)
+
+        yield ImportProgress("Instances", index + 1, len(instances))
+
+    # Combine the instances for all parts into a single point cloud.
+    points = list(instances.values())
+    instancer_mesh = create_points_mesh(
+        f"{scene.main_model_name}_instancer",
+        np.concatenate([p.translations for p in points]),
+        np.concatenate([p.rotations_axis for p in points]),
+        np.concatenate([p.rotations_angle for p in points]),
+        np.concatenate([p.scales for p in points]),
+    )
+
+    counts = [p.translations.shape[0] for p in points]
+    index_attribute = instancer_mesh.attributes.new(
+        name="instance_index", type="INT", domain="POINT"
+    )
+    assert isinstance(index_attribute, bpy.types.IntAttribute)
+    index_attribute.data.foreach_set(
+        "value", np.repeat(np.arange(len(points), dtype=np.int32), counts)
+    )
+
+    if attribute_colors:
+        # Point attributes become instance attributes when instancing on points.
+        values = [color_attributes(color_by_code, color) for _, color in instances]
+        for attribute_name in values[0]:
+            colors = np.repeat([v[attribute_name] for v in values], counts, axis=0)
+            attribute = vector_attr(instancer_mesh, attribute_name, "POINT")
+            attribute.data.foreach_set("vector", colors.reshape(-1))
+
+    instancer_object = bpy.data.objects.new(scene.main_model_name, instancer_mesh)
+    # Account for Blender having a different coordinate system.
+    instancer_object.rotation_euler = mathutils.Euler(
+        (math.radians(-90.0), 0.0, 0.0), "XYZ"
+    )
+    instancer_object.scale = (scale, scale, scale)
+    bpy.context.collection.objects.link(instancer_object)
+
+    modifier = instancer_object.modifiers.new(name="GeometryNodes", type="NODES")
+    assert isinstance(modifier, NodesModifier)
+    tree = pick_instances_node_group()
+    modifier.node_group = tree
+    modifier[tree.interface.items_tree["Collection"].identifier] = parts  # type: ignore[index]
+
+    yield ImportProgress("Instancer", 1, 1)
+
+    return scene.memory
+
 
 def create_geometry_node_instancing(
     instancer_object: bpy.types.Object,
@@ -192,6 +718,31 @@ def create_geometry_node_instancing(
     group_input = graph.node(NodeGroupInput)
     group_input.node.location = (-380, 0)
 
+    rotation, scale_attribute = instance_rotation_and_scale(graph)
+
+    # Set the instance mesh.
+    instance_info = graph.node(GeometryNodeObjectInfo, {"Object": instance_object})
+    instance_info.node.location = (-380, -91)
+
+    # The instancer mesh's points define the instance translation.
+    instance_points = graph.node(
+        GeometryNodeInstanceOnPoints,
+        {
+            "Points": group_input,
+            "Instance": instance_info["Geometry"],
+            "Rotation": rotation,
+            "Scale": scale_attribute,
+        },
+    )
+    instance_points.node.location = (-190, 0)
+
+    output = graph.node(NodeGroupOutput, [instance_points])
+    output.node.location = (0, 0)
+
+
+def instance_rotation_and_scale(
+    graph: NodeGraph,
+) -> tuple[GraphNode, GraphNode]:
     # Scale instances from the custom attribute.
     scale_attribute = graph.node(
         GeometryNodeInputNamedAttribute,
@@ -218,16 +769,56 @@ def create_geometry_node_instancing(
     rotation = graph.node(FunctionNodeAxisAngleToRotation, [rot_axis, rot_angle])
     rotation.node.location = (-380, -318)
 
-    # Set the instance mesh.
-    instance_info = graph.node(GeometryNodeObjectInfo, {"Object": instance_object})
-    instance_info.node.location = (-380, -91)
+    return rotation, scale_attribute
+
+
+def pick_instances_node_group() -> GeometryNodeTree:
+    # Share a single node group with all imported scenes.
+    name = "Pick Instances (ldr_tools)"
+    tree = bpy.data.node_groups.get(name)
+    if tree is not None:
+        assert isinstance(tree, GeometryNodeTree)
+        return tree
+
+    tree = bpy.data.node_groups.new(name, "GeometryNodeTree")  # type: ignore[arg-type]
+    assert isinstance(tree, GeometryNodeTree)
+
+    graph = NodeGraph(tree)
+    graph.input(NodeSocketGeometry, "Geometry")
+    graph.input(NodeSocketCollection, "Collection")
+    graph.output(NodeSocketGeometry, "Geometry")
+
+    group_input = graph.node(NodeGroupInput)
+    group_input.node.location = (-570, 0)
+
+    rotation, scale_attribute = instance_rotation_and_scale(graph)
+
+    # Children are sorted by name, so names must match the instance index order.
+    collection_info = graph.node(
+        GeometryNodeCollectionInfo,
+        {
+            "Collection": group_input["Collection"],
+            "Separate Children": True,
+            "Reset Children": True,
+        },
+        transform_space="ORIGINAL",
+    )
+    collection_info.node.location = (-380, -91)
+
+    instance_index = graph.node(
+        GeometryNodeInputNamedAttribute,
+        data_type="INT",
+        inputs={"Name": "instance_index"},
+    )
+    instance_index.node.location = (-380, -200)
 
-    # The instancer mesh's points define the instance translation.
     instance_points = graph.node(
         GeometryNodeInstanceOnPoints,
         {
-            "Points": group_input,
-            "Instance": instance_info["Geometry"],
+            "Points": group_input["Geometry"],
+            "Instance": collection_info,
+            "Pick Instance": True,
+            "Instance Index": instance_index,
             "Rotation": rotation,
             "Scale": scale_attribute,
         },
@@ -237,12 +828,30 @@ def create_geometry_node_instancing(
     output = graph.node(NodeGroupOutput, [instance_points])
     output.node.location = (0, 0)
 
+    return tree
+
 
 def create_instancer_mesh(name: str, instances: ldr_tools_py.PointInstances) -> Mesh:
+    return create_points_mesh(
+        name,
+        instances.translations,
+        instances.rotations_axis,
+        instances.rotations_angle,
+        instances.scales,
+    )
+
+
+def create_points_mesh(
+    name: str,
+    translations: np.ndarray,
+    rotations_axis: np.ndarray,
+    rotations_angle: np.ndarray,
+    scales: np.ndarray,
+) -> Mesh:
     # Create a vertex at each instance.
     instancer_mesh = bpy.data.meshes.new(name)
 
-    positions = instances.translations
+    positions = translations
     if positions.shape[0] > 0:
         # Using foreach_set is faster than bmesh or from_pydata.
         # https://devtalk.blender.org/t/alternative-in-2-80-to-create-meshes-from-python-using-the-tessfaces-api/7445/3
@@ -253,51 +862,285 @@ def create_instancer_mesh(name: str, instances: ldr_tools_py.PointInstances) ->
         # Encode rotation and scale into custom attributes.
         # This allows geometry nodes to access the attributes later.
         scale_attribute = vector_attr(instancer_mesh, "instance_scale", "POINT")
-        scale_attribute.data.foreach_set("vector", instances.scales.reshape(-1))
+        scale_attribute.data.foreach_set("vector", scales.reshape(-1))
 
         rot_axis_attribute = vector_attr(
             instancer_mesh, "instance_rotation_axis", "POINT"
         )
-        rot_axis_attribute.data.foreach_set(
-            "vector", instances.rotations_axis.reshape(-1)
-        )
+        rot_axis_attribute.data.foreach_set("vector", rotations_axis.reshape(-1))
 
         rot_angle_attribute = float_attr(
             instancer_mesh, "instance_rotation_angle", "POINT"
         )
-        rot_angle_attribute.data.foreach_set("value", instances.rotations_angle)
+        rot_angle_attribute.data.foreach_set("value", rotations_angle)
+
+    # The mesh only has points, so there are no edges or faces to validate.
+    if bpy.app.debug:
+        validate_mesh(instancer_mesh)
 
-    instancer_mesh.validate()
-    instancer_mesh.update()
     return instancer_mesh
 
 
+def create_meshes(
+    mesh_names: dict[MeshKey, str],
+    geometry_cache: dict[str, LDrawGeometry],
+    color_by_code: dict[int, LDrawColor],
+    images: list[bpy.types.Image],
+    library: "MeshLibrary | None" = None,
+    preview_filepath: str | None = None,
+) -> typing.Generator[ImportProgress, None, dict[MeshKey, Mesh]]:
+    # Load all the saved meshes before creating any meshes to merge their materials once.
+    library_keys: dict[MeshKey, str] = {}
+    library_meshes: dict[str, Mesh] = {}
+    if library is not None:
+        for key in mesh_names:
+            geometry_name, mesh_color = key
+            library_key = library.key(geometry_cache[geometry_name], mesh_color)
+            if library_key is not None:
+                library_keys[key] = library_key
+        library_meshes = library.load(set(library_keys.values()))
+
+    meshes: dict[MeshKey, Mesh] = {}
+    for completed, (key, name) in enumerate(mesh_names.items(), start=1):
+        geometry_name, mesh_color = key
+        library_key = library_keys.get(key)
+
+        mesh = library_meshes.get(library_key) if library_key is not None else None
+        if mesh is not None:
+            mesh.name = name
+        else:
+            mesh = create_colored_mesh_from_geometry(
+                name, mesh_color, color_by_code, geometry_cache[geometry_name], images
+            )
+            if library is not None and library_key is not None:
+                library.add(library_key, mesh)
+
+        if preview_filepath is not None:
+            tag_preview_mesh(mesh, preview_filepath, geometry_name, mesh_color)
+
+        meshes[key] = mesh
+        yield ImportProgress("Meshes", completed, len(mesh_names))
+
+    if library is not None:
+        library.save()
+
+    return meshes
+
+
+class MeshLibrary:
+    """A folder of .blend files with meshes and materials reused across imports.
+
+    Meshes are identified by a hash of the geometry and color from ldr_tools,
+    so changing settings that affect the geometry creates new entries.
+    Each mesh is saved to its own file, so saving never rewrites existing entries
+    and concurrent imports only replace a file with an identical mesh.
+    Loaded meshes are appended, so editing them doesn't modify the library.
+
+    The geometry is still loaded by ldr_tools to compute the keys,
+    so the library only saves the time for creating Blender meshes and materials.
+    """
+
+    def __init__(self, folder: str) -> None:
+        self.folder = bpy.path.abspath(folder)
+        # Meshes created by this import to write to the library.
+        self.new_meshes: dict[str, Mesh] = {}
+
+    def key(self, geometry: LDrawGeometry, mesh_color: int | None) -> str | None:
+        # Images are named by their index in each scene, so they can't be reused.
+        if geometry.texture_info is not None:
+            return None
+
+        h = hashlib.sha1()
+        h.update(f"{MESH_LIBRARY_VERSION} {mesh_color}".encode())
+        arrays = [
+            geometry.vertices,
+            geometry.vertex_indices,
+            geometry.face_start_indices,
+            geometry.face_sizes,
+            geometry.face_colors,
+            geometry.edges,
+            geometry.corner_normals,
+            geometry.is_corner_edge_sharp,
+            geometry.is_face_grainy,
+        ]
+        if stud_logo_info := geometry.stud_logo_info:
+            arrays += [stud_logo_info.is_face_stud_top, stud_logo_info.uvs]
+
+        for array in arrays:
+            # Include the length to distinguish arrays with no elements.
+            h.update(len(array).to_bytes(8, "little"))
+            h.update(np.ascontiguousarray(array).tobytes())
+
+        h.update(bytes([geometry.has_grainy_slopes]))
+
+        # Mesh names are limited to 63 bytes in Blender.
+        return f"ldr {h.hexdigest()[:24]}"
+
+    def filepath(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key.replace(' ', '_')}.blend")
+
+    def load(self, keys: set[str]) -> dict[str, Mesh]:
+        existing_ids = {data.as_pointer() for data in blender_ids()}
+
+        meshes = {}
+        for key in keys:
+            filepath = self.filepath(key)
+            if not os.path.isfile(filepath):
+                continue
+
+            with bpy.data.libraries.load(filepath) as (data_from, data_to):
+                data_to.meshes = [name for name in data_from.meshes if name == key]
+
+            for mesh in data_to.meshes:
+                if mesh is not None:
+                    meshes[mesh[LIBRARY_KEY]] = mesh
+
+            # Each file has its own copy of the materials.
+            merge_appended_data(existing_ids)
+
+        return meshes
+
+    def add(self, key: str, mesh: Mesh) -> None:
+        mesh[LIBRARY_KEY] = key
+        self.new_meshes[key] = mesh
+
+    def save(self) -> None:
+        if not self.new_meshes:
+            return
+
+        os.makedirs(self.folder, exist_ok=True)
+        for key, mesh in self.new_meshes.items():
+            # Library meshes are named by their key for loading by name.
+            name = mesh.name
+            mesh.name = key
+            try:
+                # Write to a temporary file first, so other imports never load a partial file.
+                filepath = self.filepath(key)
+                temp_filepath = f"{filepath}.{os.getpid()}.tmp"
+                # Materials, images, and node groups are written as dependencies.
+                bpy.data.libraries.write(temp_filepath, {mesh}, fake_user=True)
+                os.replace(temp_filepath, filepath)
+            finally:
+                mesh.name = name
+
+        self.new_meshes.clear()
+
+
+def merge_appended_data(existing_ids: set[int]) -> None:
+    # Appending renames data like materials that already exist in the file.
+    # Use the existing data instead to avoid duplicates like "4 Red.001".
+    # The remaining appended data is added to existing_ids for merging later appends.
+    for collection in [bpy.data.materials, bpy.data.node_groups, bpy.data.images]:
+        appended = [
+            data for data in collection if data.as_pointer() not in existing_ids
+        ]
+        for data in appended:
+            base_name, _, suffix = data.name.rpartition(".")
+            existing = collection.get(base_name) if suffix.isdigit() else None
+            if existing is not None and existing.as_pointer() in existing_ids:
+                data.user_remap(existing)
+                collection.remove(data)
+            else:
+                existing_ids.add(data.as_pointer())
+
+
+def tag_preview_mesh(
+    mesh: Mesh, filepath: str, geometry_name: str, mesh_color: int | None
+) -> None:
+    mesh[PREVIEW_FILEPATH] = filepath
+    mesh[PREVIEW_GEOMETRY_NAME] = geometry_name
+    # Custom properties can't be None, so use -1 for attribute colors.
+    mesh[PREVIEW_MESH_COLOR] = -1 if mesh_color is None else mesh_color
+
+
+def set_color_properties(
+    obj: bpy.types.Object, color_by_code: dict[int, LDrawColor], color: int
+) -> None:
+    # Attribute nodes can read custom properties on the object.
+    for name, value in color_attributes(color_by_code, color).items():
+        obj[name] = value
+
+    # The shared material can't show each color in solid mode.
+    # Use the object color shading mode in the viewport instead.
+    obj.color = viewport_color(color_by_code, color)
+
+
+def set_color_attributes(
+    instancer_mesh: Mesh, color_by_code: dict[int, LDrawColor], color: int
+) -> None:
+    # Point attributes become instance attributes when instancing on points.
+    for name, value in color_attributes(color_by_code, color).items():
+        attribute = vector_attr(instancer_mesh, name, "POINT")
+        attribute.data.foreach_set(
+            "vector", np.tile(value, len(instancer_mesh.vertices))
+        )
+
+
 def create_colored_mesh_from_geometry(
-    name: str, color: int, color_by_code: dict[int, LDrawColor], geometry: LDrawGeometry
+    name: str,
+    color: int | None,
+    color_by_code: dict[int, LDrawColor],
+    geometry: LDrawGeometry,
+    images: list[bpy.types.Image],
 ) -> Mesh:
+    # A color of None uses attributes for faces with the current color.
     mesh = create_mesh_from_geometry(name, geometry)
 
-    assign_materials(mesh, color, color_by_code, geometry)
+    assign_materials(mesh, color, color_by_code, geometry, images)
 
-    # TODO: Why does this need to be done here to avoid messing up face colors?
-    # TODO: Can blender adjust faces in these calls?
-    mesh.validate()
-    mesh.update()
+    if geometry.edges.shape[0] == 0:
+        # TODO: Why does this need to be done here to avoid messing up face colors?
+        # TODO: Can blender adjust faces in these calls?
+        mesh.validate()
+        mesh.update()
+    else:
+        if bpy.app.debug:
+            # ldr_tools already removes invalid faces and calculates edges.
+            # Validate anyway in debug mode to catch any differences with Blender.
+            validate_mesh(mesh)
 
-    # Add attributes needed to render grainy slopes properly.
-    if geometry.has_grainy_slopes:
-        # Get custom normals now that everything has been initialized.
-        # This won't include any object transforms.
-        # mesh.calc_normals_split()
-        loop_normals = np.zeros(len(mesh.loops) * 3)
-        mesh.loops.foreach_get("normal", loop_normals)
+        # Edges are already set, so only update derived data like loose edges and normals.
+        mesh.update(calc_edges=False)
+
+    # The normals are only valid if validating didn't remove any faces.
+    corner_normals = geometry.corner_normals
+    has_corner_normals = 0 < corner_normals.shape[0] == len(mesh.loops)
 
-        normals = vector_attr(mesh, "ldr_normals", "CORNER")
-        normals.data.foreach_set("vector", loop_normals)
+    if has_corner_normals:
+        # Custom normals are smoothed across non sharp edges in Blender.
+        # Mark the sharp edges first to preserve hard edges.
+        set_sharp_edges(mesh, geometry.is_corner_edge_sharp)
+        mesh.normals_split_custom_set(corner_normals)
 
     return mesh
 
 
+def validate_mesh(mesh: Mesh) -> None:
+    counts = mesh_element_counts(mesh)
+    if mesh.validate(verbose=True):
+        print(
+            f"Validating {mesh.name} modified the mesh: {counts} -> {mesh_element_counts(mesh)}"
+        )
+    mesh.update()
+
+
+def mesh_element_counts(mesh: Mesh) -> tuple[int, int, int, int]:
+    return (len(mesh.vertices), len(mesh.edges), len(mesh.loops), len(mesh.polygons))
+
+
+def set_sharp_edges(mesh: Mesh, is_corner_edge_sharp: np.ndarray) -> None:
+    # Each loop stores the edge to the next loop in the face.
+    edge_indices = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("edge_index", edge_indices)
+
+    is_edge_sharp = np.zeros(len(mesh.edges), dtype=bool)
+    is_edge_sharp[edge_indices[is_corner_edge_sharp]] = True
+
+    sharp_edge = mesh.attributes.new(name="sharp_edge", type="BOOLEAN", domain="EDGE")
+    assert isinstance(sharp_edge, bpy.types.BoolAttribute)
+    sharp_edge.data.foreach_set("value", is_edge_sharp)
+
+
 def load_png(data: bytes, name: str = "img") -> bpy.types.Image:
     # TODO: pass image names up from the Rust side
     w, h = struct.unpack(b">LL", data[16:24])
@@ -308,25 +1151,57 @@ def load_png(data: bytes, name: str = "img") -> bpy.types.Image:
     return img
 
 
+def load_images(textures: list[bytes]) -> list[bpy.types.Image]:
+    # Textures are deduplicated by ldr_tools, so each image is only created once.
+    return [load_png(data, f"ldr_texture_{i}") for i, data in enumerate(textures)]
+
+
+def load_stud_logo(ldraw_path: str) -> bpy.types.Image | None:
+    # The logo only needs to be baked once for all imports.
+    image = bpy.data.images.get(STUD_LOGO_IMAGE)
+    if image is not None:
+        return image
+
+    pixels = ldr_tools_py.bake_stud_logo(ldraw_path, STUD_LOGO_RESOLUTION)
+    if pixels is None:
+        return None
+
+    image = bpy.data.images.new(
+        STUD_LOGO_IMAGE, STUD_LOGO_RESOLUTION, STUD_LOGO_RESOLUTION, alpha=True
+    )
+    image.colorspace_settings.name = "Non-Color"
+    # Alpha stores the logo height, so don't premultiply the normals in RGB.
+    image.alpha_mode = "CHANNEL_PACKED"
+    image.pixels.foreach_set(pixels.reshape(-1))
+    image.pack()
+    return image
+
+
 def assign_materials(
     mesh: Mesh,
-    current_color: int,
+    current_color: int | None,
     color_by_code: dict[int, LDrawColor],
     geometry: LDrawGeometry,
+    images: list[bpy.types.Image],
 ) -> None:
+    # Stud tops use a face attribute to avoid splitting materials.
+    stud_logo = geometry.stud_logo_info is not None
+
     if len(geometry.face_colors) == 1 and not geometry.texture_info:
         # Geometry is cached with code 16, so also handle color replacement.
         face_color = geometry.face_colors[0]
-        color = current_color if face_color == 16 else face_color
 
         # Cache materials by name.
-        material = get_material(color_by_code, color, geometry.has_grainy_slopes)
+        material = get_face_material(
+            color_by_code,
+            current_color,
+            face_color,
+            geometry.has_grainy_slopes,
+            stud_logo=stud_logo,
+        )
         mesh.materials.append(material)
         return
 
-    if tex_info := geometry.texture_info:
-        images = [load_png(t) for t in tex_info.textures]
-
     if len(geometry.face_colors) > 1:
         assert len(geometry.face_colors) == len(mesh.polygons)
 
@@ -334,22 +1209,46 @@ def assign_materials(
         # determine color
         color_index = i if len(geometry.face_colors) > 1 else 0
         face_color = geometry.face_colors[color_index]
-        color = current_color if face_color == 16 else face_color
 
         # determine texture
         image = None
         if tex_info := geometry.texture_info:
             image_index = tex_info.indices[i]
             if image_index != 0xFF:
-                image = images[image_index]
-
-        material = get_material(color_by_code, color, geometry.has_grainy_slopes, image)
+                image = images[tex_info.texture_ids[image_index]]
+
+        material = get_face_material(
+            color_by_code,
+            current_color,
+            face_color,
+            geometry.has_grainy_slopes,
+            image,
+            stud_logo,
+        )
         if mesh.materials.get(material.name) is None:
             mesh.materials.append(material)
 
         face.material_index = mesh.materials.find(material.name)
 
 
+def get_face_material(
+    color_by_code: dict[int, LDrawColor],
+    current_color: int | None,
+    face_color: int,
+    is_slope: bool,
+    image: bpy.types.Image | None = None,
+    stud_logo: bool = False,
+) -> bpy.types.Material:
+    if face_color != 16:
+        return get_material(color_by_code, face_color, is_slope, image, stud_logo)
+
+    if current_color is None:
+        # The color is set on each object or instance instead.
+        return get_attribute_material(is_slope, image, stud_logo)
+
+    return get_material(color_by_code, current_color, is_slope, image, stud_logo)
+
+
 def create_mesh_from_geometry(name: str, geometry: LDrawGeometry) -> Mesh:
     mesh = bpy.data.meshes.new(name)
     if geometry.vertices.shape[0] == 0:
@@ -368,21 +1267,31 @@ def create_mesh_from_geometry(name: str, geometry: LDrawGeometry) -> Mesh:
     mesh.polygons.foreach_set("loop_start", geometry.face_start_indices)
     mesh.polygons.foreach_set("loop_total", geometry.face_sizes)
 
-    # TODO: Enable autosmooth to handle some cases where edges aren't split.
-    # TODO: Just do this in ldr_tools and set custom normals?
-    # mesh.use_auto_smooth = True
-    # mesh.auto_smooth_angle = math.radians(89.0)
+    # Edges are already in Blender's layout, so Blender doesn't need to calculate them.
+    if geometry.edges.shape[0] > 0:
+        mesh.edges.add(geometry.edges.shape[0])
+        mesh.edges.foreach_set("vertices", geometry.edges.reshape(-1))
+        mesh.loops.foreach_set("edge_index", geometry.corner_edges)
+
+    # Sharp edges are handled by ldr_tools using split edges or custom normals.
     mesh.polygons.foreach_set("use_smooth", [True] * len(mesh.polygons))
 
-    # Add attributes needed to render grainy slopes properly.
+    # Slope materials use the grainy texture only on faces marked by ldr_tools.
     if geometry.has_grainy_slopes:
-        is_stud = float_attr(mesh, "ldr_is_stud", "FACE")
-        is_stud.data.foreach_set("value", geometry.is_face_stud)
+        is_grainy = float_attr(mesh, GRAINY_ATTRIBUTE, "FACE")
+        is_grainy.data.foreach_set("value", geometry.is_face_grainy)
 
     if tex_info := geometry.texture_info:
         uv_layer = mesh.uv_layers.new()
         uv_layer.data.foreach_set("uv", tex_info.uvs.reshape(-1))
 
+    if stud_logo_info := geometry.stud_logo_info:
+        stud_logo_uvs = mesh.uv_layers.new(name=STUD_LOGO_UV_MAP)
+        stud_logo_uvs.data.foreach_set("uv", stud_logo_info.uvs.reshape(-1))
+
+        is_stud_top = float_attr(mesh, STUD_TOP_ATTRIBUTE, "FACE")
+        is_stud_top.data.foreach_set("value", stud_logo_info.is_face_stud_top)
+
     return mesh
 
 
@@ -34,6 +34,8 @@ from bpy.types import (
     ShaderNodeTexImage,
     ShaderNodeVectorTransform,
     ShaderNodeVectorMath,
+    ShaderNodeNormalMap,
+    ShaderNodeUVMap,
 )
 
 # Materials are based on the techniques described in the following blog posts.
@@ -42,48 +44,36 @@ from bpy.types import (
 # https://stefanmuller.com/exploring-lego-material-part-2/
 # https://stefanmuller.com/exploring-lego-material-part-3/
 
+# The baked stud logo shared by all materials for stud tops.
+STUD_LOGO_IMAGE = "Stud Logo (ldr_tools)"
+# The mesh data for stud tops created from LDrawStudLogoInfo.
+STUD_LOGO_UV_MAP = "ldr_stud_logo_uv"
+STUD_TOP_ATTRIBUTE = "ldr_is_stud_top"
+# The face attribute from LDrawGeometry.is_face_grainy for slope pieces.
+GRAINY_ATTRIBUTE = "ldr_is_grainy"
 
-def get_material(
-    color_by_code: dict[int, LDrawColor],
-    code: int,
-    is_slope: bool,
-    image: bpy.types.Image | None = None,
-) -> Material:
-    # Cache materials by name.
-    # This loads materials lazily to avoid creating unused colors.
-    ldraw_color = color_by_code.get(code)
 
-    name = str(code)
-    if ldraw_color is not None:
-        name = f"{code} {ldraw_color.name}"
-        if is_slope:
-            name += " slope"
+class ColorFinish(typing.NamedTuple):
+    # The LDraw color to use in the viewport.
+    viewport_color: tuple[float, float, float, float]
+    base_color: tuple[float, float, float]
+    speckle_color: tuple[float, float, float] | None
+    metallicity: float
+    roughness: tuple[float, float]
+    transmission: float
+    refraction: float
 
-    if image is not None:
-        name += f" {image.name}"
 
-    material = bpy.data.materials.get(name)
-    if material is not None:
-        return material
-
-    # TODO: Report warnings if a part contains an invalid color code.
-    material = bpy.data.materials.new(name)
-    material.use_nodes = True
-
-    # Create the nodes from scratch to ensure the required nodes are present.
-    # This avoids hard coding names like "Material Output" that depend on the UI language.
-    material.node_tree.nodes.clear()
-
-    graph = ShaderGraph(material.node_tree)
+def get_color_finish(color_by_code: dict[int, LDrawColor], code: int) -> ColorFinish:
+    ldraw_color = color_by_code.get(code)
 
     # TODO: Error if color is missing?
     r, g, b, a = 1.0, 1.0, 1.0, 1.0
     if ldraw_color is not None:
         r, g, b, a = ldraw_color.rgba_linear
 
-    # Set the color in the viewport.
-    # This can use the default LDraw color for familiarity.
-    material.diffuse_color = (r, g, b, a)
+    # The viewport can use the default LDraw color for familiarity.
+    viewport_color = (r, g, b, a)
 
     # Partially complete alternatives to LDraw colors for better realism.
     if code in rgb_ldr_tools_by_code:
@@ -91,10 +81,7 @@ def get_material(
     elif code in rgb_peeron_by_code:
         r, g, b = rgb_peeron_by_code[code]
 
-    # For speckle materials, this will be reassigned to a node reference later.
-    base_color: tuple[float, float, float, float] | GraphNode[ShaderNodeMix]
-    # Alpha is specified using transmission instead.
-    base_color = (r, g, b, 1.0)
+    speckle_color = None
 
     # Normal opaque materials.
     metallicity = 0.0
@@ -121,25 +108,8 @@ def get_material(
             # TODO: Are all speckled colors metals?
             metallicity = 1.0
 
-            # Adjust the thresholds to control speckle size and density.
-            speckle_node = graph.group_node(
-                speckle_node_group, {"Min": 0.5, "Max": 0.6}
-            )
-            speckle_node.node.location = (-620, 700)
-
             speckle_r, speckle_g, speckle_b, _ = ldraw_color.speckle_rgba_linear
-
-            # Blend between the two speckle colors.
-            base_color = graph.node(
-                ShaderNodeMix,
-                data_type="RGBA",
-                inputs={
-                    "Factor": speckle_node,
-                    "A": base_color,
-                    "B": (speckle_r, speckle_g, speckle_b, 1.0),
-                },
-            )
-            base_color.node.location = (-430, 750)
+            speckle_color = (speckle_r, speckle_g, speckle_b)
 
     # Transparent colors specify an alpha of 128 / 255.
     if a <= 0.6:
@@ -151,6 +121,218 @@ def get_material(
         else:
             roughness = (0.01, 0.15)
 
+    return ColorFinish(
+        viewport_color,
+        (r, g, b),
+        speckle_color,
+        metallicity,
+        roughness,
+        transmission,
+        refraction,
+    )
+
+
+def get_material(
+    color_by_code: dict[int, LDrawColor],
+    code: int,
+    is_slope: bool,
+    image: bpy.types.Image | None = None,
+    stud_logo: bool = False,
+) -> Material:
+    # Cache materials by name.
+    # This loads materials lazily to avoid creating unused colors.
+    ldraw_color = color_by_code.get(code)
+
+    name = str(code)
+    if ldraw_color is not None:
+        name = f"{code} {ldraw_color.name}"
+        if is_slope:
+            name += " slope"
+
+    if image is not None:
+        name += f" {image.name}"
+
+    if stud_logo:
+        name += " stud logo"
+
+    material = bpy.data.materials.get(name)
+    if material is not None:
+        return material
+
+    # TODO: Report warnings if a part contains an invalid color code.
+    material = new_material(name)
+    graph = ShaderGraph(material.node_tree)
+
+    finish = get_color_finish(color_by_code, code)
+
+    # Set the color in the viewport.
+    material.diffuse_color = finish.viewport_color
+
+    # Alpha is specified using transmission instead.
+    r, g, b = finish.base_color
+    base_color = (r, g, b, 1.0)
+
+    speckle_color = None
+    if finish.speckle_color is not None:
+        speckle_r, speckle_g, speckle_b = finish.speckle_color
+        speckle_color = (speckle_r, speckle_g, speckle_b, 1.0)
+
+    create_material_nodes(
+        graph,
+        base_color,
+        speckle_color,
+        finish.base_color,
+        finish.metallicity,
+        finish.roughness,
+        finish.transmission,
+        finish.refraction,
+        is_slope,
+        image,
+        stud_logo,
+    )
+
+    return material
+
+
+def get_attribute_material(
+    is_slope: bool, image: bpy.types.Image | None = None, stud_logo: bool = False
+) -> Material:
+    # Faces with the current color share a material for all colors.
+    # The color is stored on each object or instance using color_attributes.
+    name = "Current Color (ldr_tools)"
+    if is_slope:
+        name += " slope"
+
+    if image is not None:
+        name += f" {image.name}"
+
+    if stud_logo:
+        name += " stud logo"
+
+    material = bpy.data.materials.get(name)
+    if material is not None:
+        return material
+
+    material = new_material(name)
+    graph = ShaderGraph(material.node_tree)
+
+    # The color varies per object, so use a neutral color in the viewport.
+    # Objects also store their LDraw color in Object.color for the object color shading mode.
+    material.diffuse_color = (0.8, 0.8, 0.8, 1.0)
+
+    # Instancer attributes also check the object itself for linked duplicates.
+    color = graph.node(
+        ShaderNodeAttribute, attribute_type="INSTANCER", attribute_name="ldr_color"
+    )
+    color.node.location = (-1020, 900)
+
+    speckle_color = graph.node(
+        ShaderNodeAttribute,
+        attribute_type="INSTANCER",
+        attribute_name="ldr_speckle_color",
+    )
+    speckle_color.node.location = (-1020, 700)
+
+    finish = graph.node(
+        ShaderNodeAttribute, attribute_type="INSTANCER", attribute_name="ldr_finish"
+    )
+    finish.node.location = (-1020, 300)
+
+    finish_xyz = graph.node(ShaderNodeSeparateXYZ, [finish["Vector"]])
+    finish_xyz.node.location = (-830, 300)
+
+    roughness = graph.node(
+        ShaderNodeAttribute,
+        attribute_type="INSTANCER",
+        attribute_name="ldr_roughness",
+    )
+    roughness.node.location = (-1020, 500)
+
+    roughness_xyz = graph.node(ShaderNodeSeparateXYZ, [roughness["Vector"]])
+    roughness_xyz.node.location = (-830, 500)
+
+    create_material_nodes(
+        graph,
+        color["Color"],
+        speckle_color["Color"],
+        color["Vector"],
+        finish_xyz["X"],
+        (roughness_xyz["X"], roughness_xyz["Y"]),
+        finish_xyz["Y"],
+        finish_xyz["Z"],
+        is_slope,
+        image,
+        stud_logo,
+    )
+
+    return material
+
+
+def viewport_color(
+    color_by_code: dict[int, LDrawColor], code: int
+) -> tuple[float, float, float, float]:
+    return get_color_finish(color_by_code, code).viewport_color
+
+
+def color_attributes(
+    color_by_code: dict[int, LDrawColor], code: int
+) -> dict[str, tuple[float, float, float]]:
+    # Values for the attributes used by get_attribute_material.
+    finish = get_color_finish(color_by_code, code)
+
+    # Speckle blends between two colors, so using the same color disables speckle.
+    speckle_color = finish.speckle_color
+    if speckle_color is None:
+        speckle_color = finish.base_color
+
+    return {
+        "ldr_color": finish.base_color,
+        "ldr_speckle_color": speckle_color,
+        "ldr_finish": (finish.metallicity, finish.transmission, finish.refraction),
+        "ldr_roughness": (finish.roughness[0], finish.roughness[1], 0.0),
+    }
+
+
+def new_material(name: str) -> Material:
+    material = bpy.data.materials.new(name)
+    material.use_nodes = True
+
+    # Create the nodes from scratch to ensure the required nodes are present.
+    # This avoids hard coding names like "Material Output" that depend on the UI language.
+    material.node_tree.nodes.clear()
+    return material
+
+
+def create_material_nodes(
+    graph: ShaderGraph,
+    base_color: NodeInput,
+    speckle_color: NodeInput | None,
+    subsurface_radius: NodeInput,
+    metallicity: NodeInput,
+    roughness: tuple[NodeInput, NodeInput],
+    transmission: NodeInput,
+    refraction: NodeInput,
+    is_slope: bool,
+    image: bpy.types.Image | None,
+    stud_logo: bool,
+) -> None:
+    if speckle_color is not None:
+        # Adjust the thresholds to control speckle size and density.
+        speckle_node = graph.group_node(speckle_node_group, {"Min": 0.5, "Max": 0.6})
+        speckle_node.node.location = (-620, 700)
+
+        # Blend between the two speckle colors.
+        base_color = graph.node(
+            ShaderNodeMix,
+            data_type="RGBA",
+            inputs={
+                "Factor": speckle_node,
+                "A": base_color,
+                "B": speckle_color,
+            },
+        )
+        base_color.node.location = (-430, 750)
+
     if image is not None:
         texture = graph.node(ShaderNodeTexImage, image=image)
         texture.node.location = (-730, 800)
@@ -176,8 +358,9 @@ def get_material(
     normals: GraphNode[ShaderNodeGroup | ShaderNodeMix] = main_normals
 
     if is_slope:
-        is_slope_node = graph.group_node(is_slope_node_group)
-        is_slope_node.node.location = (-630, 300)
+        # Faces are classified by ldr_tools to avoid checking normals in the shader.
+        is_grainy = graph.node(ShaderNodeAttribute, attribute_name=GRAINY_ATTRIBUTE)
+        is_grainy.node.location = (-630, 300)
 
         slope_normals = graph.group_node(slope_normals_node_group)
         slope_normals.node.location = (-630, 100)
@@ -187,13 +370,18 @@ def get_material(
             ShaderNodeMix,
             data_type="VECTOR",
             inputs={
-                "Factor": is_slope_node,
+                "Factor": is_grainy["Fac"],
                 "A": main_normals,
                 "B": slope_normals,
             },
         )
         normals.node.location = (-430, 330)
 
+    if stud_logo:
+        # Apply the baked logo to stud tops instead of modeling it for each stud.
+        normals = graph.group_node(stud_logo_node_group, {"Normal": normals})
+        normals.node.location = (-430, 200)
+
     scale = graph.group_node(object_scale_node_group)
     scale.node.location = (-630, 0)
 
@@ -208,7 +396,7 @@ def get_material(
             "Base Color": base_color,
             "Normal": normals,
             # Use a less accurate SSS method instead.
-            "Subsurface Radius": (r, g, b),
+            "Subsurface Radius": subsurface_radius,
             "Subsurface Weight": 1.0,
             "Subsurface Scale": subsurface_scale,
             "Roughness": roughness_node,
@@ -222,8 +410,6 @@ def get_material(
     output = graph.node(ShaderNodeOutputMaterial, {"Surface": bsdf})
     output.node.location = (60, 460)
 
-    return material
-
 
 def roughness_node_group(graph: ShaderGraph) -> None:
     graph.input(NodeSocketFloat, "Min")
@@ -377,37 +563,51 @@ def slope_normals_node_group(graph: ShaderGraph) -> None:
     output.node.location = (0, 0)
 
 
-def is_slope_node_group(graph: ShaderGraph) -> None:
-    graph.output(NodeSocketFloat, "Factor")
-
-    # Apply grainy normals to faces that aren't vertical or horizontal.
-    # Use non transformed normals to not consider object rotation.
-    ldr_normals = graph.node(ShaderNodeAttribute, attribute_name="ldr_normals")
-    ldr_normals.node.location = (-1600, 400)
+def stud_logo_node_group(graph: ShaderGraph) -> None:
+    graph.input(NodeSocketVector, "Normal")
+    graph.output(NodeSocketVector, "Normal")
 
-    separate = graph.node(ShaderNodeSeparateXYZ, [ldr_normals["Vector"]])
-    separate.node.location = (-1400, 400)
+    input = graph.node(NodeGroupInput)
+    input.node.location = (-480, 200)
 
-    # Use normal.y to check if the face is horizontal (-1.0 or 1.0) or vertical (0.0).
-    # Any values in between are considered "slopes" and use grainy normals.
-    absolute = graph.math_node("ABSOLUTE", [separate["Y"]])
-    absolute.node.location = (-1200, 400)
-    compare = graph.math_node("COMPARE", [absolute, 0.5, 0.45])
-    compare.node.location = (-1000, 400)
+    uv_map = graph.node(ShaderNodeUVMap, uv_map=STUD_LOGO_UV_MAP)
+    uv_map.node.location = (-1000, 0)
 
-    slope_normals = graph.group_node(slope_normals_node_group)
-    slope_normals.node.location = (-630, 100)
+    # The image is baked once by ldr_tools before creating any materials.
+    texture = graph.node(
+        ShaderNodeTexImage,
+        image=bpy.data.images.get(STUD_LOGO_IMAGE),
+        extension="CLIP",
+        inputs={"Vector": uv_map},
+    )
+    texture.node.location = (-800, 0)
+
+    # Alpha stores the logo height rather than transparency, so only use RGB.
+    normal_map = graph.node(
+        ShaderNodeNormalMap,
+        space="TANGENT",
+        uv_map=STUD_LOGO_UV_MAP,
+        inputs={"Color": texture["Color"]},
+    )
+    normal_map.node.location = (-480, 0)
 
-    is_stud = graph.node(ShaderNodeAttribute, attribute_name="ldr_is_stud")
-    is_stud.node.location = (-1000, 200)
+    is_stud_top = graph.node(ShaderNodeAttribute, attribute_name=STUD_TOP_ATTRIBUTE)
+    is_stud_top.node.location = (-480, 400)
 
-    # Don't apply the grainy slopes to any faces marked as studs.
-    # We use an attribute here to avoid per face material assignment.
-    subtract_studs = graph.math_node("SUBTRACT", [compare, is_stud["Fac"]])
-    subtract_studs.node.location = (-800, 400)
+    # Only use the logo normals on faces marked as stud tops.
+    normals = graph.node(
+        ShaderNodeMix,
+        data_type="VECTOR",
+        inputs={
+            "Factor": is_stud_top["Fac"],
+            "A": input["Normal"],
+            "B": normal_map,
+        },
+    )
+    normals.node.location = (-240, 200)
 
-    output = graph.node(NodeGroupOutput, [subtract_studs])
-    output.node.location = (-600, 400)
+    output = graph.node(NodeGroupOutput, [normals])
+    output.node.location = (0, 200)
 
 
 def object_scale_node_group(graph: ShaderGraph) -> None:
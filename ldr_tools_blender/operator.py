@@ -3,13 +3,20 @@ from __future__ import annotations
 import os
 import json
 import bpy
-from bpy.props import StringProperty, EnumProperty, BoolProperty, FloatProperty
+from bpy.props import (
+    StringProperty,
+    EnumProperty,
+    BoolProperty,
+    FloatProperty,
+    IntProperty,
+)
 from bpy_extras.io_utils import ImportHelper
 import typing
 from typing import Any, Self
 import platform
+import time
 
-from .importldr import import_ldraw
+from .importldr import LDrawImport, LDrawRefine
 
 if typing.TYPE_CHECKING:
     import ldr_tools_py
@@ -78,6 +85,11 @@ class Preferences:
         self.add_gap_between_parts = True
         # default matches hardcoded behavior of previous versions
         self.scene_scale = 0.01
+        self.attribute_colors = False
+        self.instance_submodels = False
+        self.memory_budget_mb = 0
+        self.preview = False
+        self.mesh_library_path = ""
 
     def from_dict(self, dict: dict[str, Any]) -> None:
         # Fill in defaults for any missing values.
@@ -93,6 +105,15 @@ class Preferences:
             "add_gap_between_parts", defaults.add_gap_between_parts
         )
         self.scene_scale = dict.get("scene_scale", defaults.scene_scale)
+        self.attribute_colors = dict.get("attribute_colors", defaults.attribute_colors)
+        self.instance_submodels = dict.get(
+            "instance_submodels", defaults.instance_submodels
+        )
+        self.memory_budget_mb = dict.get("memory_budget_mb", defaults.memory_budget_mb)
+        self.preview = dict.get("preview", defaults.preview)
+        self.mesh_library_path = dict.get(
+            "mesh_library_path", defaults.mesh_library_path
+        )
 
     def save(self) -> None:
         with open(Preferences.preferences_path, "w+") as file:
@@ -140,6 +161,10 @@ class LIST_OT_DeleteItem(bpy.types.Operator):
         return {"FINISHED"}
 
 
+# The time to spend importing between UI updates for the modal import.
+MODAL_STEP_SECONDS = 0.1
+
+
 class ImportOperator(bpy.types.Operator, ImportHelper):
     bl_idname = "import_scene.importldr"
     bl_description = "Import LDR (.mpd/.ldr/.dat/.io)"
@@ -157,11 +182,21 @@ class ImportOperator(bpy.types.Operator, ImportHelper):
     if typing.TYPE_CHECKING:
         filter_glob: str
         ldraw_path: str
-        instance_type: typing.Literal["LinkedDuplicates", "GeometryNodes"]
-        stud_type: typing.Literal["Disabled", "Normal", "Logo4", "HighContrast"]
-        primitive_resolution: typing.Literal["Low", "Normal", "High"]
+        instance_type: typing.Literal[
+            "LinkedDuplicates", "GeometryNodes", "SingleInstancer"
+        ]
+        stud_type: typing.Literal[
+            "Disabled", "Normal", "Logo4", "HighContrast", "LogoNormalMap"
+        ]
+        primitive_resolution: typing.Literal["Low", "Normal", "High", "Adaptive"]
         add_gap_between_parts: bool
         scene_scale: float
+        attribute_colors: bool
+        instance_submodels: bool
+        memory_budget_mb: int
+        preview: bool
+        mesh_library_path: str
+        show_progress: bool
     else:
         filter_glob: StringProperty(
             default="*.mpd;*.ldr;*.dat;*.io", options={"HIDDEN"}
@@ -182,6 +217,11 @@ class ImportOperator(bpy.types.Operator, ImportHelper):
                     "Geometry Nodes",
                     "Geometry node instances on an instancer mesh. Faster imports for large scenes but harder to edit.",
                 ),
+                (
+                    "SingleInstancer",
+                    "Single Instancer",
+                    "One geometry node instancer for all parts. Fastest for scenes with many unique parts but parts can't be edited individually.",
+                ),
             ],
             description="The method to use for instancing part meshes",
             # TODO: this doesn't set properly?
@@ -199,6 +239,11 @@ class ImportOperator(bpy.types.Operator, ImportHelper):
                     "High Contrast",
                     "Studs with instruction style colors",
                 ),
+                (
+                    "LogoNormalMap",
+                    "Logo Normal Map",
+                    "Studs without logos and a shared baked logo normal map. Similar to Logo4 with much less geometry",
+                ),
             ],
             description="The type of stud for imported parts",
             # TODO: this doesn't set properly?
@@ -211,6 +256,11 @@ class ImportOperator(bpy.types.Operator, ImportHelper):
                 ("Low", "Low", "Low resolution 8 segment primitives"),
                 ("Normal", "Normal", "Normal resolution 16 segment primitives"),
                 ("High", "High", "High resolution 48 segment primitives"),
+                (
+                    "Adaptive",
+                    "Adaptive",
+                    "Low resolution for small primitives and high resolution for large curved surfaces like dishes and round bricks",
+                ),
             ],
             description="The segment quality for part primitives",
             # TODO: this doesn't set properly?
@@ -229,6 +279,45 @@ class ImportOperator(bpy.types.Operator, ImportHelper):
             default=preferences.scene_scale,
         )
 
+        attribute_colors: BoolProperty(
+            name="Attribute Colors",
+            description="Create one mesh for each part and set colors using object and instance attributes. Reduces memory usage for parts used in many colors",
+            default=preferences.attribute_colors,
+        )
+
+        instance_submodels: BoolProperty(
+            name="Instance Submodels",
+            description="Import submodels used more than once as collection instances instead of separate objects. Only applies to linked duplicates",
+            default=preferences.instance_submodels,
+        )
+
+        memory_budget_mb: IntProperty(
+            name="Memory Budget (MB)",
+            description="Reduce primitive resolution, disable stud logos, and replace the smallest parts with boxes until the loaded geometry fits in this many megabytes. 0 disables the budget",
+            default=preferences.memory_budget_mb,
+            min=0,
+        )
+
+        preview: BoolProperty(
+            name="Preview",
+            description="Import each part as a box for quickly checking the layout of large models. Use Refine LDraw Preview to load the full part meshes later",
+            default=preferences.preview,
+        )
+
+        mesh_library_path: StringProperty(
+            name="Mesh Library",
+            description="A folder for saving part meshes and materials to reuse in later imports. Parts not in the library are created and added to it. Leave empty to disable",
+            default=preferences.mesh_library_path,
+            subtype="DIR_PATH",
+        )
+
+        show_progress: BoolProperty(
+            name="Show Progress",
+            description="Import in small steps with a progress bar. Press Esc to cancel the import",
+            default=True,
+            options={"SKIP_SAVE"},
+        )
+
     def draw(self, context: bpy.types.Context) -> None:
         layout = self.layout
         layout.use_property_split = True
@@ -238,6 +327,12 @@ class ImportOperator(bpy.types.Operator, ImportHelper):
         layout.prop(self, "primitive_resolution")
         layout.prop(self, "add_gap_between_parts")
         layout.prop(self, "scene_scale")
+        layout.prop(self, "attribute_colors")
+        layout.prop(self, "instance_submodels")
+        layout.prop(self, "memory_budget_mb")
+        layout.prop(self, "preview")
+        layout.prop(self, "mesh_library_path")
+        layout.prop(self, "show_progress")
 
         # TODO: File selector?
         # TODO: Come up with better UI for this?
@@ -259,50 +354,183 @@ class ImportOperator(bpy.types.Operator, ImportHelper):
         ImportOperator.preferences.primitive_resolution = self.primitive_resolution
         ImportOperator.preferences.add_gap_between_parts = self.add_gap_between_parts
         ImportOperator.preferences.scene_scale = self.scene_scale
+        ImportOperator.preferences.attribute_colors = self.attribute_colors
+        ImportOperator.preferences.instance_submodels = self.instance_submodels
+        ImportOperator.preferences.memory_budget_mb = self.memory_budget_mb
+        ImportOperator.preferences.preview = self.preview
+        ImportOperator.preferences.mesh_library_path = self.mesh_library_path
 
-        settings = self.get_settings()
+        settings = geometry_settings(ImportOperator.preferences)
 
-        import time
+        # Save preferences to disk for loading next time.
+        ImportOperator.preferences.save()
 
-        start = time.time()
-        import_ldraw(
-            self,
+        self.ldraw_import = LDrawImport(
             self.filepath,  # type: ignore[attr-defined]
             self.ldraw_path,
             ImportOperator.preferences.additional_paths,
             self.instance_type,
             settings,
+            self.attribute_colors,
+            self.mesh_library_path,
         )
-        end = time.time()
-        print(f"Import: {end - start}")
 
-        # Save preferences to disk for loading next time.
-        ImportOperator.preferences.save()
+        if self.show_progress and context.window is not None and not bpy.app.background:
+            # Process the import on a timer to keep the UI responsive.
+            self.import_steps = self.ldraw_import.steps()
+            wm = context.window_manager
+            self.timer = wm.event_timer_add(0.01, window=context.window)
+            wm.modal_handler_add(self)
+            wm.progress_begin(0, 100)
+            context.workspace.status_text_set("Importing LDraw model: Loading")
+            return {"RUNNING_MODAL"}
+
+        for _ in self.ldraw_import.steps():
+            pass
+        self.ldraw_import.report(self)
+        return {"FINISHED"}
+
+    def modal(self, context: bpy.types.Context, event: bpy.types.Event) -> Status:
+        if event.type == "ESC" and event.value == "PRESS":
+            self.import_steps.close()
+            self.ldraw_import.cancel()
+            self.end_modal(context)
+            self.report({"WARNING"}, "Import canceled")
+            return {"CANCELLED"}
+
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        # Do as much work as possible before the next UI update.
+        deadline = time.perf_counter() + MODAL_STEP_SECONDS
+        try:
+            progress = next(self.import_steps)
+            # Return to the UI immediately while loading on the background thread.
+            while progress.stage != "Loading" and time.perf_counter() < deadline:
+                progress = next(self.import_steps)
+        except StopIteration:
+            self.end_modal(context)
+            self.ldraw_import.report(self)
+            return {"FINISHED"}
+        except Exception:
+            # Don't leave a partially imported scene.
+            self.ldraw_import.cancel()
+            self.end_modal(context)
+            raise
+
+        context.window_manager.progress_update(progress.fraction() * 100)
+        context.workspace.status_text_set(
+            f"Importing LDraw model: {progress.stage} {progress.completed}/{progress.total} (Esc to cancel)"
+        )
+        return {"RUNNING_MODAL"}
+
+    def end_modal(self, context: bpy.types.Context) -> None:
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+
+class RefineOperator(bpy.types.Operator):
+    """Replace the boxes from preview imports with the full part meshes"""
+
+    bl_idname = "object.ldr_refine_preview"
+    bl_label = "Refine LDraw Preview"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context: bpy.types.Context) -> Status:
+        # Use the most recent import settings apart from preview.
+        preferences = ImportOperator.preferences
+        self.refine = LDrawRefine(
+            preferences.ldraw_path,
+            preferences.additional_paths,
+            geometry_settings(preferences),
+        )
+
+        if context.window is not None and not bpy.app.background:
+            self.refine_steps = self.refine.steps()
+            wm = context.window_manager
+            self.timer = wm.event_timer_add(0.01, window=context.window)
+            wm.modal_handler_add(self)
+            wm.progress_begin(0, 100)
+            context.workspace.status_text_set("Refining LDraw preview: Loading")
+            return {"RUNNING_MODAL"}
+
+        for _ in self.refine.steps():
+            pass
+        self.report({"INFO"}, f"Refined {self.refine.refined_count} meshes")
         return {"FINISHED"}
 
-    def get_settings(self):
-        settings = ldr_tools_py.GeometrySettings()
-        settings.triangulate = False
-        settings.add_gap_between_parts = self.add_gap_between_parts
-
-        if self.stud_type == "Disabled":
-            settings.stud_type = ldr_tools_py.StudType.Disabled
-        elif self.stud_type == "Normal":
-            settings.stud_type = ldr_tools_py.StudType.Normal
-        elif self.stud_type == "Logo4":
-            settings.stud_type = ldr_tools_py.StudType.Logo4
-        elif self.stud_type == "HighContrast":
-            settings.stud_type = ldr_tools_py.StudType.HighContrast
-
-        if self.primitive_resolution == "Low":
-            settings.primitive_resolution = ldr_tools_py.PrimitiveResolution.Low
-        elif self.primitive_resolution == "Normal":
-            settings.primitive_resolution = ldr_tools_py.PrimitiveResolution.Normal
-        elif self.primitive_resolution == "High":
-            settings.primitive_resolution = ldr_tools_py.PrimitiveResolution.High
-
-        settings.scene_scale = self.scene_scale
-        # Required for calculated normals.
-        settings.weld_vertices = True
-
-        return settings
+    def modal(self, context: bpy.types.Context, event: bpy.types.Event) -> Status:
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        deadline = time.perf_counter() + MODAL_STEP_SECONDS
+        try:
+            progress = next(self.refine_steps)
+            # Return to the UI immediately while loading on the background thread.
+            while progress.stage != "Loading" and time.perf_counter() < deadline:
+                progress = next(self.refine_steps)
+        except StopIteration:
+            self.end_modal(context)
+            self.report({"INFO"}, f"Refined {self.refine.refined_count} meshes")
+            return {"FINISHED"}
+        except Exception:
+            self.end_modal(context)
+            raise
+
+        context.window_manager.progress_update(progress.fraction() * 100)
+        context.workspace.status_text_set(
+            f"Refining LDraw preview: {progress.stage} {progress.completed}/{progress.total}"
+        )
+        return {"RUNNING_MODAL"}
+
+    def end_modal(self, context: bpy.types.Context) -> None:
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+
+def geometry_settings(preferences: Preferences) -> ldr_tools_py.GeometrySettings:
+    settings = ldr_tools_py.GeometrySettings()
+    settings.triangulate = False
+    settings.add_gap_between_parts = preferences.add_gap_between_parts
+
+    if preferences.stud_type == "Disabled":
+        settings.stud_type = ldr_tools_py.StudType.Disabled
+    elif preferences.stud_type == "Normal":
+        settings.stud_type = ldr_tools_py.StudType.Normal
+    elif preferences.stud_type == "Logo4":
+        settings.stud_type = ldr_tools_py.StudType.Logo4
+    elif preferences.stud_type == "HighContrast":
+        settings.stud_type = ldr_tools_py.StudType.HighContrast
+    elif preferences.stud_type == "LogoNormalMap":
+        settings.stud_type = ldr_tools_py.StudType.LogoNormalMap
+
+    if preferences.primitive_resolution == "Low":
+        settings.primitive_resolution = ldr_tools_py.PrimitiveResolution.Low
+    elif preferences.primitive_resolution == "Normal":
+        settings.primitive_resolution = ldr_tools_py.PrimitiveResolution.Normal
+    elif preferences.primitive_resolution == "High":
+        settings.primitive_resolution = ldr_tools_py.PrimitiveResolution.High
+    elif preferences.primitive_resolution == "Adaptive":
+        settings.primitive_resolution = ldr_tools_py.PrimitiveResolution.Adaptive
+
+    settings.scene_scale = preferences.scene_scale
+    # Required for calculated normals.
+    settings.weld_vertices = True
+    # Avoid splitting vertices to preserve hard edges.
+    settings.corner_normals = True
+    settings.calculate_edges = True
+    settings.remove_degenerate_faces = True
+    settings.deduplicate_geometry = True
+    # Repeated submodels are imported as collection instances.
+    settings.instance_submodels = preferences.instance_submodels
+
+    if preferences.memory_budget_mb > 0:
+        settings.memory_budget = preferences.memory_budget_mb * 1024 * 1024
+
+    settings.preview = preferences.preview
+
+    return settings
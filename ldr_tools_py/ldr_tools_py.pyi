@@ -1,25 +1,21 @@
 from typing import Final, ClassVar
 
 from .stub_helpers import (
+    BoolArray,
     UByteArray,
     UIntArray,
+    IntArray,
     FloatArray,
     UVec2Array,
     Vec2Array,
     Vec3Array,
     Mat4Array,
     Vec2,
+    Vec3,
     Vec4,
     Mat4,
 )
 
-class LDrawNode:
-    name: str
-    transform: Mat4
-    geometry_name: str | None
-    current_color: int
-    children: list[LDrawNode]
-
 class LDrawGeometry:
     vertices: Vec3Array
     vertex_indices: UIntArray
@@ -28,14 +24,24 @@ class LDrawGeometry:
     face_colors: UIntArray
     is_face_stud: list[bool]
     edge_line_indices: UVec2Array
+    corner_normals: Vec3Array
+    is_corner_edge_sharp: BoolArray
+    edges: UVec2Array
+    corner_edges: UIntArray
     has_grainy_slopes: bool
+    is_face_grainy: BoolArray
     texture_info: LDrawTextureInfo | None
+    stud_logo_info: LDrawStudLogoInfo | None
 
 class LDrawTextureInfo:
-    textures: list[bytes]
+    texture_ids: UIntArray
     indices: UByteArray
     uvs: Vec2Array
 
+class LDrawStudLogoInfo:
+    is_face_stud_top: BoolArray
+    uvs: Vec2Array
+
 class LDrawColor:
     name: str
     finish_name: str
@@ -49,17 +55,71 @@ class GeometrySettings:
     weld_vertices: bool
     primitive_resolution: PrimitiveResolution
     scene_scale: float
+    corner_normals: bool
+    calculate_edges: bool
+    remove_degenerate_faces: bool
+    deduplicate_geometry: bool
+    instance_submodels: bool
+    filter_submodel_names: list[str]
+    filter_step_range: tuple[int, int] | None
+    filter_bounds: tuple[Vec3, Vec3] | None
+    memory_budget: int | None
+    preview: bool
 
 class StudType:
     Disabled: Final[StudType]
     Normal: Final[StudType]
     Logo4: Final[StudType]
     HighContrast: Final[StudType]
+    LogoNormalMap: Final[StudType]
 
 class PrimitiveResolution:
     Low: Final[PrimitiveResolution]
     Normal: Final[PrimitiveResolution]
     High: Final[PrimitiveResolution]
+    Adaptive: Final[PrimitiveResolution]
+
+class MemoryReport:
+    geometry_bytes: dict[str, int]
+    texture_bytes: int
+    instance_bytes: int
+    total_bytes: int
+    stages: list[StageMemory]
+    peak_bytes: int
+    degradations: list[Degradation]
+    proxy_geometry_names: list[str]
+    deduplication: DeduplicationReport
+
+class DeduplicationReport:
+    canonical_names: dict[str, str]
+    merged_geometry_count: int
+    saved_geometry_bytes: int
+    merged_texture_count: int
+    saved_texture_bytes: int
+
+class Degradation:
+    LowPrimitiveResolution: Final[Degradation]
+    PlainStuds: Final[Degradation]
+    BoundingBoxProxies: Final[Degradation]
+
+class StageMemory:
+    stage: LoadStage
+    bytes: int
+    total_bytes: int
+
+class LoadStage:
+    Parse: Final[LoadStage]
+    Instances: Final[LoadStage]
+    Geometry: Final[LoadStage]
+    Textures: Final[LoadStage]
+    Proxies: Final[LoadStage]
+    Packed: Final[LoadStage]
+    Arrays: Final[LoadStage]
+
+class RemovedFaces:
+    invalid_count: int
+    zero_area_count: int
+    duplicate_count: int
 
 class PointInstances:
     translations: Vec3Array
@@ -67,19 +127,108 @@ class PointInstances:
     rotations_angle: FloatArray
     scales: Vec3Array
 
+class SceneStats:
+    main_model_name: str
+    part_estimates: dict[str, GeometryEstimate]
+    instance_counts: dict[tuple[str, int], int]
+    submodel_counts: dict[str, int]
+    texture_count: int
+    texture_bytes: int
+    missing_files: list[str]
+    total_estimate: GeometryEstimate
+
+class GeometryEstimate:
+    triangles: int
+    vertices: int
+
 class LDrawScene:
-    root_node: LDrawNode
     geometry_cache: dict[str, LDrawGeometry]
+    node_table: LDrawNodeTable
+    textures: list[bytes]
+    removed_faces: dict[str, RemovedFaces]
+    memory: MemoryReport
+
+class LDrawNodeTable:
+    names: list[str]
+    name_indices: UIntArray
+    parent_indices: IntArray
+    transforms: Mat4Array
+    geometry_names: list[str]
+    geometry_ids: IntArray
+    colors: UIntArray
+    submodel_ids: IntArray
+    submodels: list[tuple[str, int]]
+    submodel_ranges: UVec2Array
 
 class LDrawSceneInstanced:
     main_model_name: str
     geometry_world_transforms: dict[tuple[str, int], Mat4Array]
     geometry_cache: dict[str, LDrawGeometry]
+    textures: list[bytes]
+    removed_faces: dict[str, RemovedFaces]
+    memory: MemoryReport
+
+class LDrawBatchInstanced:
+    models: list[LDrawModelInstances]
+    geometry_cache: dict[str, LDrawGeometry]
+    textures: list[bytes]
+    removed_faces: dict[str, RemovedFaces]
+    memory: MemoryReport
+
+class LDrawModelInstances:
+    main_model_name: str
+    geometry_world_transforms: dict[tuple[str, int], Mat4Array]
 
 class LDrawSceneInstancedPoints:
     main_model_name: str
     geometry_point_instances: dict[tuple[str, int], PointInstances]
     geometry_cache: dict[str, LDrawGeometry]
+    textures: list[bytes]
+    removed_faces: dict[str, RemovedFaces]
+    memory: MemoryReport
+
+class LDrawScenePacked:
+    main_model_name: str
+    geometry_names: list[str]
+    vertices: Vec3Array
+    vertex_indices: UIntArray
+    face_start_indices: UIntArray
+    face_sizes: UIntArray
+    face_colors: UIntArray
+    is_face_stud: BoolArray
+    edge_line_indices: UVec2Array
+    corner_normals: Vec3Array
+    is_corner_edge_sharp: BoolArray
+    edges: UVec2Array
+    corner_edges: UIntArray
+    has_grainy_slopes: BoolArray
+    is_face_grainy: BoolArray
+    texture_info: dict[int, LDrawTextureInfo]
+    textures: list[bytes]
+    stud_logo_info: dict[int, LDrawStudLogoInfo]
+    geometry_min: Vec3Array
+    geometry_max: Vec3Array
+    vertex_ranges: UVec2Array
+    vertex_index_ranges: UVec2Array
+    face_ranges: UVec2Array
+    face_color_ranges: UVec2Array
+    edge_line_ranges: UVec2Array
+    edge_ranges: UVec2Array
+    group_geometry_ids: UIntArray
+    group_colors: UIntArray
+    group_transform_ranges: UVec2Array
+    transforms: Mat4Array
+    bvh: InstanceBvh | None
+    removed_faces: dict[str, RemovedFaces]
+    memory: MemoryReport
+
+class InstanceBvh:
+    def query_box(self, min: Vec3, max: Vec3) -> UIntArray: ...
+    def query_frustum(self, view_projection: Mat4) -> UIntArray: ...
+    def query_rays(
+        self, origins: Vec3Array, directions: Vec3Array
+    ) -> tuple[IntArray, FloatArray]: ...
+    def query_nearest(self, points: Vec3Array) -> IntArray: ...
 
 def load_file(
     path: str, ldraw_path: str, additional_paths: list[str], settings: GeometrySettings
@@ -87,7 +236,24 @@ def load_file(
 def load_file_instanced(
     path: str, ldraw_path: str, additional_paths: list[str], settings: GeometrySettings
 ) -> LDrawSceneInstanced: ...
+def load_files_instanced(
+    paths: list[str],
+    ldraw_path: str,
+    additional_paths: list[str],
+    settings: GeometrySettings,
+) -> LDrawBatchInstanced: ...
 def load_file_instanced_points(
     path: str, ldraw_path: str, additional_paths: list[str], settings: GeometrySettings
 ) -> LDrawSceneInstancedPoints: ...
+def load_file_instanced_packed(
+    path: str,
+    ldraw_path: str,
+    additional_paths: list[str],
+    settings: GeometrySettings,
+    build_bvh: bool = False,
+) -> LDrawScenePacked: ...
+def scan_file(
+    path: str, ldraw_path: str, additional_paths: list[str], settings: GeometrySettings
+) -> SceneStats: ...
 def load_color_table(ldraw_path: str) -> dict[int, LDrawColor]: ...
+def bake_stud_logo(ldraw_path: str, resolution: int) -> FloatArray | None: ...
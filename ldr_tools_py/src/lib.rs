@@ -1,6 +1,7 @@
-use std::collections::HashMap;
+use std::{collections::HashMap, mem::size_of_val};
 
-use numpy::IntoPyArray;
+use numpy::{IntoPyArray, PyReadonlyArray2};
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
 use pyo3::types::PyBytes;
 
@@ -31,41 +32,77 @@ macro_rules! python_enum {
     };
 }
 
+// The hierarchy is only exposed as a flat table.
+// Converting nested nodes to Python objects is slow for large scenes.
 #[pyclass(get_all)]
 #[derive(Debug, Clone)]
-pub struct LDrawNode {
-    name: String,
-    transform: [[f32; 4]; 4],
-    geometry_name: Option<String>,
-    current_color: u32,
-    children: Vec<LDrawNode>,
+pub struct LDrawScene {
+    pub geometry_cache: HashMap<String, LDrawGeometry>,
+    pub node_table: LDrawNodeTable,
+    pub textures: Vec<Py<PyBytes>>,
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
+}
+
+// Use contiguous numpy arrays (PyObject) to avoid cloning nested nodes when accessing children.
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct LDrawNodeTable {
+    pub names: Vec<String>,
+    name_indices: PyObject,
+    parent_indices: PyObject,
+    transforms: PyObject,
+    pub geometry_names: Vec<String>,
+    geometry_ids: PyObject,
+    colors: PyObject,
+    submodel_ids: PyObject,
+    pub submodels: Vec<(String, u32)>,
+    submodel_ranges: PyObject,
 }
 
-impl From<ldr_tools::LDrawNode> for LDrawNode {
-    fn from(node: ldr_tools::LDrawNode) -> Self {
+impl LDrawNodeTable {
+    fn from_table(py: Python, table: ldr_tools::LDrawNodeTable) -> Self {
         Self {
-            name: node.name,
-            transform: node.transform.to_cols_array_2d(),
-            geometry_name: node.geometry_name,
-            current_color: node.current_color,
-            children: node.children.into_iter().map(|c| c.into()).collect(),
+            names: table.names,
+            name_indices: table.name_indices.into_pyarray(py).into(),
+            parent_indices: table.parent_indices.into_pyarray(py).into(),
+            transforms: pyarray_mat4(py, table.transforms),
+            geometry_names: table.geometry_names,
+            geometry_ids: table.geometry_ids.into_pyarray(py).into(),
+            colors: table.colors.into_pyarray(py).into(),
+            submodel_ids: table.submodel_ids.into_pyarray(py).into(),
+            submodels: table.submodels,
+            submodel_ranges: pyarray_uvec2(py, table.submodel_ranges),
         }
     }
 }
 
 #[pyclass(get_all)]
 #[derive(Debug, Clone)]
-pub struct LDrawScene {
-    pub root_node: LDrawNode,
+pub struct LDrawSceneInstanced {
+    pub main_model_name: String,
+    pub geometry_world_transforms: HashMap<(String, u32), PyObject>,
     pub geometry_cache: HashMap<String, LDrawGeometry>,
+    pub textures: Vec<Py<PyBytes>>,
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
 }
 
 #[pyclass(get_all)]
 #[derive(Debug, Clone)]
-pub struct LDrawSceneInstanced {
+pub struct LDrawBatchInstanced {
+    pub models: Vec<LDrawModelInstances>,
+    pub geometry_cache: HashMap<String, LDrawGeometry>,
+    pub textures: Vec<Py<PyBytes>>,
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
+}
+
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct LDrawModelInstances {
     pub main_model_name: String,
     pub geometry_world_transforms: HashMap<(String, u32), PyObject>,
-    pub geometry_cache: HashMap<String, LDrawGeometry>,
 }
 
 #[pyclass(get_all)]
@@ -74,6 +111,301 @@ pub struct LDrawSceneInstancedPoints {
     pub main_model_name: String,
     pub geometry_point_instances: HashMap<(String, u32), PointInstances>,
     pub geometry_cache: HashMap<String, LDrawGeometry>,
+    pub textures: Vec<Py<PyBytes>>,
+    pub removed_faces: HashMap<String, RemovedFaces>,
+    pub memory: MemoryReport,
+}
+
+// Use contiguous numpy arrays (PyObject) and avoid creating Python objects per geometry.
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct LDrawScenePacked {
+    pub main_model_name: String,
+    pub geometry_names: Vec<String>,
+    vertices: PyObject,
+    vertex_indices: PyObject,
+    face_start_indices: PyObject,
+    face_sizes: PyObject,
+    face_colors: PyObject,
+    is_face_stud: PyObject,
+    edge_line_indices: PyObject,
+    corner_normals: PyObject,
+    is_corner_edge_sharp: PyObject,
+    edges: PyObject,
+    corner_edges: PyObject,
+    has_grainy_slopes: PyObject,
+    is_face_grainy: PyObject,
+    texture_info: HashMap<u32, LDrawTextureInfo>,
+    textures: Vec<Py<PyBytes>>,
+    stud_logo_info: HashMap<u32, LDrawStudLogoInfo>,
+    geometry_min: PyObject,
+    geometry_max: PyObject,
+    vertex_ranges: PyObject,
+    vertex_index_ranges: PyObject,
+    face_ranges: PyObject,
+    face_color_ranges: PyObject,
+    edge_line_ranges: PyObject,
+    edge_ranges: PyObject,
+    group_geometry_ids: PyObject,
+    group_colors: PyObject,
+    group_transform_ranges: PyObject,
+    transforms: PyObject,
+    bvh: Option<Py<InstanceBvh>>,
+    removed_faces: HashMap<String, RemovedFaces>,
+    memory: MemoryReport,
+}
+
+impl LDrawScenePacked {
+    fn from_scene(py: Python, mut scene: ldr_tools::LDrawScenePacked) -> Self {
+        // Flattening copies one buffer at a time before freeing the original.
+        // Vecs without flattening are moved into numpy arrays without copying.
+        let copy_bytes = [
+            size_of_val(scene.vertices.as_slice()),
+            size_of_val(scene.corner_normals.as_slice()),
+            size_of_val(scene.edge_line_indices.as_slice()),
+            size_of_val(scene.edges.as_slice()),
+            size_of_val(scene.transforms.as_slice()),
+        ]
+        .into_iter()
+        .chain(scene.textures.iter().map(Vec::len))
+        .max()
+        .unwrap_or_default();
+        let total_bytes = scene.size_in_bytes() + copy_bytes;
+        scene
+            .memory
+            .add_stage(ldr_tools::LoadStage::Arrays, copy_bytes, total_bytes);
+
+        Self {
+            main_model_name: scene.main_model_name,
+            geometry_names: scene.geometry_names,
+            vertices: pyarray_vec3(py, scene.vertices),
+            vertex_indices: scene.vertex_indices.into_pyarray(py).into(),
+            face_start_indices: scene.face_start_indices.into_pyarray(py).into(),
+            face_sizes: scene.face_sizes.into_pyarray(py).into(),
+            face_colors: scene.face_colors.into_pyarray(py).into(),
+            is_face_stud: scene.is_face_stud.into_pyarray(py).into(),
+            edge_line_indices: pyarray_uvec2(py, scene.edge_line_indices),
+            corner_normals: pyarray_vec3(py, scene.corner_normals),
+            is_corner_edge_sharp: scene.is_corner_edge_sharp.into_pyarray(py).into(),
+            edges: pyarray_uvec2(py, scene.edges),
+            corner_edges: scene.corner_edges.into_pyarray(py).into(),
+            has_grainy_slopes: scene.has_grainy_slopes.into_pyarray(py).into(),
+            is_face_grainy: scene.is_face_grainy.into_pyarray(py).into(),
+            texture_info: scene
+                .texture_info
+                .into_iter()
+                .map(|(k, v)| (k, LDrawTextureInfo::from_texture_info(py, v)))
+                .collect(),
+            textures: pybytes_list(py, scene.textures),
+            stud_logo_info: scene
+                .stud_logo_info
+                .into_iter()
+                .map(|(k, v)| (k, LDrawStudLogoInfo::from_stud_logo_info(py, v)))
+                .collect(),
+            geometry_min: pyarray_vec3(py, scene.geometry_min),
+            geometry_max: pyarray_vec3(py, scene.geometry_max),
+            vertex_ranges: pyarray_uvec2(py, scene.vertex_ranges),
+            vertex_index_ranges: pyarray_uvec2(py, scene.vertex_index_ranges),
+            face_ranges: pyarray_uvec2(py, scene.face_ranges),
+            face_color_ranges: pyarray_uvec2(py, scene.face_color_ranges),
+            edge_line_ranges: pyarray_uvec2(py, scene.edge_line_ranges),
+            edge_ranges: pyarray_uvec2(py, scene.edge_ranges),
+            group_geometry_ids: scene.group_geometry_ids.into_pyarray(py).into(),
+            group_colors: scene.group_colors.into_pyarray(py).into(),
+            group_transform_ranges: pyarray_uvec2(py, scene.group_transform_ranges),
+            transforms: pyarray_mat4(py, scene.transforms),
+            bvh: None,
+            removed_faces: removed_faces_map(scene.removed_faces),
+            memory: scene.memory.into(),
+        }
+    }
+}
+
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct MemoryReport {
+    geometry_bytes: HashMap<String, usize>,
+    texture_bytes: usize,
+    instance_bytes: usize,
+    total_bytes: usize,
+    stages: Vec<StageMemory>,
+    peak_bytes: usize,
+    degradations: Vec<Degradation>,
+    proxy_geometry_names: Vec<String>,
+    deduplication: DeduplicationReport,
+}
+
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct DeduplicationReport {
+    canonical_names: HashMap<String, String>,
+    merged_geometry_count: usize,
+    saved_geometry_bytes: usize,
+    merged_texture_count: usize,
+    saved_texture_bytes: usize,
+}
+
+impl From<ldr_tools::DeduplicationReport> for DeduplicationReport {
+    fn from(value: ldr_tools::DeduplicationReport) -> Self {
+        Self {
+            merged_geometry_count: value.merged_geometry_count(),
+            canonical_names: value.canonical_names,
+            saved_geometry_bytes: value.saved_geometry_bytes,
+            merged_texture_count: value.merged_texture_count,
+            saved_texture_bytes: value.saved_texture_bytes,
+        }
+    }
+}
+
+python_enum!(
+    Degradation,
+    ldr_tools::Degradation,
+    LowPrimitiveResolution,
+    PlainStuds,
+    BoundingBoxProxies
+);
+
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct StageMemory {
+    stage: LoadStage,
+    bytes: usize,
+    total_bytes: usize,
+}
+
+python_enum!(
+    LoadStage,
+    ldr_tools::LoadStage,
+    Parse,
+    Instances,
+    Geometry,
+    Textures,
+    Proxies,
+    Packed,
+    Arrays
+);
+
+impl From<ldr_tools::StageMemory> for StageMemory {
+    fn from(value: ldr_tools::StageMemory) -> Self {
+        Self {
+            stage: value.stage.into(),
+            bytes: value.bytes,
+            total_bytes: value.total_bytes,
+        }
+    }
+}
+
+impl From<ldr_tools::MemoryReport> for MemoryReport {
+    fn from(value: ldr_tools::MemoryReport) -> Self {
+        Self {
+            total_bytes: value.total_bytes(),
+            geometry_bytes: value.geometry_bytes,
+            texture_bytes: value.texture_bytes,
+            instance_bytes: value.instance_bytes,
+            stages: value.stages.into_iter().map(Into::into).collect(),
+            peak_bytes: value.peak_bytes,
+            degradations: value.degradations.into_iter().map(Into::into).collect(),
+            proxy_geometry_names: value.proxy_geometry_names,
+            deduplication: value.deduplication.into(),
+        }
+    }
+}
+
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct RemovedFaces {
+    invalid_count: usize,
+    zero_area_count: usize,
+    duplicate_count: usize,
+}
+
+impl From<ldr_tools::RemovedFaces> for RemovedFaces {
+    fn from(value: ldr_tools::RemovedFaces) -> Self {
+        Self {
+            invalid_count: value.invalid_count,
+            zero_area_count: value.zero_area_count,
+            duplicate_count: value.duplicate_count,
+        }
+    }
+}
+
+fn removed_faces_map(
+    removed_faces: HashMap<String, ldr_tools::RemovedFaces>,
+) -> HashMap<String, RemovedFaces> {
+    removed_faces
+        .into_iter()
+        .map(|(k, v)| (k, v.into()))
+        .collect()
+}
+
+#[pyclass]
+pub struct InstanceBvh {
+    bvh: ldr_tools::InstanceBvh,
+}
+
+// Return numpy arrays of indices into the packed transforms.
+#[pymethods]
+impl InstanceBvh {
+    fn query_box(&self, py: Python, min: [f32; 3], max: [f32; 3]) -> PyObject {
+        self.bvh
+            .query_box(min.into(), max.into())
+            .into_pyarray(py)
+            .into()
+    }
+
+    fn query_frustum(&self, py: Python, view_projection: [[f32; 4]; 4]) -> PyObject {
+        // Use the row major convention of Blender and numpy.
+        let view_projection =
+            ldr_tools::glam::Mat4::from_cols_array_2d(&view_projection).transpose();
+        self.bvh
+            .query_frustum(view_projection)
+            .into_pyarray(py)
+            .into()
+    }
+
+    fn query_rays(
+        &self,
+        py: Python,
+        origins: PyReadonlyArray2<f32>,
+        directions: PyReadonlyArray2<f32>,
+    ) -> PyResult<(PyObject, PyObject)> {
+        let origins = vec3s(&origins)?;
+        let directions = vec3s(&directions)?;
+        if origins.len() != directions.len() {
+            return Err(PyValueError::new_err(format!(
+                "Expected the same number of origins and directions but found {} and {}",
+                origins.len(),
+                directions.len()
+            )));
+        }
+
+        let hits = self.bvh.query_rays(&origins, &directions);
+
+        // Use -1 and infinity for rays that don't hit any instances.
+        let indices: Vec<_> = hits
+            .iter()
+            .map(|h| h.map(|(i, _)| i as i32).unwrap_or(-1))
+            .collect();
+        let distances: Vec<_> = hits
+            .iter()
+            .map(|h| h.map(|(_, t)| t).unwrap_or(f32::INFINITY))
+            .collect();
+        Ok((
+            indices.into_pyarray(py).into(),
+            distances.into_pyarray(py).into(),
+        ))
+    }
+
+    fn query_nearest(&self, py: Python, points: PyReadonlyArray2<f32>) -> PyResult<PyObject> {
+        Ok(self
+            .bvh
+            .query_nearest(&vec3s(&points)?)
+            .into_iter()
+            .map(|i| i.map(|i| i as i32).unwrap_or(-1))
+            .collect::<Vec<_>>()
+            .into_pyarray(py)
+            .into())
+    }
 }
 
 // Use numpy arrays (PyObject) for reduced overhead.
@@ -87,16 +419,18 @@ pub struct LDrawGeometry {
     face_colors: PyObject,
     is_face_stud: Vec<bool>,
     edge_line_indices: PyObject,
+    corner_normals: PyObject,
+    is_corner_edge_sharp: PyObject,
+    edges: PyObject,
+    corner_edges: PyObject,
     has_grainy_slopes: bool,
+    is_face_grainy: PyObject,
     texture_info: Option<LDrawTextureInfo>,
+    stud_logo_info: Option<LDrawStudLogoInfo>,
 }
 
 impl LDrawGeometry {
     fn from_geometry(py: Python, geometry: ldr_tools::LDrawGeometry) -> Self {
-        let sharp_edge_count = geometry.edge_line_indices.len();
-
-        // This flatten will be optimized in Release mode.
-        // This avoids needing unsafe code.
         Self {
             vertices: pyarray_vec3(py, geometry.vertices),
             vertex_indices: geometry.vertex_indices.into_pyarray(py).into(),
@@ -104,19 +438,19 @@ impl LDrawGeometry {
             face_sizes: geometry.face_sizes.into_pyarray(py).into(),
             face_colors: geometry.face_colors.into_pyarray(py).into(),
             is_face_stud: geometry.is_face_stud,
-            edge_line_indices: geometry
-                .edge_line_indices
-                .into_iter()
-                .flatten()
-                .collect::<Vec<u32>>()
-                .into_pyarray(py)
-                .reshape((sharp_edge_count, 2))
-                .unwrap()
-                .into(),
+            edge_line_indices: pyarray_uvec2(py, geometry.edge_line_indices),
+            corner_normals: pyarray_vec3(py, geometry.corner_normals),
+            is_corner_edge_sharp: geometry.is_corner_edge_sharp.into_pyarray(py).into(),
+            edges: pyarray_uvec2(py, geometry.edges),
+            corner_edges: geometry.corner_edges.into_pyarray(py).into(),
             has_grainy_slopes: geometry.has_grainy_slopes,
+            is_face_grainy: geometry.is_face_grainy.into_pyarray(py).into(),
             texture_info: geometry
                 .texture_info
                 .map(|ti| LDrawTextureInfo::from_texture_info(py, ti)),
+            stud_logo_info: geometry
+                .stud_logo_info
+                .map(|si| LDrawStudLogoInfo::from_stud_logo_info(py, si)),
         }
     }
 }
@@ -124,7 +458,7 @@ impl LDrawGeometry {
 #[pyclass(get_all)]
 #[derive(Debug, Clone)]
 pub struct LDrawTextureInfo {
-    textures: Vec<Py<PyBytes>>,
+    texture_ids: PyObject,
     indices: PyObject,
     uvs: PyObject,
 }
@@ -134,11 +468,7 @@ impl LDrawTextureInfo {
         let uv_count = tex_info.uvs.len();
 
         Self {
-            textures: tex_info
-                .textures
-                .into_iter()
-                .map(|bytes| PyBytes::new(py, &bytes).into())
-                .collect(),
+            texture_ids: tex_info.texture_ids.into_pyarray(py).into(),
             indices: tex_info.indices.into_pyarray(py).into(),
             uvs: tex_info
                 .uvs
@@ -153,6 +483,32 @@ impl LDrawTextureInfo {
     }
 }
 
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct LDrawStudLogoInfo {
+    is_face_stud_top: PyObject,
+    uvs: PyObject,
+}
+
+impl LDrawStudLogoInfo {
+    fn from_stud_logo_info(py: Python, stud_logo_info: ldr_tools::LDrawStudLogoInfo) -> Self {
+        let uv_count = stud_logo_info.uvs.len();
+
+        Self {
+            is_face_stud_top: stud_logo_info.is_face_stud_top.into_pyarray(py).into(),
+            uvs: stud_logo_info
+                .uvs
+                .into_iter()
+                .flat_map(|uv| uv.to_array())
+                .collect::<Vec<f32>>()
+                .into_pyarray(py)
+                .reshape((uv_count, 2))
+                .unwrap()
+                .into(),
+        }
+    }
+}
+
 #[pyclass(get_all)]
 #[derive(Debug, Clone)]
 pub struct LDrawColor {
@@ -182,6 +538,16 @@ pub struct GeometrySettings {
     weld_vertices: bool,
     primitive_resolution: PrimitiveResolution,
     scene_scale: f32,
+    corner_normals: bool,
+    calculate_edges: bool,
+    remove_degenerate_faces: bool,
+    deduplicate_geometry: bool,
+    instance_submodels: bool,
+    filter_submodel_names: Vec<String>,
+    filter_step_range: Option<(u32, u32)>,
+    filter_bounds: Option<([f32; 3], [f32; 3])>,
+    memory_budget: Option<usize>,
+    preview: bool,
 }
 
 python_enum!(
@@ -190,7 +556,8 @@ python_enum!(
     Disabled,
     Normal,
     Logo4,
-    HighContrast
+    HighContrast,
+    LogoNormalMap
 );
 
 python_enum!(
@@ -198,7 +565,8 @@ python_enum!(
     ldr_tools::PrimitiveResolution,
     Low,
     Normal,
-    High
+    High,
+    Adaptive
 );
 
 #[pymethods]
@@ -218,6 +586,19 @@ impl From<ldr_tools::GeometrySettings> for GeometrySettings {
             weld_vertices: value.weld_vertices,
             primitive_resolution: value.primitive_resolution.into(),
             scene_scale: value.scene_scale,
+            corner_normals: value.corner_normals,
+            calculate_edges: value.calculate_edges,
+            remove_degenerate_faces: value.remove_degenerate_faces,
+            deduplicate_geometry: value.deduplicate_geometry,
+            instance_submodels: value.instance_submodels,
+            filter_submodel_names: value.filter.submodel_names,
+            filter_step_range: value.filter.step_range.map(|[first, last]| (first, last)),
+            filter_bounds: value
+                .filter
+                .bounds
+                .map(|[min, max]| (min.to_array(), max.to_array())),
+            memory_budget: value.memory_budget,
+            preview: value.preview,
         }
     }
 }
@@ -231,6 +612,68 @@ impl From<&GeometrySettings> for ldr_tools::GeometrySettings {
             weld_vertices: value.weld_vertices,
             primitive_resolution: value.primitive_resolution.into(),
             scene_scale: value.scene_scale,
+            corner_normals: value.corner_normals,
+            calculate_edges: value.calculate_edges,
+            remove_degenerate_faces: value.remove_degenerate_faces,
+            deduplicate_geometry: value.deduplicate_geometry,
+            instance_submodels: value.instance_submodels,
+            filter: ldr_tools::LoadFilter {
+                submodel_names: value.filter_submodel_names.clone(),
+                step_range: value.filter_step_range.map(|(first, last)| [first, last]),
+                bounds: value
+                    .filter_bounds
+                    .map(|(min, max)| [min.into(), max.into()]),
+            },
+            memory_budget: value.memory_budget,
+            preview: value.preview,
+        }
+    }
+}
+
+#[pyclass(get_all)]
+#[derive(Debug, Clone)]
+pub struct SceneStats {
+    main_model_name: String,
+    part_estimates: HashMap<String, GeometryEstimate>,
+    instance_counts: HashMap<(String, u32), usize>,
+    submodel_counts: HashMap<String, usize>,
+    texture_count: usize,
+    texture_bytes: usize,
+    missing_files: Vec<String>,
+    total_estimate: GeometryEstimate,
+}
+
+#[pyclass(get_all)]
+#[derive(Debug, Clone, Copy)]
+pub struct GeometryEstimate {
+    triangles: usize,
+    vertices: usize,
+}
+
+impl From<ldr_tools::SceneStats> for SceneStats {
+    fn from(value: ldr_tools::SceneStats) -> Self {
+        Self {
+            main_model_name: value.main_model_name,
+            part_estimates: value
+                .part_estimates
+                .into_iter()
+                .map(|(k, v)| (k, v.into()))
+                .collect(),
+            instance_counts: value.instance_counts,
+            submodel_counts: value.submodel_counts,
+            texture_count: value.texture_count,
+            texture_bytes: value.texture_bytes,
+            missing_files: value.missing_files,
+            total_estimate: value.total_estimate.into(),
+        }
+    }
+}
+
+impl From<ldr_tools::GeometryEstimate> for GeometryEstimate {
+    fn from(value: ldr_tools::GeometryEstimate) -> Self {
+        Self {
+            triangles: value.triangles,
+            vertices: value.vertices,
         }
     }
 }
@@ -265,7 +708,11 @@ fn load_file(
 ) -> PyResult<LDrawScene> {
     // TODO: This timing code doesn't need to be here.
     let start = std::time::Instant::now();
-    let scene = ldr_tools::load_file(path, ldraw_path, &additional_paths, &settings.into());
+    let settings: ldr_tools::GeometrySettings = settings.into();
+    // Release the GIL to allow loading on a background thread in Python.
+    let scene =
+        py.allow_threads(|| ldr_tools::load_file(path, ldraw_path, &additional_paths, &settings));
+    let node_table = LDrawNodeTable::from_table(py, (&scene).into());
 
     let geometry_cache = scene
         .geometry_cache
@@ -275,8 +722,11 @@ fn load_file(
     println!("load_file: {:?}", start.elapsed());
 
     Ok(LDrawScene {
-        root_node: scene.root_node.into(),
         geometry_cache,
+        node_table,
+        textures: pybytes_list(py, scene.textures),
+        removed_faces: removed_faces_map(scene.removed_faces),
+        memory: scene.memory.into(),
     })
 }
 
@@ -289,8 +739,10 @@ fn load_file_instanced(
     settings: &GeometrySettings,
 ) -> PyResult<LDrawSceneInstanced> {
     let start = std::time::Instant::now();
-    let scene =
-        ldr_tools::load_file_instanced(path, ldraw_path, &additional_paths, &settings.into());
+    let settings: ldr_tools::GeometrySettings = settings.into();
+    let scene = py.allow_threads(|| {
+        ldr_tools::load_file_instanced(path, ldraw_path, &additional_paths, &settings)
+    });
 
     let geometry_cache = scene
         .geometry_cache
@@ -304,19 +756,7 @@ fn load_file_instanced(
         .map(|(k, v)| {
             // Create a single numpy array of transforms for each geometry.
             // This means Python code can avoid overhead from for loops.
-            // This flatten will be optimized in Release mode.
-            // This avoids needing unsafe code.
-            let transform_count = v.len();
-            let transforms = v
-                .into_iter()
-                .flat_map(|v| v.to_cols_array())
-                .collect::<Vec<f32>>()
-                .into_pyarray(py)
-                .reshape((transform_count, 4, 4))
-                .unwrap()
-                .into();
-
-            (k, transforms)
+            (k, pyarray_mat4(py, v))
         })
         .collect();
 
@@ -326,6 +766,53 @@ fn load_file_instanced(
         main_model_name: scene.main_model_name,
         geometry_world_transforms,
         geometry_cache,
+        textures: pybytes_list(py, scene.textures),
+        removed_faces: removed_faces_map(scene.removed_faces),
+        memory: scene.memory.into(),
+    })
+}
+
+#[pyfunction]
+fn load_files_instanced(
+    py: Python,
+    paths: Vec<&str>,
+    ldraw_path: &str,
+    additional_paths: Vec<&str>,
+    settings: &GeometrySettings,
+) -> PyResult<LDrawBatchInstanced> {
+    let start = std::time::Instant::now();
+    let settings: ldr_tools::GeometrySettings = settings.into();
+    let batch = py.allow_threads(|| {
+        ldr_tools::load_files_instanced(&paths, ldraw_path, &additional_paths, &settings)
+    });
+
+    let geometry_cache = batch
+        .geometry_cache
+        .into_iter()
+        .map(|(k, v)| (k, LDrawGeometry::from_geometry(py, v)))
+        .collect();
+
+    let models = batch
+        .models
+        .into_iter()
+        .map(|model| LDrawModelInstances {
+            main_model_name: model.main_model_name,
+            geometry_world_transforms: model
+                .geometry_world_transforms
+                .into_iter()
+                .map(|(k, v)| (k, pyarray_mat4(py, v)))
+                .collect(),
+        })
+        .collect();
+
+    println!("load_files_instanced: {:?}", start.elapsed());
+
+    Ok(LDrawBatchInstanced {
+        models,
+        geometry_cache,
+        textures: pybytes_list(py, batch.textures),
+        removed_faces: removed_faces_map(batch.removed_faces),
+        memory: batch.memory.into(),
     })
 }
 
@@ -338,12 +825,10 @@ fn load_file_instanced_points(
     settings: &GeometrySettings,
 ) -> PyResult<LDrawSceneInstancedPoints> {
     let start = std::time::Instant::now();
-    let scene = ldr_tools::load_file_instanced_points(
-        path,
-        ldraw_path,
-        &additional_paths,
-        &settings.into(),
-    );
+    let settings: ldr_tools::GeometrySettings = settings.into();
+    let scene = py.allow_threads(|| {
+        ldr_tools::load_file_instanced_points(path, ldraw_path, &additional_paths, &settings)
+    });
 
     let geometry_cache = scene
         .geometry_cache
@@ -363,9 +848,69 @@ fn load_file_instanced_points(
         main_model_name: scene.main_model_name,
         geometry_point_instances,
         geometry_cache,
+        textures: pybytes_list(py, scene.textures),
+        removed_faces: removed_faces_map(scene.removed_faces),
+        memory: scene.memory.into(),
     })
 }
 
+#[pyfunction]
+#[pyo3(signature = (path, ldraw_path, additional_paths, settings, build_bvh = false))]
+fn load_file_instanced_packed(
+    py: Python,
+    path: &str,
+    ldraw_path: &str,
+    additional_paths: Vec<&str>,
+    settings: &GeometrySettings,
+    build_bvh: bool,
+) -> PyResult<LDrawScenePacked> {
+    let start = std::time::Instant::now();
+    let settings: ldr_tools::GeometrySettings = settings.into();
+    let (scene, bvh) = py.allow_threads(|| {
+        let scene =
+            ldr_tools::load_file_instanced_packed(path, ldraw_path, &additional_paths, &settings);
+        let bvh = build_bvh.then(|| ldr_tools::InstanceBvh::new(&scene));
+        (scene, bvh)
+    });
+
+    let mut scene = LDrawScenePacked::from_scene(py, scene);
+    scene.bvh = bvh
+        .map(|bvh| Py::new(py, InstanceBvh { bvh }))
+        .transpose()?;
+
+    println!("load_file_instanced_packed: {:?}", start.elapsed());
+
+    Ok(scene)
+}
+
+#[pyfunction]
+fn scan_file(
+    py: Python,
+    path: &str,
+    ldraw_path: &str,
+    additional_paths: Vec<&str>,
+    settings: &GeometrySettings,
+) -> SceneStats {
+    let settings: ldr_tools::GeometrySettings = settings.into();
+    py.allow_threads(|| ldr_tools::scan_file(path, ldraw_path, &additional_paths, &settings))
+        .into()
+}
+
+#[pyfunction]
+fn bake_stud_logo(py: Python, ldraw_path: &str, resolution: usize) -> Option<PyObject> {
+    let map = py.allow_threads(|| ldr_tools::bake_stud_logo(ldraw_path, resolution))?;
+    Some(
+        map.pixels
+            .into_iter()
+            .flatten()
+            .collect::<Vec<f32>>()
+            .into_pyarray(py)
+            .reshape((map.resolution, map.resolution, 4))
+            .unwrap()
+            .into(),
+    )
+}
+
 #[pyfunction]
 fn load_color_table(ldraw_path: &str) -> PyResult<HashMap<u32, LDrawColor>> {
     Ok(ldr_tools::load_color_table(ldraw_path)
@@ -388,20 +933,85 @@ fn pyarray_vec3(py: Python, values: Vec<ldr_tools::glam::Vec3>) -> PyObject {
         .into()
 }
 
+fn pybytes_list(py: Python, values: Vec<Vec<u8>>) -> Vec<Py<PyBytes>> {
+    values
+        .into_iter()
+        .map(|bytes| PyBytes::new(py, &bytes).into())
+        .collect()
+}
+
+fn vec3s(values: &PyReadonlyArray2<f32>) -> PyResult<Vec<ldr_tools::glam::Vec3>> {
+    let shape = values.shape();
+    if shape[1] != 3 {
+        return Err(PyValueError::new_err(format!(
+            "Expected an array with shape (N, 3) but found {shape:?}"
+        )));
+    }
+
+    Ok(values
+        .as_array()
+        .rows()
+        .into_iter()
+        .map(|r| ldr_tools::glam::vec3(r[0], r[1], r[2]))
+        .collect())
+}
+
+fn pyarray_uvec2(py: Python, values: Vec<[u32; 2]>) -> PyObject {
+    // This flatten will be optimized in Release mode.
+    // This avoids needing unsafe code.
+    let count = values.len();
+    values
+        .into_iter()
+        .flatten()
+        .collect::<Vec<u32>>()
+        .into_pyarray(py)
+        .reshape((count, 2))
+        .unwrap()
+        .into()
+}
+
+fn pyarray_mat4(py: Python, values: Vec<ldr_tools::glam::Mat4>) -> PyObject {
+    // This flatten will be optimized in Release mode.
+    // This avoids needing unsafe code.
+    let count = values.len();
+    values
+        .into_iter()
+        .flat_map(|v| v.to_cols_array())
+        .collect::<Vec<f32>>()
+        .into_pyarray(py)
+        .reshape((count, 4, 4))
+        .unwrap()
+        .into()
+}
+
 #[pymodule]
 fn ldr_tools_py(_py: Python<'_>, m: &PyModule) -> PyResult<()> {
-    m.add_class::<LDrawNode>()?;
+    m.add_class::<LDrawNodeTable>()?;
     m.add_class::<LDrawGeometry>()?;
+    m.add_class::<LDrawScenePacked>()?;
+    m.add_class::<InstanceBvh>()?;
+    m.add_class::<MemoryReport>()?;
+    m.add_class::<Degradation>()?;
+    m.add_class::<DeduplicationReport>()?;
+    m.add_class::<StageMemory>()?;
+    m.add_class::<LoadStage>()?;
+    m.add_class::<RemovedFaces>()?;
     m.add_class::<LDrawColor>()?;
     m.add_class::<GeometrySettings>()?;
     m.add_class::<StudType>()?;
     m.add_class::<PrimitiveResolution>()?;
     m.add_class::<PointInstances>()?;
+    m.add_class::<SceneStats>()?;
+    m.add_class::<GeometryEstimate>()?;
 
     m.add_function(wrap_pyfunction!(load_file, m)?)?;
     m.add_function(wrap_pyfunction!(load_file_instanced, m)?)?;
+    m.add_function(wrap_pyfunction!(load_files_instanced, m)?)?;
     m.add_function(wrap_pyfunction!(load_file_instanced_points, m)?)?;
+    m.add_function(wrap_pyfunction!(load_file_instanced_packed, m)?)?;
+    m.add_function(wrap_pyfunction!(scan_file, m)?)?;
     m.add_function(wrap_pyfunction!(load_color_table, m)?)?;
+    m.add_function(wrap_pyfunction!(bake_stud_logo, m)?)?;
 
     Ok(())
 }
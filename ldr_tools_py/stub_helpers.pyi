@@ -4,13 +4,16 @@ from abc import ABCMeta, ABC
 import numpy as np
 
 Vec2: TypeAlias = tuple[float, float]
+Vec3: TypeAlias = tuple[float, float, float]
 Vec4: TypeAlias = tuple[float, float, float, float]
 Mat4: TypeAlias = tuple[Vec4, Vec4, Vec4, Vec4]
 
 T = TypeVar("T")
 Array1: TypeAlias = np.ndarray[tuple[int], np.dtype[T]]
+BoolArray: TypeAlias = Array1[np.bool_]
 UByteArray: TypeAlias = Array1[np.uint8]
 UIntArray: TypeAlias = Array1[np.uint32]
+IntArray: TypeAlias = Array1[np.int32]
 FloatArray: TypeAlias = Array1[np.float32]
 UVec2Array: TypeAlias = np.ndarray[tuple[int, Literal[2]], np.dtype[np.uint32]]
 Vec2Array: TypeAlias = np.ndarray[tuple[int, Literal[2]], np.dtype[np.float32]]